@@ -16,8 +16,11 @@ class ExternalFileClient:
         self.shared_folder_name = shared_folder_name
         self.conn = SMBConnection(username, password, client_name, server_name, use_ntlm_v2=True)
         self.find_folder = serial_no
+        self.server_ip = None
 
     def connect(self, server_ip):
+        self.server_ip = server_ip
+        connected = False
         try:
             connected = self.conn.connect(server_ip, 139)
             if connected:
@@ -0,0 +1,303 @@
+import hashlib
+import io
+import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from smb.SMBConnection import SMBConnection
+
+from config.logging_config import logger
+
+MANIFEST_NAME = "smb_upload_manifest.json"
+
+
+def _remote_path(remote_directory, remote_file_name) -> str:
+    # Kaip ExternalFileClient.upload_file: SMB keliai tik su "/"
+    remote_dir_normalized = str(remote_directory).replace("\\", "/").strip("/")
+    remote_file_normalized = str(remote_file_name).replace("\\", "/").strip("/")
+    return f"/{remote_dir_normalized}/{remote_file_normalized}" if remote_dir_normalized else f"/{remote_file_normalized}"
+
+
+class _BufferReader(io.RawIOBase):
+    """Read-only failo objektas virš memoryview (numpy kadras / memmap) - be laikino failo."""
+
+    def __init__(self, buf):
+        self._mv = memoryview(buf).cast("B")
+        self._pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        n = min(len(b), len(self._mv) - self._pos)
+        b[:n] = self._mv[self._pos:self._pos + n]
+        self._pos += n
+        return n
+
+
+@dataclass
+class UploadJob:
+    """source: lokalaus failo kelias arba bytes / numpy masyvas (siunčiamas iš atminties)."""
+    remote_dir: str
+    remote_name: str
+    source: Any
+    label: str = ""
+    _fingerprint: Optional[str] = field(default=None, init=False, repr=False, compare=False)
+
+    @property
+    def remote_path(self) -> str:
+        return _remote_path(self.remote_dir, self.remote_name)
+
+    def size(self) -> int:
+        if isinstance(self.source, (str, os.PathLike)):
+            return int(os.path.getsize(self.source))
+        if isinstance(self.source, np.ndarray):
+            return int(self.source.nbytes)
+        return len(memoryview(self.source).cast("B"))
+
+    def mtime(self) -> Optional[float]:
+        if isinstance(self.source, (str, os.PathLike)):
+            return float(os.path.getmtime(self.source))
+        return None
+
+    def fingerprint(self) -> str:
+        """
+        Failui - mtime; kadrui iš atminties - turinio hash (vardai ir dydžiai kartojasi kiekviename
+        matavime, todėl vien jų neužtenka atskirti naujo kadro nuo jau įkelto).
+        """
+        if self._fingerprint is None:
+            mtime = self.mtime()
+            if mtime is not None:
+                self._fingerprint = f"mtime:{mtime}"
+            else:
+                src = np.ascontiguousarray(self.source) if isinstance(self.source, np.ndarray) else self.source
+                digest = hashlib.blake2b(memoryview(src).cast("B"), digest_size=16).hexdigest()
+                self._fingerprint = f"blake2b:{digest}"
+        return self._fingerprint
+
+    def open(self):
+        if isinstance(self.source, (str, os.PathLike)):
+            return open(self.source, "rb")
+        src = np.ascontiguousarray(self.source) if isinstance(self.source, np.ndarray) else self.source
+        return io.BufferedReader(_BufferReader(src), buffer_size=1 << 20)
+
+
+class UploadManifest:
+    """
+    Resume manifestas (JSON): kurie remote failai jau pilnai įkelti (dydis + fingerprint:
+    failo mtime arba kadro turinio hash).
+    Įrašomas po kiekvieno sėkmingo failo (tmp + os.replace), todėl nutrūkus įkėlimui
+    kitas bandymas praleidžia jau įkeltus failus. Kitas remote_root -> manifestas iš naujo.
+    """
+
+    def __init__(self, path: str, remote_root: str = ""):
+        self.path = path
+        self.remote_root = str(remote_root)
+        self._lock = threading.Lock()
+        self._done: Dict[str, Dict[str, Any]] = {}
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("remote_root") == self.remote_root:
+                self._done = dict(data.get("done", {}))
+        except (OSError, ValueError):
+            pass
+
+    def is_done(self, job: UploadJob) -> bool:
+        with self._lock:
+            rec = self._done.get(job.remote_path)
+        return rec is not None and rec.get("size") == job.size() and rec.get("fingerprint") == job.fingerprint()
+
+    def mark_done(self, job: UploadJob) -> None:
+        with self._lock:
+            self._done[job.remote_path] = {"size": job.size(), "fingerprint": job.fingerprint(), "t": time.time()}
+            self._save()
+
+    def _save(self) -> None:
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"remote_root": self.remote_root, "done": self._done}, f)
+        os.replace(tmp, self.path)
+
+    def __len__(self) -> int:
+        return len(self._done)
+
+
+@dataclass
+class UploadReport:
+    uploaded: List[str] = field(default_factory=list)
+    skipped: List[str] = field(default_factory=list)
+    failed: Dict[str, str] = field(default_factory=dict)
+    bytes: int = 0
+    seconds: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return not self.failed
+
+
+class SMBUploadPool:
+    """
+    Nedidelis SMBConnection pool'as lygiagretiems storeFile.
+    Viena jungtis naudojama tik vieno thread'o vienu metu (pysmb jungtis nėra thread-safe),
+    jungtys kuriamos tingiai (ne daugiau workers). Nutrūkusi jungtis pakeičiama nauja ir
+    failas bandomas dar kartą (retries).
+    """
+
+    def __init__(self, username, password, shared_folder_name, server_ip, *, port: int = 139,
+                 workers: int = 3, retries: int = 1, client_name="client", server_name="server"):
+        self.username = username
+        self.password = password
+        self.shared_folder_name = shared_folder_name
+        self.server_ip = server_ip
+        self.port = int(port)
+        self.workers = max(int(workers), 1)
+        self.retries = max(int(retries), 0)
+        self.client_name = client_name
+        self.server_name = server_name
+        self._idle: "queue.Queue" = queue.Queue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._all: List[SMBConnection] = []
+
+    @classmethod
+    def from_client(cls, client, server_ip: Optional[str] = None, **kw) -> "SMBUploadPool":
+        """Tie patys prisijungimo duomenys kaip esamo ExternalFileClient."""
+        return cls(
+            client.username, client.password, client.shared_folder_name,
+            server_ip or getattr(client, "server_ip", None) or "ioproduction", **kw
+        )
+
+    def _new_conn(self) -> SMBConnection:
+        conn = SMBConnection(self.username, self.password, self.client_name, self.server_name, use_ntlm_v2=True)
+        if not conn.connect(self.server_ip, self.port):
+            raise ConnectionError(f"Could not connect to SMB server: {self.server_ip}")
+        with self._lock:
+            self._all.append(conn)
+        return conn
+
+    def _acquire(self) -> SMBConnection:
+        while True:
+            try:
+                return self._idle.get_nowait()
+            except queue.Empty:
+                pass
+            with self._lock:
+                can_create = self._created < self.workers
+                if can_create:
+                    self._created += 1
+            if can_create:
+                try:
+                    return self._new_conn()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            # Visos jungtys užimtos; periodiškai tikrinam, ar kuri nebuvo uždaryta kaip sugedusi.
+            try:
+                return self._idle.get(timeout=0.5)
+            except queue.Empty:
+                continue
+
+    def _release(self, conn: SMBConnection, broken: bool = False) -> None:
+        if not broken:
+            self._idle.put(conn)
+            return
+        with self._lock:
+            self._created -= 1
+            if conn in self._all:
+                self._all.remove(conn)
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def store(self, job: UploadJob) -> int:
+        last_err = None
+        for _attempt in range(self.retries + 1):
+            conn = self._acquire()
+            try:
+                with job.open() as f:
+                    n = conn.storeFile(self.shared_folder_name, job.remote_path, f)
+                self._release(conn)
+                return int(n)
+            except Exception as e:
+                last_err = e
+                self._release(conn, broken=True)
+                logger.warning(f"SMB upload of '{job.remote_path}' failed (attempt {_attempt + 1}): {e}")
+        raise last_err
+
+    def upload(self, jobs: List[UploadJob], manifest: Optional[UploadManifest] = None,
+               on_progress=None) -> UploadReport:
+        """Įkelia jobs lygiagrečiai; jau manifeste esantys praleidžiami. on_progress(done, total)."""
+        report = UploadReport()
+        t0 = time.perf_counter()
+        todo = []
+        for job in jobs:
+            try:
+                if manifest is not None and manifest.is_done(job):
+                    report.skipped.append(job.remote_path)
+                    continue
+            except OSError as e:
+                report.failed[job.remote_path] = str(e)
+                continue
+            todo.append(job)
+
+        total = len(todo)
+        lock = threading.Lock()
+
+        def one(job: UploadJob):
+            try:
+                n = self.store(job)
+                if manifest is not None:
+                    manifest.mark_done(job)
+                with lock:
+                    report.uploaded.append(job.remote_path)
+                    report.bytes += n
+                logger.info(f"File '{job.label or job.remote_name}' uploaded to '{job.remote_path}'.")
+            except Exception as e:
+                with lock:
+                    report.failed[job.remote_path] = str(e)
+                logger.error(f"Error uploading file '{job.remote_path}': {e}")
+            if on_progress is not None:
+                with lock:
+                    done = len(report.uploaded) + len(report.failed)
+                on_progress(done, total)
+
+        with ThreadPoolExecutor(max_workers=self.workers) as ex:
+            list(ex.map(one, todo))
+
+        report.seconds = time.perf_counter() - t0
+        logger.info(
+            f"SMB upload: {len(report.uploaded)} uploaded, {len(report.skipped)} skipped, "
+            f"{len(report.failed)} failed, {report.bytes / 2 ** 20:.1f} MiB in {report.seconds:.1f} s"
+        )
+        return report
+
+    def close(self) -> None:
+        with self._lock:
+            conns, self._all = self._all, []
+            self._created = 0
+        while not self._idle.empty():
+            try:
+                self._idle.get_nowait()
+            except queue.Empty:
+                break
+        for conn in conns:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
@@ -0,0 +1,286 @@
+import re
+import socket
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional
+
+from config.logging_config import logger
+
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000)
+
+
+def command_key(message: str) -> str:
+    """'P0?' -> 'P#?', 'P012345' -> 'P#': histogramos pagal komandą, ne pagal argumentus."""
+    return re.sub(r"\d+", "#", message.strip())
+
+
+class LatencyHistogram:
+    """Komandos round-trip laikai: logaritminiai intervalai + paskutinių reikšmių p50/p95."""
+
+    def __init__(self, recent: int = 256):
+        self.counts = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.count = 0
+        self.timeouts = 0
+        self.total_s = 0.0
+        self.max_s = 0.0
+        self._recent: Deque[float] = deque(maxlen=int(recent))
+
+    def add(self, seconds: float) -> None:
+        ms = seconds * 1000.0
+        i = 0
+        while i < len(LATENCY_BUCKETS_MS) and ms > LATENCY_BUCKETS_MS[i]:
+            i += 1
+        self.counts[i] += 1
+        self.count += 1
+        self.total_s += seconds
+        self.max_s = max(self.max_s, seconds)
+        self._recent.append(seconds)
+
+    def _percentile(self, q: float) -> Optional[float]:
+        if not self._recent:
+            return None
+        values = sorted(self._recent)
+        return values[min(int(q * len(values)), len(values) - 1)]
+
+    def as_dict(self) -> Dict[str, object]:
+        labels = [f"<={b}ms" for b in LATENCY_BUCKETS_MS] + [f">{LATENCY_BUCKETS_MS[-1]}ms"]
+        p50, p95 = self._percentile(0.5), self._percentile(0.95)
+        return {
+            "count": self.count,
+            "timeouts": self.timeouts,
+            "mean_ms": 1000.0 * self.total_s / self.count if self.count else None,
+            "p50_ms": 1000.0 * p50 if p50 is not None else None,
+            "p95_ms": 1000.0 * p95 if p95 is not None else None,
+            "max_ms": 1000.0 * self.max_s,
+            "buckets": dict(zip(labels, self.counts)),
+        }
+
+
+class PendingReply:
+    """Vienos užklausos atsakymo laukimas (LineProtocol.submit -> LineProtocol.wait)."""
+
+    __slots__ = ("key", "expected", "lines", "t_sent", "t_last", "done", "abandoned")
+
+    def __init__(self, key: str, expected: int, t_sent: float):
+        self.key = key
+        self.expected = expected
+        self.lines: List[str] = []
+        self.t_sent = t_sent
+        self.t_last = t_sent
+        self.done = False
+        self.abandoned = False
+
+
+class LineProtocol:
+    """
+    Eilutėmis (\\n) grindžiamas protokolas vienam TCP ryšiui.
+
+    Skaitymo thread'as laiko nuolatinį buferį ir kiekvieną pilną eilutę atiduoda seniausiai
+    laukiančiai užklausai (kontroleris atsako ta pačia tvarka, kuria gavo komandas). Užklausa
+    baigta, kai gauta expected_lines eilučių arba, jei jau yra bent viena, idle_s nebeateina
+    naujų. Eilutės be laukiančios užklausos (pvz. po send() be atsakymo) išmetamos.
+
+    Jei užklausa negauna nė vienos eilutės iki deadline, eilė nebėra patikima (atsakymas
+    dingo arba vėluoja): visos laukiančios užklausos nutraukiamos (None), o prieš kitą
+    siuntimą laukiama, kol ryšys nutils idle_s, ir buferis išvalomas (kaip senas clean_input).
+    Fiksuotų pauzių nėra - laukiama tik iki deadline. Kadangi atsakymai skirstomi pagal eilę,
+    kelios užklausos gali būti išsiųstos iš karto (submit_many / request_many).
+    """
+
+    def __init__(self, sock: socket.socket, *, idle_s: float = 0.2, resync_max_s: float = 2.0):
+        self.sock = sock
+        self.idle_s = float(idle_s)
+        self.resync_max_s = float(resync_max_s)
+
+        self._cond = threading.Condition()
+        self._send_lock = threading.Lock()
+        self._rx = bytearray()
+        self._pending: Deque[PendingReply] = deque()
+        self._closed = False
+        self._histograms: Dict[str, LatencyHistogram] = {}
+        self._stats = {"unsolicited": 0, "dropped": 0, "resyncs": 0}
+        self._resync_from: Optional[float] = None
+        self._rx_mono = 0.0
+        self.last_rx_time: Optional[float] = None
+
+        self._thread = threading.Thread(target=self._reader, daemon=True)
+        self._thread.start()
+
+    @property
+    def alive(self) -> bool:
+        return not self._closed
+
+    # --------------------- skaitymas ---------------------
+    def _reader(self) -> None:
+        while not self._closed:
+            try:
+                chunk = self.sock.recv(4096)
+            except socket.timeout:
+                continue
+            except OSError as e:
+                if not self._closed:
+                    logger.error(f"Error receiving message: {e}")
+                break
+            if not chunk:
+                break
+            self._feed(chunk)
+        self._fail_all()
+
+    def _feed(self, chunk: bytes) -> None:
+        now = time.monotonic()
+        with self._cond:
+            self.last_rx_time = time.time()
+            self._rx_mono = now
+            self._rx += chunk.replace(b"\xff", b"")
+            while True:
+                i = self._rx.find(b"\n")
+                if i < 0:
+                    break
+                line = bytes(self._rx[:i]).decode(errors="replace").strip()
+                del self._rx[:i + 1]
+                self._dispatch(line, now)
+            self._cond.notify_all()
+
+    def _dispatch(self, line: str, now: float) -> None:
+        if not self._pending:
+            self._stats["unsolicited"] += 1
+            return
+        reply = self._pending[0]
+        reply.lines.append(line)
+        reply.t_last = now
+        if len(reply.lines) >= reply.expected:
+            self._complete(reply, now)
+
+    def _abandon_all(self, now: float) -> None:
+        # Kviečiama su _cond: po dingusio atsakymo visos eilės vietos gali būti pasislinkusios.
+        while self._pending:
+            reply = self._pending.popleft()
+            reply.abandoned = True
+            reply.done = True
+            self._stats["dropped"] += 1
+        self._rx.clear()
+        self._resync_from = now
+        self._stats["resyncs"] += 1
+        self._cond.notify_all()
+
+    def _wait_quiet(self) -> None:
+        # Kviečiama su _cond ir _send_lock: pavėlavę atsakymai išmetami, kol ryšys nutyla.
+        t_start = time.monotonic()
+        while True:
+            now = time.monotonic()
+            quiet = now - max(self._rx_mono, self._resync_from)
+            if quiet >= self.idle_s or now - t_start >= self.resync_max_s or self._closed:
+                break
+            self._cond.wait(self.idle_s - quiet)
+        self._rx.clear()
+        self._resync_from = None
+
+    def _complete(self, reply: PendingReply, now: float) -> None:
+        reply.done = True
+        if self._pending and self._pending[0] is reply:
+            self._pending.popleft()
+        elif reply in self._pending:
+            self._pending.remove(reply)
+        self._histogram(reply.key).add(now - reply.t_sent)
+
+    def _fail_all(self) -> None:
+        with self._cond:
+            self._closed = True
+            while self._pending:
+                self._pending.popleft().done = True
+            self._cond.notify_all()
+
+    def _histogram(self, key: str) -> LatencyHistogram:
+        hist = self._histograms.get(key)
+        if hist is None:
+            hist = self._histograms[key] = LatencyHistogram()
+        return hist
+
+    # --------------------- siuntimas ---------------------
+    def send(self, message: str) -> bool:
+        """Komanda be atsakymo laukimo (atsakymas, jei bus, išmetamas)."""
+        with self._send_lock:
+            if self._closed:
+                return False
+            self.sock.sendall(message.encode())
+        return True
+
+    def submit(self, message: str, expected_lines: int = 1) -> Optional[PendingReply]:
+        replies = self.submit_many([message], [expected_lines])
+        return replies[0] if replies else None
+
+    def submit_many(self, messages: List[str], expected_lines: List[int]) -> Optional[List[PendingReply]]:
+        """Kelios komandos vienu sendall; atsakymai priskiriami ta pačia tvarka."""
+        with self._send_lock:
+            with self._cond:
+                if self._closed:
+                    return None
+                if self._resync_from is not None:
+                    self._wait_quiet()
+                t_sent = time.monotonic()
+                replies = [PendingReply(command_key(m), max(int(n), 1), t_sent)
+                           for m, n in zip(messages, expected_lines)]
+                if not self._pending:
+                    # Nebaigta eilutė be laukiančios užklausos - senas atsakymas (kaip clean_input).
+                    self._rx.clear()
+                self._pending.extend(replies)
+            try:
+                self.sock.sendall("".join(messages).encode())
+            except Exception:
+                with self._cond:
+                    for reply in replies:
+                        if reply in self._pending:
+                            self._pending.remove(reply)
+                raise
+        return replies
+
+    def wait(self, reply: PendingReply, timeout_s: float = 1.0) -> Optional[List[str]]:
+        deadline = reply.t_sent + float(timeout_s)
+        with self._cond:
+            while not reply.done:
+                now = time.monotonic()
+                if reply.lines and now - reply.t_last >= self.idle_s:
+                    self._complete(reply, now)
+                    break
+                if now >= deadline:
+                    self._histogram(reply.key).timeouts += 1
+                    self._abandon_all(now)
+                    return None
+                wake = min(deadline, reply.t_last + self.idle_s) if reply.lines else deadline
+                self._cond.wait(wake - now)
+        return reply.lines if reply.lines and not reply.abandoned else None
+
+    def request_many(self, messages: List[str], expected_lines: List[int],
+                     timeout_s: float = 1.0) -> List[Optional[List[str]]]:
+        replies = self.submit_many(messages, expected_lines)
+        if replies is None:
+            return [None] * len(messages)
+        return [self.wait(reply, timeout_s) for reply in replies]
+
+    def request(self, message: str, expected_lines: int = 1, timeout_s: float = 1.0) -> Optional[List[str]]:
+        reply = self.submit(message, expected_lines)
+        if reply is None:
+            return None
+        return self.wait(reply, timeout_s)
+
+    def discard_input(self) -> None:
+        with self._cond:
+            self._rx.clear()
+
+    def latency_histograms(self) -> Dict[str, Dict[str, object]]:
+        with self._cond:
+            return {key: hist.as_dict() for key, hist in self._histograms.items()}
+
+    def stats(self) -> Dict[str, int]:
+        with self._cond:
+            return dict(self._stats, pending=len(self._pending))
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._fail_all()
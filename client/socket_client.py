@@ -2,6 +2,7 @@ import socket
 import threading
 import time
 from time import sleep
+from client.line_protocol import LineProtocol
 from config.logging_config import logger
 
 class SocketClient:
@@ -9,6 +10,7 @@ class SocketClient:
         self.ip = ip
         self.port = port
         self.socket = None
+        self.protocol: LineProtocol | None = None
         self.connected = False
         self.TIME_DELAY = 0.3
         self.RESPONSE_TIMEOUT = 1
@@ -16,8 +18,11 @@ class SocketClient:
         self.connect()
         self.last_response_time = None
         self.last_ping_time = None
-        self.lock = threading.Lock()
-        self.freeze_ping = False
+        # Vienu metu - viena užklausa ar vienas query_many paketas (ping, koleris, lazeris, ašis):
+        # atsakymo eilučių skaičius ne visada žinomas, todėl skirtingų kvietėjų neinterleave'inam.
+        self.lock = threading.RLock()
+        self._flight_lock = threading.Lock()
+        self._in_flight = 0
 
     def connect(self):
         if self.socket is not None:
@@ -28,16 +33,23 @@ class SocketClient:
             self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             self.socket.settimeout(self.CONNECTION_TIMEOUT)
             self.socket.connect((self.ip, self.port))
-            self.connected = True
+            self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
             self.socket.settimeout(self.RESPONSE_TIMEOUT)
+            # Atsakymus skaito LineProtocol thread'as (eilutės, užklausų eilė, latency histogramos)
+            self.protocol = LineProtocol(self.socket)
+            self.connected = True
             logger.info(f"Connected to server: {self.ip}:{self.port}")
             sleep(2)
         except Exception as e:
             self.socket = None
+            self.protocol = None
             self.connected = False
             logger.error(f"Connection error: {e}")
 
     def disconnect(self):
+        if self.protocol:
+            self.protocol.close()
+            self.protocol = None
         if self.socket:
             self.socket.close()
             self.socket = None
@@ -45,7 +57,7 @@ class SocketClient:
             logger.info("Disconnected from socket server.")
 
     def is_connected(self):
-        if not self.socket:
+        if not self.socket or not self.protocol or not self.protocol.alive:
             return False
         try:
             self.socket.getpeername()
@@ -54,94 +66,112 @@ class SocketClient:
             return False
 
     def send_message(self, message, new_line=False):
+        # Be atsakymo laukimo; atsakymas, jei bus, išmetamas (nėra laukiančios užklausos).
         try:
-            sleep(0.1)
-            if not self.socket or not self.is_connected():
+            if not self.is_connected():
                 return False
-            self.clean_input()
             logger.info(f"Sending message: {message}")
             if new_line:
                 message += "\n"
-            self.socket.sendall(message.encode())
+            return self.protocol.send(message)
+        except Exception as e:
+            logger.error("Connection lost. Unable to send the message.")
+            self.disconnect()
+            return False
+
+    @property
+    def freeze_ping(self):
+        # Ping'as nesiunčiamas, kol laukiama kito atsakymo.
+        return self._in_flight > 0
+
+    def _track_flight(self, delta):
+        with self._flight_lock:
+            self._in_flight += delta
+
+    def _request_many(self, messages, new_line, expected_lines, timeout_s):
+        if not self.is_connected():
+            return [None] * len(messages)
+        if new_line:
+            messages = [m + "\n" for m in messages]
+        self._track_flight(1)
+        try:
+            with self.lock:
+                replies = self.protocol.request_many(messages, expected_lines, timeout_s)
         except Exception as e:
             logger.error("Connection lost. Unable to send the message.")
             self.disconnect()
+            return [None] * len(messages)
+        finally:
+            self._track_flight(-1)
+
+        responses = []
+        for lines in replies:
+            response = "\n".join(lines).strip() if lines is not None else ""
+            if lines is not None and len(response) == 0:
+                logger.warn("Empty response received.")
+            responses.append(response or None)
+        if any(r is not None for r in responses):
+            self.last_response_time = time.time()
+        return responses
+
+    def _request(self, message, new_line, expected_lines, timeout_s):
+        return self._request_many([message], new_line, [expected_lines], timeout_s)[0]
 
     def send_query(self, message, new_line=False, expected_response_lines=1, retries=3):
-        with self.lock:
-            for attempt in range(retries):
-                self.freeze_ping = True
-                self.send_message(message, new_line)
-                response = self._get_message(expected_response_lines)
-                if response is not None:
-                    self.freeze_ping = False
-                    return response
-            logger.error(f"Failed to receive query response after {retries} attempts.")
-            self.freeze_ping = False
-            return None
+        # Kvietėjai serializuojami self.lock (_request_many); be fiksuotų pauzių (LineProtocol).
+        for attempt in range(retries):
+            logger.info(f"Sending message: {message}")
+            response = self._request(message, new_line, expected_response_lines, self.RESPONSE_TIMEOUT)
+            if response is not None:
+                logger.info(f"Received response: {response}")
+                return response
+        logger.error(f"Failed to receive query response after {retries} attempts.")
+        return None
+
+    def send_query_fast(self, message, new_line=True, timeout_s=0.3):
+        """Trumpa užklausa be log'ų ir pakartojimų (pvz. pozicijos tikrinimas laukiant judesio)."""
+        return self._request(message, new_line, 1, timeout_s)
+
+    def query_many(self, messages, new_line=True, expected_lines=1, timeout_s=None):
+        """
+        Kelios komandos vienu siuntimu, atsakymai ta pačia tvarka (None - neatėjo) - vienas
+        tinklo round trip vietoj len(messages). Be pakartojimų (judesio komandos nekartojamos).
+        Kintamo eilučių skaičiaus atsakymų (pvz. klaida vietoj 5 eilučių) į paketą nedėti.
+        Kiti kvietėjai laukia, kol paketas baigsis (self.lock) - konvejeris tik paketo viduje.
+        """
+        messages = list(messages)
+        if not messages:
+            return []
+        if isinstance(expected_lines, int):
+            expected_lines = [expected_lines] * len(messages)
+        logger.info(f"Sending messages: {messages}")
+        responses = self._request_many(
+            messages, new_line, list(expected_lines),
+            self.RESPONSE_TIMEOUT if timeout_s is None else timeout_s,
+        )
+        logger.info(f"Received responses: {responses}")
+        return responses
 
     def send_ping(self, ping_message, new_line, ping_response_message, retries=3):
         with self.lock:
             for attempt in range(retries):
                 if self.freeze_ping:
                     return
-                self.send_message(ping_message, new_line)
-                response = self._get_message(1)
+                response = self._request(ping_message, new_line, 1, self.RESPONSE_TIMEOUT)
                 if response == ping_response_message:
                     self.last_ping_time = time.time()
                     return
             logger.error(f"Failed to receive ping response after {retries} attempts.")
 
-    def _get_message(self, expected_lines=1, delimiter="\n", retries=3):
-            sleep(0.1)
-            idle_timeout = 0.2
-            if not self.is_connected():
-                return
-            try:
-                self.socket.settimeout(self.RESPONSE_TIMEOUT)
-                response_buffer = b""
-                last_receive_time = time.time()
-                line_count = 0
-                while True:
-                    chunk = self.socket.recv(1024)
-                    if chunk:
-                        response_buffer += chunk
-                        last_receive_time = time.time()
-                        line_count = response_buffer.decode(errors="ignore").count(delimiter)
-                    if time.time() - last_receive_time > idle_timeout:
-                        break
-                    if expected_lines is not None and line_count >= expected_lines:
-                        break
-                response_buffer = response_buffer.replace(b'\xff', b'')
-                response = response_buffer.decode(errors="replace").strip()
-                logger.info(f"Received response: {response}")
-                if len(response) == 0:
-                        logger.warn("Empty response received.")
-                        return None
-                self.last_response_time = time.time()
-                return response
-            except socket.timeout:
-                    return None
-            except Exception as e:
-                logger.error(f"Error receiving message: {e}")
-                return None
-
     def clean_input(self):
-        if not self.socket or not self.is_connected():
-            return
-        try:
-            self.socket.settimeout(0.2)
-            while True:
-                try:
-                    chunk = self.socket.recv(1024)
-                    if not chunk:
-                        break
-                except socket.timeout:
-                    break
-        except Exception as e:
-            logger.error(f"Error during clean_input: {e}")
-        finally:
-            self.socket.settimeout(self.RESPONSE_TIMEOUT)
+        if self.protocol is not None:
+            self.protocol.discard_input()
+
+    def latency_histograms(self):
+        """Komandų round-trip histogramos (raktas - komanda be skaičių, pvz. 'P#?')."""
+        if self.protocol is None:
+            return {}
+        return self.protocol.latency_histograms()
 
     def __del__(self):
         self.disconnect()
@@ -4,6 +4,7 @@ import threading
 import time
 from time import sleep
 
+import numpy as np
 from PIL import Image
 
 from client.socket_client import SocketClient
@@ -11,6 +12,7 @@ from config.environment_config import EnvironmentConfig
 from config.logging_config import logger
 from devices.axis.axis_commands import AxisControllerCommands
 from devices.axis.axis_controller_parrser import AxisControllerParser
+from devices.axis.motion_wait import MotionWaiter
 from devices.interface.device_interface import DeviceInterface
 
 
@@ -44,10 +46,10 @@ class AxisService:
         except Exception:
             pass
 
-    def go_to(self, axis_no: int, pos: int, wait: bool = False):
+    def go_to(self, axis_no: int, pos: int, wait: bool = False, queries=None):
         if self.controller is None:
             raise RuntimeError("Axis controller not connected")
-        self.controller.go_to_position(axis_no, pos, need_wait_for_axis_in_position=wait)
+        return self.controller.go_to_position(axis_no, pos, need_wait_for_axis_in_position=wait, queries=queries)
 
     def home(self, axis_no: int):
         if self.controller is None:
@@ -87,6 +89,9 @@ class AxisController(DeviceInterface):
         self.saturation_min = 200
         self.saturation_max = 220
         self.best_focus = None
+        self.last_move_timing = None
+        self._motion_waiters = {}
+        self._initialized_axes = set()
 
         self.connect()
 
@@ -135,12 +140,15 @@ class AxisController(DeviceInterface):
     # Low-level comms
     # -------------------------
     def send_message(self, message: str):
-        sleep(0.1)
         self.client.send_message(message, True)
 
     def send_query(self, message: str, expected_lines: int):
         return self.client.send_query(message, True, expected_lines)
 
+    def query_many(self, messages, expected_lines=1):
+        """Komandos vienu paketu, atsakymai ta pačia tvarka (žr. SocketClient.query_many)."""
+        return self.client.query_many(messages, True, expected_lines)
+
     def get_identification(self):
         response = self.send_query(AxisControllerCommands.get_identification(), 1)
         error_message = AxisControllerParser.parse_error_message(response)
@@ -239,54 +247,90 @@ class AxisController(DeviceInterface):
 
             raise Exception(f"Failed to parse position from response: {resp!r}")
 
+    def _position_or_none(self, axis_no: int):
+        try:
+            return self.get_position(axis_no, timeout_s=5.0)
+        except Exception as e:
+            print(f"Error checking axis position: {e}")
+            return None
+
     def need_initialize_axis(self, axis_no: int) -> bool:
         """
         Kai kurie kontroleriai grąžina -1, jei ašis neinicializuota.
         Jei get_position meta klaidą – laikom, kad reikia inicializuoti.
         """
-        try:
-            axis_position = self.get_position(axis_no, timeout_s=5.0)
-            return axis_position == -1
-        except Exception as e:
-            print(f"Error checking axis position: {e}")
-            return True
-
-    def go_to_position(self, axis_no: int, position: int, need_wait_for_axis_in_position: bool = False):
-        time.sleep(0.1)
+        axis_position = self._position_or_none(axis_no)
+        return axis_position is None or axis_position == -1
 
-        if self.need_initialize_axis(axis_no):
+    def _query_position_fast(self, axis_no: int):
+        # Be send_query pauzių; BUSY ar neatsakymas -> None (MotionWaiter bandys vėl).
+        response = self.client.send_query_fast(AxisControllerCommands.get_position(axis_no))
+        if response is None:
+            return None
+        m = re.search(r"-?\d+", response)
+        return int(m.group(0)) if m else None
+
+    def motion_waiter(self, axis_no: int) -> MotionWaiter:
+        waiter = self._motion_waiters.get(axis_no)
+        if waiter is None:
+            waiter = MotionWaiter(lambda: self._query_position_fast(axis_no))
+            self._motion_waiters[axis_no] = waiter
+        return waiter
+
+    def _send_move(self, axis_no: int, position: int, queries=None):
+        # Patikra -> home (jei reikia) -> judesys, kiekvienas atskiru round trip'u.
+        start_position = self._position_or_none(axis_no)
+        if start_position is None or start_position == -1:
             self._go_home(axis_no)
             time.sleep(0.5)
             current_position = self.get_position(axis_no, timeout_s=5.0)
             if current_position != 0:
                 raise Exception("Failed to go home")
+            start_position = current_position
 
         response = self.send_query(AxisControllerCommands.go_to_position(axis_no, position), 1)
+        replies = self.query_many(queries) if queries else []
+        return start_position, response, replies
+
+    def go_to_position(self, axis_no: int, position: int, need_wait_for_axis_in_position: bool = False,
+                       queries=None):
+        """
+        queries - papildomos tik skaitymo komandos (pvz. TCr r), išsiunčiamos kartu su judesiu;
+        grąžinami jų atsakymai. Judesys siunčiamas tik po P{n}? patikros: jau inicializuotai ašiai
+        patikra - viena greita užklausa, o judesys ir queries - vienu paketu.
+        """
+        t0 = time.monotonic()
+        start_position = self._query_position_fast(axis_no) if axis_no in self._initialized_axes else None
+        if start_position is not None and start_position != -1:
+            commands = [AxisControllerCommands.go_to_position(axis_no, position)] + list(queries or [])
+            replies = self.query_many(commands)
+            response, replies = replies[0], replies[1:]
+        else:
+            # Neinicializuota, prarasta inicializacija ar BUSY - nuoseklus kelias (su home).
+            self._initialized_axes.discard(axis_no)
+            start_position, response, replies = self._send_move(axis_no, position, queries)
+
         AxisControllerParser.parse_error_message(response)
 
         first_line = str(response).splitlines()[0].strip() if response is not None else ""
         AxisControllerParser.parse_response_successful(first_line)
+        self._initialized_axes.add(axis_no)
+        t_command = time.monotonic()
+        # Paskutinio judesio laikai (s): komanda ir laukimas, kol ašis vietoje.
+        self.last_move_timing = {"command_s": t_command - t0, "in_position_s": 0.0}
 
         if not need_wait_for_axis_in_position:
-            return
-
-        last_position = None
-        same_count = 0
-
-        while True:
-            current_position = self.get_position(axis_no, timeout_s=5.0, poll_s=0.1)
-
-            if current_position == position:
-                break
-
-            if last_position is not None and current_position == last_position:
-                same_count += 1
-                if same_count >= 20:
-                    raise Exception("Failed to go to position (position not changing)")
-            else:
-                same_count = 0
-
-            last_position = current_position
+            return replies if queries else None
+
+        # Pozicija tikrinama tik arti prognozuoto atvykimo (žr. MotionWaiter).
+        result = self.motion_waiter(axis_no).wait(position, start=start_position, t_command=t_command)
+        self.last_move_timing.update(
+            in_position_s=time.monotonic() - t_command,
+            predicted_s=result["predicted_s"],
+            detect_s=result["latency_s"],
+            polls=result["polls"],
+        )
+        return replies if queries else None
 
     # -------------------------
     # Saturation
@@ -300,15 +344,18 @@ class AxisController(DeviceInterface):
             return True, 190
 
         try:
-            if len(image_array.shape) == 2:
-                pil_image = Image.fromarray(image_array)
+            if len(image_array.shape) == 2 and image_array.dtype == np.uint8:
+                # Mono8 - tiesiai numpy masyvas, be PIL konversijų
+                source = image_array
+            elif len(image_array.shape) == 2:
+                source = Image.fromarray(image_array)
             elif len(image_array.shape) == 3 and image_array.shape[2] == 3:
-                pil_image = Image.fromarray(image_array)
+                source = Image.fromarray(image_array)
             else:
                 print(f"Nežinomas vaizdo formatas: {image_array.shape}")
                 return False, 0
 
-            saturation, background, _ = self.saturation_processor.process_image(pil_image)
+            saturation, background, _ = self.saturation_processor.process_image(source, return_image=False)
             print(f"axis control: {saturation}")
 
             is_good = self.saturation_min <= saturation <= self.saturation_max
@@ -0,0 +1,124 @@
+import time
+from collections import deque
+from typing import Callable, Dict, Optional
+
+import numpy as np
+
+
+class MotionWaiter:
+    """
+    Laukimas, kol ašis pasieks tikslą, be nuolatinio P{n}? apklausimo.
+
+    Atvykimo laikas prognozuojamas kaip overhead + |atstumas| / greitis; abu dydžiai
+    įvertinami mažiausiais kvadratais iš paskutinių judesių (kol jų mažai - numatytieji).
+    Iki prognozės (minus lead_s) miegama, tada pozicija tikrinama greita užklausa
+    query_fn() -> int | None kas poll_s; tarpinė pozicija patikslina likusį laiką.
+
+    Be timeout_s laiko riba tik pradinė: kol pozicija artėja prie tikslo, ji pratęsiama
+    (lėtas pirmas judesys ar neteisingas greičio įvertis nenutraukia judesio), o sustojusią
+    ašį sugauna stall_s (ta pati pozicija; BUSY ar neatsakymas į jį neįskaitomi). Su timeout_s riba griežta.
+
+    wait() grąžina prognozę, tikrą laiką, užklausų skaičių ir latency_s - laiką nuo
+    paskutinės "dar ne vietoje" užklausos iki patvirtinimo (viršutinė vėlavimo riba).
+    """
+
+    def __init__(
+        self,
+        query_fn: Callable[[], Optional[int]],
+        *,
+        velocity_steps_s: float = 50000.0,
+        overhead_s: float = 0.05,
+        lead_s: float = 0.05,
+        poll_s: float = 0.005,
+        stall_s: float = 3.0,
+        history: int = 32,
+    ):
+        self.query_fn = query_fn
+        self.velocity_steps_s = float(velocity_steps_s)
+        self.overhead_s = float(overhead_s)
+        self.lead_s = float(lead_s)
+        self.poll_s = float(poll_s)
+        self.stall_s = float(stall_s)
+        self._moves = deque(maxlen=int(history))    # (atstumas žingsniais, trukmė s)
+        self._waits = deque(maxlen=int(history))    # wait() rezultatai
+
+    def predict(self, distance) -> float:
+        return self.overhead_s + abs(float(distance)) / self.velocity_steps_s
+
+    def observe(self, distance, duration_s) -> None:
+        distance, duration_s = abs(float(distance)), float(duration_s)
+        if distance <= 0 or duration_s <= 0:
+            return
+        self._moves.append((distance, duration_s))
+        if len(self._moves) < 3:
+            return
+        d = np.array([m[0] for m in self._moves], dtype=np.float64)
+        t = np.array([m[1] for m in self._moves], dtype=np.float64)
+        if np.ptp(d) < 1.0:
+            return
+        slope, intercept = np.polyfit(d, t, 1)
+        if slope > 0:
+            self.velocity_steps_s = 1.0 / float(slope)
+            self.overhead_s = max(float(intercept), 0.0)
+
+    def wait(self, target: int, start: Optional[int] = None, t_command: Optional[float] = None,
+             timeout_s: Optional[float] = None) -> Dict[str, float]:
+        target = int(target)
+        t0 = time.monotonic() if t_command is None else float(t_command)
+        predicted = self.predict(target - start) if start is not None else 0.0
+        extend = timeout_s is None
+        deadline = t0 + (float(timeout_s) if not extend else max(2.0 * predicted + 2.0, 5.0))
+
+        wake = t0 + predicted - self.lead_s
+        polls = 0
+        last_miss = t0
+        last_pos, last_change = None, t0
+
+        while True:
+            now = time.monotonic()
+            if wake > now:
+                time.sleep(max(0.0, min(wake, deadline) - now))
+
+            t_query = time.monotonic()
+            pos = self.query_fn()
+            t_reply = time.monotonic()
+            polls += 1
+
+            if pos == target:
+                break
+            if pos is not None and pos != last_pos:
+                if extend and (last_pos is None or abs(target - pos) < abs(target - last_pos)):
+                    # Artėja prie tikslo -> riba pratęsiama pagal likusį atstumą.
+                    left = abs(target - pos) / self.velocity_steps_s
+                    deadline = max(deadline, t_reply + max(2.0 * left + 2.0, self.stall_s))
+                last_pos, last_change = pos, t_reply
+            elif pos is not None and t_reply - last_change > self.stall_s:
+                # Tik ta pati skaitinė pozicija; None (BUSY / neatsakė) - ne sustojimas, jį riboja deadline.
+                raise Exception("Failed to go to position (position not changing)")
+            if t_reply > deadline:
+                raise Exception(f"Timeout waiting for axis in position (last position {last_pos})")
+            last_miss = t_query
+
+            # Tarpinė pozicija -> likęs atstumas / greitis; arti tikslo - tankus tikrinimas.
+            remaining = abs(target - pos) / self.velocity_steps_s if pos is not None else 0.0
+            wake = t_reply + max(remaining - self.lead_s, self.poll_s)
+
+        result = {
+            "predicted_s": predicted,
+            "actual_s": t_reply - t0,
+            "latency_s": t_reply - last_miss,
+            "polls": polls,
+        }
+        if start is not None:
+            # Atvykimas buvo tarp paskutinės "ne" užklausos ir patvirtinimo.
+            self.observe(target - start, 0.5 * (last_miss + t_query) - t0)
+        self._waits.append(result)
+        return result
+
+    def summary(self) -> Dict[str, float]:
+        out = {"moves": len(self._waits), "velocity_steps_s": self.velocity_steps_s, "overhead_s": self.overhead_s}
+        if self._waits:
+            for key in ("actual_s", "latency_s", "polls"):
+                out[f"median_{key}"] = float(np.median([w[key] for w in self._waits]))
+            out["median_error_s"] = float(np.median([w["actual_s"] - w["predicted_s"] for w in self._waits]))
+        return out
@@ -8,11 +8,22 @@ import os
 import sys
 import pickle
 import logging
+import threading
+import time
+import atexit
 
 class ImageSaturationProcessor:
     
-    def __init__(self, pkl_file="saturation_data.pkl", intensity_threshold=100, active_pixel_channel=3):
+    def __init__(self, pkl_file="saturation_data.pkl", intensity_threshold=100, active_pixel_channel=3,
+                 save_interval_s=2.0):
         self.pkl_file = pkl_file  
+        # Būsena į pkl rašoma ne dažniau nei kas save_interval_s (paskutinės reikšmės nepametamos).
+        self.save_interval_s = float(save_interval_s)
+        self._save_lock = threading.Lock()
+        self._pending = None
+        self._last_save = 0.0
+        self._save_timer = None
+        atexit.register(self.flush)
 
         self.INTENSITY_THRESHOLD = intensity_threshold
         self.ACTIVE_PIXEL_CHANNEL = active_pixel_channel
@@ -45,6 +56,30 @@ class ImageSaturationProcessor:
         except Exception as e:
             self.logger.error(f"Error saving data to pickle file: {e}")
     
+    def _schedule_save(self, saturation_level, background_level):
+        with self._save_lock:
+            self._pending = (saturation_level, background_level)
+            wait = self.save_interval_s - (time.monotonic() - self._last_save)
+            if wait > 0:
+                if self._save_timer is None:
+                    self._save_timer = threading.Timer(wait, self.flush)
+                    self._save_timer.daemon = True
+                    self._save_timer.start()
+                return
+        self.flush()
+
+    def flush(self):
+        """Įrašo paskutines dar neįrašytas reikšmes į pkl."""
+        with self._save_lock:
+            pending, self._pending = self._pending, None
+            if self._save_timer is not None:
+                self._save_timer.cancel()
+                self._save_timer = None
+            if pending is None:
+                return
+            self._last_save = time.monotonic()
+            self._save_values(*pending)
+
     def _calculate_saturation_level(self, pixel_intensity_sum, number_of_bright_pixels):
         if number_of_bright_pixels > 0:
             return pixel_intensity_sum // number_of_bright_pixels
@@ -59,20 +94,12 @@ class ImageSaturationProcessor:
     
     def _find_background_level(self, histogram):
 
-        histogram_integral = [0] * 256
-        integral = 0
-        
-        for k in range(200):
-            integral += histogram[k]
-            histogram_integral[k] = integral
-        
+        histogram_integral = np.cumsum(np.asarray(histogram[:200], dtype=np.int64))
+
         peak = 0
         if histogram_integral[199] > 0:
-            for k in range(200):
-                if histogram_integral[k] > histogram_integral[199] / 2:
-                    peak = k
-                    break
-        
+            peak = int(np.argmax(histogram_integral > histogram_integral[199] / 2))
+
         return peak
     
     def _adjust_measurement_range(self, measurement_range_x1, measurement_range_x2,
@@ -101,7 +128,7 @@ class ImageSaturationProcessor:
     def process_image(self, image, 
                      measurement_range_x1=0, measurement_range_x2=0, 
                      measurement_range_y1=0, measurement_range_y2=0,
-                     background_visible=True):
+                     background_visible=True, return_image=True):
         original_is_pil = isinstance(image, Image.Image)
         original_mode = None
         
@@ -123,29 +150,45 @@ class ImageSaturationProcessor:
             height, width
         )
 
-        histogram = [0] * 256
-        pixel_intensity_sum = 0
-        number_of_bright_pixels = 0
-        processed_image_data = np.copy(image_data)
-        
-        for y in range(measurement_range_x1, measurement_range_x2):
-            for x in range(measurement_range_y1, measurement_range_y2, self.ACTIVE_PIXEL_CHANNEL):
-                if y < height and x < width:
-                    pixel_value = int(image_data[y, x])
-                    if background_visible:
-                        processed_pixel = self._remove_background_from_pixel(pixel_value, self.previous_background_level)
-                        processed_image_data[y, x] = processed_pixel
-                        pixel_value = processed_pixel
-                    if 0 < pixel_value < 255:
-                        histogram[pixel_value] += 1
-                    if pixel_value > self.INTENSITY_THRESHOLD:
-                        pixel_intensity_sum += pixel_value
-                        number_of_bright_pixels += 1
-        
+        processed_image_data = np.copy(image_data) if return_image else None
+
+        # ROI per slicing: eilutės x1..x2, stulpeliai y1..y2 kas ACTIVE_PIXEL_CHANNEL
+        # (tas pats, kas buvęs dvigubas ciklas per pikselius).
+        rows = slice(measurement_range_x1, max(measurement_range_x1, measurement_range_x2))
+        cols = slice(measurement_range_y1, max(measurement_range_y1, measurement_range_y2), self.ACTIVE_PIXEL_CHANNEL)
+        roi = image_data[rows, cols]
+
+        if background_visible:
+            values = np.maximum(roi.astype(np.int64) - int(self.previous_background_level), 0)
+            if processed_image_data is not None:
+                processed_image_data[rows, cols] = values
+        else:
+            values = roi
+
+        if values.dtype == np.uint8 or (
+            values.dtype.kind in "ui" and values.size and 0 <= values.min() and values.max() <= 255
+        ):
+            counts = np.bincount(values.ravel(), minlength=256)
+            levels = np.arange(256, dtype=np.int64)
+            bright = levels > self.INTENSITY_THRESHOLD
+            number_of_bright_pixels = int(counts[bright].sum())
+            pixel_intensity_sum = int((counts[bright] * levels[bright]).sum())
+            histogram = counts
+        else:
+            flat = values.ravel().astype(np.int64)
+            bright = flat[flat > self.INTENSITY_THRESHOLD]
+            number_of_bright_pixels = int(bright.size)
+            pixel_intensity_sum = int(bright.sum())
+            histogram = np.bincount(flat[(flat > 0) & (flat < 255)], minlength=256)
+        histogram[0] = 0
+        histogram[255:] = 0
+
         saturation_level = self._calculate_saturation_level(pixel_intensity_sum, number_of_bright_pixels)
         background_level = self._find_background_level(histogram)
-        self._save_values(saturation_level, background_level)
-        if original_is_pil:
+        self._schedule_save(saturation_level, background_level)
+        if not return_image:
+            processed_image = None
+        elif original_is_pil:
             processed_image = Image.fromarray(processed_image_data)
             if original_mode != 'L':
                 processed_image = processed_image.convert(original_mode)
@@ -161,5 +204,8 @@ class ImageSaturationProcessor:
 
         self.previous_saturation_level = 0
         self.previous_background_level = 0
-        self._save_values(0, 0)
+        with self._save_lock:
+            self._pending = None
+            self._last_save = time.monotonic()
+            self._save_values(0, 0)
         self.logger.info("Values restored to their original state")
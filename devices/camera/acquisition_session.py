@@ -0,0 +1,466 @@
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+import numpy as np
+import PySpin
+
+from devices.camera.frame_pool import FRAME_POOL
+
+
+@dataclass
+class Frame:
+    image: np.ndarray               # read-only buferis iš FRAME_POOL
+    t_start: float                  # ekspozicijos pradžia, time.monotonic() skalėje
+    exposure_us: Optional[float]    # ekspozicija, su kuria kadras darytas (jei žinoma)
+    frame_id: int
+
+
+class AcquisitionSession:
+    """
+    Vienas nuolatinis kameros srautas visam darbui (live vaizdas, fokusavimas, skenavimas).
+
+    start()/stop() skaičiuoja naudotojus: BeginAcquisition tik pirmam, EndAcquisition tik
+    paskutiniam, todėl skenavimo metu srautas nestabdomas tarp pozicijų. Node'ai (ExposureTime,
+    Trigger*, timestamp latch) surandami vieną kartą.
+
+    frame_after(t) grąžina naujausią pilną kadrą, kurio ekspozicija prasidėjo ne anksčiau
+    nei t (pvz. po judesio pabaigos); senesni buferiai išmetami. Jei live ciklas jau ima
+    kadrus (attach_pump + publish), laukiama jo kadro, kitaip kadrai imami tiesiogiai.
+
+    set_software_trigger(True) perjungia kamerą į vieną kadrą per TriggerSoftware; tada
+    triggered_frame() grąžina būtent to trigerio kadrą (žr. measurement.triggered_capture).
+    """
+
+    def __init__(self, cam, *, buffer_count: int = 3, readout_s: float = 0.035, relatch_s: float = 30.0):
+        self.cam = cam
+        self.buffer_count = int(buffer_count)
+        self.readout_s = float(readout_s)
+        self.relatch_s = float(relatch_s)
+
+        self._lock = threading.Lock()
+        self._grab_lock = threading.Lock()
+        self._cond = threading.Condition()
+        self._users = 0
+        self._owns_stream = False
+        self._pumps = 0
+        self._latest: Optional[Frame] = None
+        self._frame_id = 0
+
+        self._nodes: Dict[str, object] = {}
+        self._software_trigger: Optional[bool] = None
+        self._trigger_restore = None    # (TriggerMode, TriggerSource, TriggerSelector) prieš set_software_trigger
+        self.last_trigger_s: Optional[float] = None
+        self._clock = None              # (host_t, camera_ticks, ticks_per_s)
+        self._clock_t = 0.0
+        self._exposures = deque(maxlen=32)  # (t, exposure_us)
+        self._stats = {"frames": 0, "stale": 0, "timeouts": 0, "begin": 0, "end": 0, "triggers": 0}
+
+    # --------------------- srautas ---------------------
+    def start(self) -> "AcquisitionSession":
+        with self._lock:
+            self._users += 1
+            if self._users > 1:
+                return self
+            try:
+                if not self.cam.IsStreaming():
+                    self._configure_stream()
+                    self.cam.BeginAcquisition()
+                    self._owns_stream = True
+                    self._stats["begin"] += 1
+            except Exception:
+                self._users -= 1
+                raise
+        self._read_trigger_state()
+        self._latch_clock()
+        return self
+
+    def stop(self) -> None:
+        with self._lock:
+            if self._users == 0:
+                return
+            self._users -= 1
+            if self._users > 0 or not self._owns_stream:
+                return
+            self._owns_stream = False
+            try:
+                if self.cam.IsStreaming():
+                    self.cam.EndAcquisition()
+                    self._stats["end"] += 1
+            except Exception:
+                pass
+
+    def close(self) -> None:
+        """Stabdo srautą nepriklausomai nuo naudotojų skaičiaus (kameros atjungimas)."""
+        with self._lock:
+            self._users = 1
+        self.stop()
+        with self._cond:
+            self._pumps = 0
+            self._latest = None
+            self._cond.notify_all()
+
+    @property
+    def active(self) -> bool:
+        return self._users > 0
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+    def _configure_stream(self) -> None:
+        # NewestOnly: kameros buferyje nesikaupia seni kadrai, GetNextImage duoda naujausią.
+        try:
+            s_map = self.cam.GetTLStreamNodeMap()
+            mode = PySpin.CEnumerationPtr(s_map.GetNode("StreamBufferHandlingMode"))
+            if PySpin.IsAvailable(mode) and PySpin.IsWritable(mode):
+                entry = mode.GetEntryByName("NewestOnly")
+                if PySpin.IsAvailable(entry) and PySpin.IsReadable(entry):
+                    mode.SetIntValue(entry.GetValue())
+            count_mode = PySpin.CEnumerationPtr(s_map.GetNode("StreamBufferCountMode"))
+            if PySpin.IsAvailable(count_mode) and PySpin.IsWritable(count_mode):
+                entry = count_mode.GetEntryByName("Manual")
+                if PySpin.IsAvailable(entry) and PySpin.IsReadable(entry):
+                    count_mode.SetIntValue(entry.GetValue())
+            count = PySpin.CIntegerPtr(s_map.GetNode("StreamBufferCountManual"))
+            if PySpin.IsAvailable(count) and PySpin.IsWritable(count):
+                count.SetValue(max(int(count.GetMin()), min(self.buffer_count, int(count.GetMax()))))
+        except Exception as e:
+            print(f"Stream buffer configuration skipped: {e}")
+
+    # --------------------- node'ai ---------------------
+    def _node(self, ptr_cls, name: str):
+        key = f"{ptr_cls.__name__}:{name}"
+        node = self._nodes.get(key)
+        if node is None:
+            node = ptr_cls(self.cam.GetNodeMap().GetNode(name))
+            self._nodes[key] = node
+        return node
+
+    def _read_trigger_state(self) -> None:
+        try:
+            self._software_trigger = (self._get_enum("TriggerMode") == "On"
+                                      and self._get_enum("TriggerSource") == "Software")
+        except Exception:
+            self._software_trigger = False
+
+    @property
+    def software_trigger(self) -> bool:
+        return bool(self._software_trigger)
+
+    def _set_enum(self, name: str, entry_name: Optional[str]) -> bool:
+        if not entry_name:
+            return False
+        node = self._node(PySpin.CEnumerationPtr, name)
+        if not (PySpin.IsAvailable(node) and PySpin.IsWritable(node)):
+            return False
+        entry = node.GetEntryByName(entry_name)
+        if not (PySpin.IsAvailable(entry) and PySpin.IsReadable(entry)):
+            return False
+        node.SetIntValue(entry.GetValue())
+        return True
+
+    def _get_enum(self, name: str) -> Optional[str]:
+        node = self._node(PySpin.CEnumerationPtr, name)
+        if PySpin.IsAvailable(node) and PySpin.IsReadable(node):
+            return node.GetCurrentEntry().GetSymbolic()
+        return None
+
+    def _apply_trigger(self, enabled: bool) -> bool:
+        # TriggerSource/TriggerSelector keičiami tik išjungus TriggerMode.
+        if enabled:
+            if self._trigger_restore is None:
+                self._trigger_restore = (self._get_enum("TriggerMode"), self._get_enum("TriggerSource"),
+                                         self._get_enum("TriggerSelector"))
+            self._set_enum("TriggerMode", "Off")
+            self._set_enum("TriggerSelector", "FrameStart")
+            if self._set_enum("TriggerSource", "Software") and self._set_enum("TriggerMode", "On"):
+                return True
+            # Nepavyko - grąžinama ankstesnė būsena (pvz. aparatinis trigeris).
+            self._apply_trigger(False)
+            return False
+
+        restore, self._trigger_restore = self._trigger_restore, None
+        mode, source, selector = restore if restore is not None else ("Off", None, None)
+        self._set_enum("TriggerMode", "Off")
+        self._set_enum("TriggerSelector", selector)
+        self._set_enum("TriggerSource", source)
+        return mode == "Off" or self._set_enum("TriggerMode", mode)
+
+    def set_software_trigger(self, enabled: bool) -> bool:
+        """
+        enabled=True: vienas kadras per TriggerSoftware (FrameStart); False - grąžinama ankstesnė
+        trigerio būsena. Jei srautas mūsų, jis trumpam sustabdomas (kitaip kamera nekeičia
+        TriggerSource). Grąžina True, jei kamera perjungta.
+        """
+        with self._grab_lock:
+            with self._lock:
+                restart = self._owns_stream and self.cam.IsStreaming()
+                try:
+                    if restart:
+                        self.cam.EndAcquisition()
+                    ok = self._apply_trigger(enabled)
+                except Exception as e:
+                    print(f"Trigger configuration failed: {e}")
+                    ok = False
+                finally:
+                    if restart:
+                        self.cam.BeginAcquisition()
+        self._read_trigger_state()
+        return ok and self.software_trigger == bool(enabled)
+
+    def trigger(self) -> bool:
+        """TriggerSoftware, jei kamera laukia programinio trigerio; grąžina True, jei įvykdyta."""
+        if self._software_trigger is None:
+            self._read_trigger_state()
+        if not self._software_trigger:
+            return False
+        try:
+            ts = self._node(PySpin.CCommandPtr, "TriggerSoftware")
+            if PySpin.IsAvailable(ts) and PySpin.IsWritable(ts):
+                ts.Execute()
+                return True
+        except Exception:
+            pass
+        return False
+
+    def exposure_us(self) -> Optional[float]:
+        try:
+            exp = self._node(PySpin.CFloatPtr, "ExposureTime")
+            if PySpin.IsAvailable(exp) and PySpin.IsReadable(exp):
+                return float(exp.GetValue())
+        except Exception:
+            pass
+        return None
+
+    def timeout_ms(self) -> int:
+        exposure = self.exposure_us()
+        if exposure is None:
+            return 1500
+        return max(2000, int(3 * exposure / 1000.0) + 200)
+
+    def note_exposure(self, exposure_us, t: Optional[float] = None) -> None:
+        """Kviečiama nustačius ExposureTime - kad kadrams būtų priskirta tikra ekspozicija."""
+        with self._lock:
+            self._exposures.append((time.monotonic() if t is None else float(t), float(exposure_us)))
+
+    def exposure_at(self, t: float) -> Optional[float]:
+        with self._lock:
+            value = None
+            for t_set, exposure in self._exposures:
+                if t_set > t:
+                    break
+                value = exposure
+        return value
+
+    # --------------------- laikas ---------------------
+    def _latch_clock(self) -> None:
+        # Kameros laikrodis -> time.monotonic(): latch vidury tarp dviejų host laiko matavimų.
+        for latch_name, value_name in (("TimestampLatch", "TimestampLatchValue"),
+                                       ("GevTimestampControlLatch", "GevTimestampValue")):
+            try:
+                latch = self._node(PySpin.CCommandPtr, latch_name)
+                value = self._node(PySpin.CIntegerPtr, value_name)
+                if not (PySpin.IsAvailable(latch) and PySpin.IsAvailable(value) and PySpin.IsReadable(value)):
+                    continue
+                freq = self._node(PySpin.CIntegerPtr, "GevTimestampTickFrequency")
+                ticks_per_s = float(freq.GetValue()) if PySpin.IsAvailable(freq) and PySpin.IsReadable(freq) else 1e9
+                t0 = time.monotonic()
+                latch.Execute()
+                ticks = int(value.GetValue())
+                t1 = time.monotonic()
+                self._clock = (0.5 * (t0 + t1), ticks, ticks_per_s)
+                self._clock_t = t1
+                return
+            except Exception:
+                continue
+        self._clock = None
+
+    def _frame_time(self, img, t_recv: float) -> float:
+        if self._clock is not None and t_recv - self._clock_t > self.relatch_s:
+            self._latch_clock()
+        if self._clock is not None:
+            try:
+                host_t, ticks, ticks_per_s = self._clock
+                t = host_t + (int(img.GetTimeStamp()) - ticks) / ticks_per_s
+                if t <= t_recv + 0.01:
+                    return t
+            except Exception:
+                pass
+        # Be kameros laikrodžio: konservatyviai gavimo laikas - ekspozicija - nuskaitymas.
+        exposure = self.exposure_at(t_recv) or self.exposure_us() or 0.0
+        return t_recv - exposure * 1e-6 - self.readout_s
+
+    # --------------------- kadrai ---------------------
+    def attach_pump(self) -> None:
+        """Live ciklas pats ima kadrus ir juos perduoda per publish()."""
+        with self._cond:
+            self._pumps += 1
+
+    def pump_next(self, timeout_ms: int):
+        """
+        Live ciklo GetNextImage po _grab_lock, kad set_software_trigger nestabdytų srauto
+        vidury jo laukimo. Programinio trigerio režimu kadrai ateina tik po trigerio, todėl
+        laukiama trumpai ir timeout grąžinamas kaip None.
+        """
+        if self._software_trigger:
+            with self._grab_lock:
+                try:
+                    return self.cam.GetNextImage(min(int(timeout_ms), 250))
+                except PySpin.SpinnakerException as ex:
+                    if "timeout" in str(ex).lower():
+                        return None
+                    raise
+        with self._grab_lock:
+            return self.cam.GetNextImage(int(timeout_ms))
+
+    def detach_pump(self) -> None:
+        with self._cond:
+            self._pumps = max(self._pumps - 1, 0)
+            self._cond.notify_all()
+
+    def _make_frame(self, img, image: Optional[np.ndarray], t_recv: float) -> Frame:
+        if image is None:
+            image = FRAME_POOL.copy_in(img.GetNDArray())
+        t_start = self._frame_time(img, t_recv)
+        with self._lock:
+            self._frame_id += 1
+            frame_id = self._frame_id
+            self._stats["frames"] += 1
+        exposure = self.exposure_at(t_start)
+        return Frame(image=image, t_start=t_start, exposure_us=exposure, frame_id=frame_id)
+
+    def publish(self, img, image: Optional[np.ndarray] = None) -> Frame:
+        """Live ciklo kadras (image - jau nukopijuotas į pool'ą, pvz. latest_frame)."""
+        frame = self._make_frame(img, image, time.monotonic())
+        with self._cond:
+            self._latest = frame
+            self._cond.notify_all()
+        return frame
+
+    def _read(self, timeout_ms: int) -> Optional[Frame]:
+        try:
+            img = self.cam.GetNextImage(int(timeout_ms))
+        except PySpin.SpinnakerException:
+            self._stats["timeouts"] += 1
+            return None
+        try:
+            if img.IsIncomplete():
+                return None
+            return self._make_frame(img, None, time.monotonic())
+        finally:
+            try:
+                img.Release()
+            except Exception:
+                pass
+
+    def _drain(self) -> int:
+        # Programinio trigerio režimu eilėje likę kadrai yra ankstesnių trigerių - išmetami.
+        dropped = 0
+        for _ in range(self.buffer_count + 1):
+            try:
+                img = self.cam.GetNextImage(1)
+            except PySpin.SpinnakerException:
+                break
+            try:
+                img.Release()
+            except Exception:
+                pass
+            dropped += 1
+        self._stats["stale"] += dropped
+        return dropped
+
+    def triggered_frame(self, timeout_s: Optional[float] = None) -> Optional[Frame]:
+        """
+        Programinio trigerio režimas: TriggerSoftware -> būtent to trigerio kadras arba None.
+        last_trigger_s - laikas nuo trigerio iki kadro.
+        """
+        if timeout_s is None:
+            timeout_s = self.timeout_ms() / 1000.0
+        self.last_trigger_s = None
+
+        with self._cond:
+            if self._pumps > 0:
+                last_id = self._latest.frame_id if self._latest is not None else 0
+                t0 = time.monotonic()
+                if not self.trigger():
+                    return None
+                self._stats["triggers"] += 1
+                deadline = t0 + float(timeout_s)
+                while self._latest is None or self._latest.frame_id <= last_id:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0 or self._pumps == 0:
+                        self._stats["timeouts"] += 1
+                        return None
+                    self._cond.wait(remaining)
+                self.last_trigger_s = time.monotonic() - t0
+                return self._latest
+
+        with self._grab_lock:
+            self._drain()
+            t0 = time.monotonic()
+            if not self.trigger():
+                return None
+            self._stats["triggers"] += 1
+            frame = self._read(max(int(float(timeout_s) * 1000), 1))
+        if frame is not None:
+            self.last_trigger_s = time.monotonic() - t0
+        return frame
+
+    def frame_after(self, t_after: float, timeout_s: Optional[float] = None) -> Optional[Frame]:
+        """Naujausias pilnas kadras su t_start >= t_after arba None (timeout)."""
+        if timeout_s is None:
+            timeout_s = self.timeout_ms() / 1000.0
+        deadline = time.monotonic() + float(timeout_s)
+
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self._stats["timeouts"] += 1
+                return None
+
+            with self._cond:
+                if self._pumps > 0:
+                    latest = self._latest
+                    if latest is not None and latest.t_start >= t_after:
+                        return latest
+                    self._cond.wait(remaining)
+                    continue
+
+            with self._grab_lock:
+                frame = self._read(max(int(remaining * 1000), 1))
+            if frame is None:
+                continue
+            if frame.t_start >= t_after:
+                return frame
+            self._stats["stale"] += 1
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            out = dict(self._stats)
+            out["users"] = self._users
+        out["pumps"] = self._pumps
+        out["clock_synced"] = self._clock is not None
+        return out
+
+
+def acquisition_session(instance, cam) -> Optional[AcquisitionSession]:
+    """instance.acquisition_session šiai kamerai (sukuriama pirmą kartą)."""
+    if cam is None:
+        return None
+    session = getattr(instance, "acquisition_session", None)
+    if session is None or session.cam is not cam:
+        session = AcquisitionSession(cam)
+        instance.acquisition_session = session
+    return session
+
+
+def note_exposure(instance, exposure_us) -> None:
+    session = getattr(instance, "acquisition_session", None)
+    if session is not None:
+        session.note_exposure(exposure_us)
@@ -23,8 +23,8 @@ def prepare_for_tk(latest_frame: np.ndarray, label_width: int, label_height: int
     if latest_frame is None:
         return None
 
-    frame = latest_frame.copy()
-    frame = convert_to_color_bitmap(frame)
+    # convert_to_color_bitmap grąžina naują masyvą - latest_frame (read-only) nekopijuojam
+    frame = convert_to_color_bitmap(latest_frame)
 
     if len(frame.shape) == 2:
         frame = cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR)
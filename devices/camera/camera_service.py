@@ -4,6 +4,8 @@ import numpy as np
 import time
 import copy
 
+from devices.camera.acquisition_session import acquisition_session
+
 class CameraService:
     def __init__(self, serial_number: str = ""):
         self.serial_number = (serial_number or "").strip()
@@ -129,98 +131,70 @@ class SimpleCameraCapture:
         self.cam = cam
 
     def capture_image_at_position(instance, cam, position, previous_sat):
+        # Srautas ir node'ai - per bendrą AcquisitionSession: jei skenavimas ar live ciklas
+        # jau laiko sesiją, BeginAcquisition/EndAcquisition čia nekviečiami.
+        session = acquisition_session(instance, cam)
         try:
-            acquisition_started = False
-            if not cam.IsStreaming():
-                cam.BeginAcquisition()
-                acquisition_started = True
-
-            timeout_ms = 1500
-            try:
-                nmap = cam.GetNodeMap()
-                exp = PySpin.CFloatPtr(nmap.GetNode('ExposureTime'))
-                if PySpin.IsAvailable(exp) and PySpin.IsReadable(exp):
-                    exposure_ms = float(exp.GetValue()) / 1000.0
-                    timeout_ms = max(2000, int(3 * exposure_ms) + 200)
-            except Exception:
-                pass
+            session.start()
+        except Exception:
+            traceback.print_exc()
+            return None
 
-            trig_mode = None
-            trig_src_software = False
-            tmap = None
-            try:
-                tmap = cam.GetNodeMap()
-                trig = PySpin.CEnumerationPtr(tmap.GetNode('TriggerMode'))
-                src  = PySpin.CEnumerationPtr(tmap.GetNode('TriggerSource'))
-                if PySpin.IsAvailable(trig) and PySpin.IsReadable(trig):
-                    trig_mode = trig.GetCurrentEntry().GetSymbolic()
-                if PySpin.IsAvailable(src) and PySpin.IsReadable(src):
-                    trig_src = src.GetCurrentEntry().GetSymbolic()
-                    trig_src_software = (trig_src == 'Software')
-            except Exception:
-                tmap = None
+        try:
+            timeout_s = session.timeout_ms() / 1000.0
 
             lower = getattr(instance, "saturation_lower_bound", 110.0)
             upper = getattr(instance, "saturation_upper_bound", 205.0)
 
             best_array = None
+            best_frame = None
             best_penalty = float("inf")  
 
+            # Tik kadrai, kurių ekspozicija prasidėjo po šio kvietimo (ašis jau vietoje).
+            t_after = time.monotonic()
             attempts = 0
             while attempts < 15:
                 attempts += 1
 
-                try:
-                    if trig_mode == 'On' and trig_src_software and tmap is not None:
-                        ts = PySpin.CCommandPtr(tmap.GetNode('TriggerSoftware'))
-                        if PySpin.IsAvailable(ts) and PySpin.IsWritable(ts):
-                            ts.Execute()
-                except Exception:
-                    pass
-
-                try:
-                    img = cam.GetNextImage(timeout_ms)
-                except PySpin.SpinnakerException:
+                if session.software_trigger:
+                    # Vienas kadras per trigerį - laukti "naujesnio" kadro nereikia.
+                    frame = session.triggered_frame(timeout_s)
+                else:
+                    session.trigger()
+                    frame = session.frame_after(t_after, timeout_s)
+                if frame is None:
                     continue
-
-                try:
-                    if img.IsIncomplete():
-                        continue
-
-                    array = img.GetNDArray().copy()
-                    sat = float(np.max(array))
-
-                    if lower <= sat <= upper:
-                        return array
-
-                    if sat < lower:
-                        penalty = lower - sat
-                    elif sat > upper:
-                        penalty = sat - upper
-                    else:
-                        penalty = 0.0
-
-                    if penalty < best_penalty:
-                        best_penalty = penalty
-                        best_array = array
-
-                finally:
-                    try:
-                        img.Release()
-                    except Exception:
-                        pass
-
+                t_after = frame.t_start + 1e-6
+
+                array = frame.image
+                sat = float(np.max(array))
+
+                if lower <= sat <= upper:
+                    instance.last_capture_attempts = attempts
+                    instance.last_capture_exposure = frame.exposure_us
+                    return array
+
+                if sat < lower:
+                    penalty = lower - sat
+                elif sat > upper:
+                    penalty = sat - upper
+                else:
+                    penalty = 0.0
+
+                if penalty < best_penalty:
+                    best_penalty = penalty
+                    best_array = array
+                    best_frame = frame
+
+            instance.last_capture_attempts = attempts
+            instance.last_capture_exposure = best_frame.exposure_us if best_frame is not None else None
             return best_array
 
         except Exception:
             traceback.print_exc()
             return None
         finally:
-            try:
-                if 'acquisition_started' in locals() and acquisition_started:
-                    cam.EndAcquisition()
-            except Exception:
-                pass
+            session.stop()
             
     def capture_multiple(self, count=5, delay_ms=100, timeout_ms=1000):
         if self.cam is None:
@@ -1,13 +1,24 @@
 import PySpin
 import traceback
 
+from devices.camera.acquisition_session import note_exposure
+
 def update_camera_settings(instance, cam, saturation_level, background_level):
     try:
-        new_shutter = calculate_shutter(instance, saturation_level, background_level)
+        controller = getattr(instance, "exposure_controller", None)
+        if controller is not None:
+            new_shutter = controller.update(saturation_level, background_level, instance.last_known_exposure_time)
+            instance.status = controller.status
+            if new_shutter is None:
+                return
+            new_shutter = int(new_shutter)
+        else:
+            new_shutter = calculate_shutter(instance, saturation_level, background_level)
 
         if PySpin.IsAvailable(cam.ExposureTime) and PySpin.IsWritable(cam.ExposureTime):
             cam.ExposureTime.SetValue(new_shutter)
             instance.last_known_exposure_time = new_shutter
+            note_exposure(instance, new_shutter)
         else:
             print("ExposureTime is not available or writable")
 
@@ -19,6 +30,25 @@ def update_camera_settings(instance, cam, saturation_level, background_level):
         print(f"Error details: {traceback.format_exc()}")
 
 
+def set_exposure(instance, cam, exposure_us):
+    """Tiesiogiai nustato ExposureTime (pvz. iš ExposurePrior); grąžina True, jei pavyko."""
+    try:
+        if PySpin.IsAvailable(cam.ExposureTime) and PySpin.IsWritable(cam.ExposureTime):
+            lo, hi = cam.ExposureTime.GetMin(), cam.ExposureTime.GetMax()
+            value = int(min(max(float(exposure_us), lo), hi))
+            cam.ExposureTime.SetValue(value)
+            instance.last_known_exposure_time = value
+            note_exposure(instance, value)
+            controller = getattr(instance, "exposure_controller", None)
+            if controller is not None:
+                controller.hold()
+            return True
+        print("ExposureTime is not available or writable")
+    except PySpin.SpinnakerException as ex:
+        print(f"Error setting exposure: {ex}")
+    return False
+
+
 def set_default_configuration(instance, cam):
     try:
         node_map = cam.GetNodeMap()
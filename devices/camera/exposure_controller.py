@@ -0,0 +1,113 @@
+import time
+from typing import Dict, Optional
+
+
+class ExposureController:
+    """
+    Ekspozicijos valdymas pagal modelį: Mono8 signalas (peak - fonas) iki soties beveik
+    tiesinis ekspozicijai, todėl reikalinga ekspozicija apskaičiuojama iš vieno kadro:
+        E_new = E * (target - bg) / (peak - bg)
+    Tik kai kadras nukirptas (peak >= clip_level) ar signalo beveik nėra, naudojamas
+    bracketing (E * bracket_down arba E * bracket_up), nes iš tokio kadro santykio
+    apskaičiuoti negalima.
+
+    Nauja ekspozicija įsigalioja ne iš karto (kadrai jau buferyje), todėl po pakeitimo
+    latency_frames kadrų tik stebima. Nusistovėjimo laikas (kadrai ir s) - stats().
+    """
+
+    def __init__(self, *, target: float = 200.0, band=(190.0, 210.0), min_shutter: float = 51,
+                 max_shutter: float = 1036380, clip_level: float = 255.0, min_signal: float = 5.0,
+                 latency_frames: int = 1, max_ratio: float = 8.0, bracket_down: float = 0.25,
+                 bracket_up: float = 4.0):
+        self.target = float(target)
+        self.band = (float(band[0]), float(band[1]))
+        self.min_shutter = float(min_shutter)
+        self.max_shutter = float(max_shutter)
+        self.clip_level = float(clip_level)
+        self.min_signal = float(min_signal)
+        self.latency_frames = max(int(latency_frames), 0)
+        self.max_ratio = float(max_ratio)
+        self.bracket_down = float(bracket_down)
+        self.bracket_up = float(bracket_up)
+
+        self.status = ""
+        self._skip = 0
+        self._settling_since: Optional[float] = None
+        self._settling_frames = 0
+        self._stats: Dict[str, float] = {
+            "settles": 0.0, "last_settle_frames": 0.0, "last_settle_s": 0.0,
+            "max_settle_frames": 0.0, "total_settle_frames": 0.0, "model_steps": 0.0, "bracket_steps": 0.0,
+        }
+
+    def in_band(self, peak: float) -> bool:
+        return self.band[0] <= float(peak) <= self.band[1]
+
+    def update(self, peak: float, background: float, exposure: float) -> Optional[float]:
+        """Grąžina naują ekspoziciją (us) arba None, jei keisti nereikia / dar laukiama."""
+        peak, background, exposure = float(peak), float(background), float(exposure)
+
+        if self.in_band(peak):
+            self._finish_settle()
+            self._skip = 0
+            self.status = "Optimal Saturation"
+            return None
+
+        now = time.monotonic()
+        if self._settling_since is None:
+            self._settling_since = now
+            self._settling_frames = 0
+        self._settling_frames += 1
+
+        if self._skip > 0:
+            # Šis kadras dar galėjo būti eksponuotas sena ekspozicija.
+            self._skip -= 1
+            return None
+
+        signal = peak - background
+        if peak >= self.clip_level:
+            ratio = self.bracket_down
+            self._stats["bracket_steps"] += 1
+            self.status = f"Decreasing (Clipped {int(peak)})"
+        elif signal < self.min_signal:
+            ratio = self.bracket_up
+            self._stats["bracket_steps"] += 1
+            self.status = f"Increasing (No signal {int(peak)})"
+        else:
+            ratio = max(self.target - background, self.min_signal) / signal
+            ratio = min(max(ratio, 1.0 / self.max_ratio), self.max_ratio)
+            self._stats["model_steps"] += 1
+            self.status = f"{'Increasing' if ratio > 1 else 'Decreasing'} (Model {int(peak)} -> {int(self.target)})"
+
+        new_exposure = min(max(exposure * ratio, self.min_shutter), self.max_shutter)
+        if int(new_exposure) == int(exposure):
+            self.status += " (Shutter limit)"
+            return None
+        self._skip = self.latency_frames
+        return new_exposure
+
+    def _finish_settle(self) -> None:
+        if self._settling_since is None:
+            return
+        frames = float(self._settling_frames)
+        self._stats["settles"] += 1
+        self._stats["last_settle_frames"] = frames
+        self._stats["last_settle_s"] = time.monotonic() - self._settling_since
+        self._stats["max_settle_frames"] = max(self._stats["max_settle_frames"], frames)
+        self._stats["total_settle_frames"] += frames
+        self._settling_since = None
+        self._settling_frames = 0
+
+    def hold(self) -> None:
+        """Ekspozicija pakeista iš išorės (pvz. ExposurePrior prieš judesį) - palaukti latency_frames."""
+        self._skip = self.latency_frames
+
+    def reset(self) -> None:
+        self._skip = 0
+        self._settling_since = None
+        self._settling_frames = 0
+
+    def stats(self) -> Dict[str, float]:
+        out = dict(self._stats)
+        out["mean_settle_frames"] = out["total_settle_frames"] / out["settles"] if out["settles"] else 0.0
+        out["settling"] = float(self._settling_since is not None)
+        return out
@@ -0,0 +1,111 @@
+import json
+import os
+import threading
+from typing import Dict, Optional
+
+import numpy as np
+
+PRIOR_FILE_NAME = "exposure_prior.json"
+
+
+def default_prior_path() -> str:
+    # Šalia vartotojo settings.json (ui.SettingsWindow.get_settings)
+    return os.path.join(os.path.expanduser("~"), ".matchbox_config", PRIOR_FILE_NAME)
+
+
+class ExposurePrior:
+    """
+    Ekspozicijos spėjimas pagal ašies poziciją (žingsniais).
+
+    observe() kiekvienam priimtam kadrui perskaičiuoja ekspoziciją, kuri duotų target
+    peak (Mono8 tiesinis: E * (target - bg) / (peak - bg)). predict(pos):
+      - jei šiame matavime abipus pos yra taškų (ne toliau near_steps) - interpoliacija log(E);
+      - kitaip ankstesnio matavimo profilis, pakeistas mastu pagal šio matavimo taškus
+        (kitas DUT gali būti kitos galios, bet kaustikos forma panaši);
+      - kitaip artimiausias šio matavimo taškas.
+    """
+
+    def __init__(self, previous: Optional[Dict[int, float]] = None, *, target: float = 157.5,
+                 near_steps: int = 4000, clip_level: float = 255.0, min_signal: float = 5.0):
+        self.target = float(target)
+        self.near_steps = int(near_steps)
+        self.clip_level = float(clip_level)
+        self.min_signal = float(min_signal)
+        self._lock = threading.Lock()
+        self._prev = {int(k): float(v) for k, v in (previous or {}).items() if float(v) > 0}
+        self._cur: Dict[int, float] = {}
+
+    def __len__(self) -> int:
+        return len(self._cur)
+
+    def observe(self, pos, exposure_us, peak, background=0.0) -> bool:
+        peak, background = float(peak), float(background)
+        if exposure_us is None or peak >= self.clip_level or peak - background < self.min_signal:
+            return False
+        e = float(exposure_us) * max(self.target - background, self.min_signal) / (peak - background)
+        with self._lock:
+            self._cur[int(pos)] = e
+        return True
+
+    @staticmethod
+    def _interp(table: Dict[int, float], pos: int) -> float:
+        xs = np.array(sorted(table), dtype=float)
+        ys = np.log([table[int(x)] for x in xs])
+        return float(np.exp(np.interp(float(pos), xs, ys)))
+
+    def predict(self, pos) -> Optional[float]:
+        pos = int(pos)
+        with self._lock:
+            cur = dict(self._cur)
+        prev = self._prev
+
+        if cur:
+            xs = np.array(sorted(cur))
+            lo, hi = xs[xs <= pos], xs[xs >= pos]
+            if lo.size and hi.size and pos - lo[-1] <= self.near_steps and hi[0] - pos <= self.near_steps:
+                return self._interp(cur, pos)
+
+        if prev:
+            base = self._interp(prev, pos)
+            if cur:
+                ratios = [cur[p] / self._interp(prev, p) for p in cur]
+                base *= float(np.median(ratios))
+            return base
+
+        if cur:
+            return self._interp(cur, pos)
+        return None
+
+    def to_dict(self) -> Dict[str, float]:
+        """Šio matavimo įvertis; nematuotos pozicijos papildomos ankstesniu profiliu."""
+        with self._lock:
+            cur = dict(self._cur)
+        if not cur:
+            return {str(p): e for p, e in self._prev.items()}
+        out = {str(p): self.predict(p) for p in self._prev if p not in cur}
+        out.update({str(p): e for p, e in cur.items()})
+        return out
+
+    def save(self, *paths) -> None:
+        data = json.dumps({"target": self.target, "exposure_us": self.to_dict()})
+        for path in paths:
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+                tmp = path + ".tmp"
+                with open(tmp, "w", encoding="utf-8") as f:
+                    f.write(data)
+                os.replace(tmp, path)
+            except OSError as e:
+                print(f"Could not save exposure prior to {path}: {e}")
+
+    @classmethod
+    def load(cls, path: Optional[str] = None, **kw) -> "ExposurePrior":
+        path = path or default_prior_path()
+        previous = {}
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            previous = {int(k): float(v) for k, v in data.get("exposure_us", {}).items() if v}
+        except (OSError, ValueError):
+            pass
+        return cls(previous, **kw)
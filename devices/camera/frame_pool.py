@@ -0,0 +1,72 @@
+import threading
+import weakref
+from typing import Dict, List
+
+import numpy as np
+
+
+class FramePool:
+    """
+    Perdirbami kadrų buferiai: kamera kadrą nukopijuoja vieną kartą į buferį iš pool'o,
+    o analizė, ekranas, images_dict ir rašymas į diską dalinasi tuo pačiu read-only masyvu.
+
+    Buferis grįžta į pool'ą (weakref.finalize), kai neliko nė vieno iš jo padaryto
+    masyvo ar view'o. Laisvų buferių laikoma ne daugiau max_free.
+    """
+
+    def __init__(self, max_free: int = 16):
+        self.max_free = int(max_free)
+        self._lock = threading.Lock()
+        self._free: Dict[int, List[np.ndarray]] = {}
+        self._stats = {"acquired": 0, "allocated": 0, "recycled": 0}
+
+    def acquire(self, shape, dtype=np.uint8) -> np.ndarray:
+        """Rašomas buferis [shape]; po užpildymo geriausia setflags(write=False)."""
+        dtype = np.dtype(dtype)
+        nbytes = int(np.prod(shape)) * dtype.itemsize
+        with self._lock:
+            self._stats["acquired"] += 1
+            free = self._free.get(nbytes)
+            storage = free.pop() if free else None
+            if storage is None:
+                self._stats["allocated"] += 1
+        if storage is None:
+            storage = np.empty(nbytes, dtype=np.uint8)
+
+        # Visi view'ai (slice, reshape, asarray) numpy'je kaip base nurodo šį flat masyvą
+        # (jis pats duomenų neturi), todėl jo finalize = paskutinio view'o mirtis.
+        flat = np.frombuffer(memoryview(storage), dtype=dtype)
+        weakref.finalize(flat, self._release, storage)
+        return flat.reshape(shape)
+
+    def copy_in(self, src) -> np.ndarray:
+        """Vienintelė kadro kopija: src -> buferis iš pool'o, grąžinamas read-only."""
+        src = np.asarray(src)
+        out = self.acquire(src.shape, src.dtype)
+        np.copyto(out, src)
+        out.setflags(write=False)
+        return out
+
+    def _release(self, storage: np.ndarray) -> None:
+        with self._lock:
+            free = self._free.setdefault(storage.nbytes, [])
+            if len(free) < self.max_free:
+                free.append(storage)
+                self._stats["recycled"] += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            out = dict(self._stats)
+            out["free"] = sum(len(v) for v in self._free.values())
+        return out
+
+
+FRAME_POOL = FramePool()
+
+
+def shared_frame(image) -> np.ndarray:
+    """Read-only kadras dalinimuisi: jau read-only (iš pool'o) - be kopijos, kitaip viena kopija."""
+    image = np.asarray(image)
+    if not image.flags.writeable:
+        return image
+    return FRAME_POOL.copy_in(image)
@@ -22,6 +22,18 @@ class CoolerData:
         raw = self._read_raw_line()
         return self._parse_to_df(raw)
 
+    def dataframe_from_response(self, data: Union[str, bytes, bytearray, None]) -> pd.DataFrame:
+        """
+        Tas pats, kas get_dataframe(), bet su jau gautu 'TCr r' atsakymu
+        (pvz. išsiųstu kartu su judesiu per AxisController.go_to_position(queries=...)).
+        """
+        if data is None:
+            raise ValueError("Nėra 'TCr r' atsakymo.")
+        if isinstance(data, (bytes, bytearray)):
+            data = data.decode("utf-8", errors="ignore")
+        self.last_raw = str(data).strip()
+        return self._parse_to_df(self.last_raw)
+
     def _read_raw_line(self) -> str:
         """
         Kvieskite kontrolerį ir grąžinkite dekoduotą eilutę (utf-8).
@@ -1,5 +1,6 @@
 import os
 import json
+import multiprocessing
 import tkinter as tk
 import traceback
 
@@ -23,6 +24,8 @@ def create_default_config():
             json.dump(config, f, indent=4)
 
 if __name__ == "__main__":
+    # ProcessPoolExecutor (hand mode reanalizė) supakuotame .exe
+    multiprocessing.freeze_support()
     try:
         root = tk.Tk()
         root.title("Kameros ir ašies valdymas")
@@ -1,3 +1,4 @@
+import math
 import time
 def find_focus(axis_service, capture_fn, beam_fn, axis_no, max_position, step_size, stop_event):
     current = 0
@@ -44,6 +45,93 @@ def find_focus(axis_service, capture_fn, beam_fn, axis_no, max_position, step_si
 
     return None
 
+def find_focus_adaptive(axis_service, capture_fn, beam_fn, axis_no, max_position, step_size, stop_event,
+                        coarse_factor=10, rise_count=2, on_sample=None, home=True):
+    """
+    Coarse-to-fine fokuso paieška. Pirma einama dideliu žingsniu (coarse_factor * step_size),
+    kol dėmės plotas rise_count kartų iš eilės padidėja; tada minimumas tikslinamas auksinio
+    pjūvio paieška intervale [min - coarse, min + coarse] ir parabole per 3 artimiausius taškus.
+    Visos pozicijos yra step_size kartotiniai (t.y. tas pats tinklelis kaip tiesinio ėjimo),
+    jau išmatuoti taškai nekartojami. on_sample(pos, img, res) kviečiamas kiekvienam kadrui.
+    Grąžina fokuso poziciją žingsniais arba None.
+    """
+    step_size = int(step_size)
+    n_max = int(max_position) // step_size
+    coarse = max(int(coarse_factor), 1)
+    areas = {}
+
+    def area_at(i):
+        if i in areas:
+            return areas[i]
+        if stop_event.is_set():
+            return float("nan")
+        pos = i * step_size
+        t1 = time.time()
+        axis_service.go_to(axis_no, pos)
+        img = capture_fn(pos)
+        area = float("nan")
+        if img is not None:
+            res = beam_fn(img)
+            area = float(res.Dx_mm) * float(res.Dy_mm)
+            if on_sample is not None:
+                on_sample(pos, img, res)
+        print(f"Focus sample at {pos}: area={area:.6g} ({time.time() - t1:.2f} s)")
+        areas[i] = area if math.isfinite(area) and area > 0 else float("nan")
+        return areas[i]
+
+    def key(i):
+        a = area_at(i)
+        return a if math.isfinite(a) else float("inf")
+
+    # 1) grubus ėjimas, kol plotas pradeda augti
+    best, prev, rises = None, None, 0
+    for i in range(0, n_max + 1, coarse):
+        if stop_event.is_set():
+            return None
+        a = area_at(i)
+        if not math.isfinite(a):
+            continue
+        if best is None or a < areas[best]:
+            best = i
+        rises = rises + 1 if (prev is not None and a > prev) else 0
+        prev = a
+        if rises >= int(rise_count):
+            break
+
+    if best is None or stop_event.is_set():
+        return None
+
+    # 2) auksinis pjūvis sveikųjų tinklelio indeksų intervale
+    lo, hi = max(best - coarse, 0), min(best + coarse, n_max)
+    while hi - lo > 2 and not stop_event.is_set():
+        r = max(1, int(0.382 * (hi - lo)))
+        m1, m2 = lo + r, hi - r
+        if key(m1) <= key(m2):
+            hi = m2
+        else:
+            lo = m1
+
+    if stop_event.is_set():
+        return None
+
+    i0 = min(range(lo, hi + 1), key=key)
+    if not math.isfinite(areas.get(i0, float("nan"))):
+        return None
+
+    # 3) parabolė per kaimynus (be papildomų judesių, jei kaimynai jau išmatuoti)
+    delta = 0.0
+    am, a0, ap = areas.get(i0 - 1), areas[i0], areas.get(i0 + 1)
+    if am is not None and ap is not None and math.isfinite(am) and math.isfinite(ap):
+        denom = am - 2.0 * a0 + ap
+        if denom > 0:
+            delta = max(-0.5, min(0.5, 0.5 * (am - ap) / denom))
+
+    print(f"Adaptive focus: {len(areas)} moves (linear walk: ~{i0 + 6})")
+    if home:
+        axis_service.home(axis_no)
+    return int(round((i0 + delta) * step_size))
+
+
 def generate_track_by_focus(focus_position, total_length, step_per_mm,
                             fine_step_mm=1, coarse_step_mm=6):
 
@@ -5,13 +5,19 @@ import traceback
 import pandas as pd
 
 from threading import Thread
-from storage.converter import _save_data
+from storage.frame_writer import FrameWriter, persist_frame
+from storage.run_container import RUN_CONTAINER_NAME, RunContainerWriter
 from measurement.calculations import beam_size_iso11146_vendorlike
 from measurement.quadrometer import compute_m2_hyperbola
 from measurement.focus import generate_track_by_focus
+from measurement.scan_executor import PipelinedScanExecutor
+from measurement.triggered_capture import TriggeredCapture
 from devices.camera.camera_service import SimpleCameraCapture
+from devices.camera.frame_pool import shared_frame
+from devices.camera.acquisition_session import acquisition_session
 from storage.gif import create_gif_from_arrays
 from devices.cooler.CoolerComunication.cooler_data import CoolerData
+from devices.axis.axis_commands import AxisControllerCommands
 
 class MeasurementService:
     def __init__(self, worker):
@@ -35,22 +41,28 @@ class MeasurementService:
                                              bg_mode="plane",
                                              bg_stat="median",
                                              noise_nsigma=None,
-                                             ignore_saturated=False)
+                                             ignore_saturated=False,
+                                             roi=True,
+                                             engine="auto")
 
     def capture_save_measure(self, position, filename, raw_dir, pgm_dir):
         img = self.capture_image(position)
         if img is None:
             return None, None
 
-        self.w.images_dict[filename] = img.copy()
-        _save_data(self.w, raw_dir, pgm_dir, img, filename, position, position)
+        return img, self.save_measure(img, position, filename, raw_dir, pgm_dir)
 
-        res = self.beam(img)
-        return img, res
+    def save_measure(self, img, position, filename, raw_dir, pgm_dir, writer=None):
+        # Atskirai nuo kadro, kad galėtų vykti worker thread'e (PipelinedScanExecutor).
+        frame = shared_frame(img)
+        raw_path, _pgm_path = persist_frame(writer, self.w, raw_dir, pgm_dir, frame, filename, position)
+        self.w.images_dict.put(filename, frame, backing_path=raw_path)
+        return self.beam(img)
 
     def run_track_scan(self, axis_service, focus_pos_steps, travel_mm=220, step_size=1587,
-                       folder_name=None, stop_flag=None):
-        
+                       folder_name=None, stop_flag=None, m2_fitter=None, early_stop=False):
+        # m2_fitter (OnlineM2Fitter) gauna kiekvieną tašką; early_stop -> stabdom, kai M2 nusistovi.
+
         w = self.w
         stop_flag = stop_flag or (lambda: False)
 
@@ -67,59 +79,95 @@ class MeasurementService:
         os.makedirs(analysis_dir, exist_ok=True)
 
         w.raw_dir = raw_dir
+        w.run_folder = os.path.abspath(folder_name)
+        w.gif_path = None
 
+        writer = FrameWriter(raw_dir, pgm_dir)
+        container = RunContainerWriter(
+            os.path.join(folder_name, RUN_CONTAINER_NAME), compress=True,
+            meta={"serial": w.serial, "model": w.model, "step_size": step_size},
+        )
         cooler = CoolerData(axis_service.controller)
         meta_rows = []
 
         z_list, dx_list, dy_list = [], [], []
 
-        acquisition_started = False
+        session = acquisition_session(w, w.cam)
         try:
-            if w.cam is not None and hasattr(w.cam, "IsStreaming") and not w.cam.IsStreaming():
-                w.cam.BeginAcquisition()
-                acquisition_started = True
+            if session is not None:
+                session.start()
         except Exception:
-            acquisition_started = False
+            traceback.print_exc()
+            session = None
 
-        try:
-            for pos in track:
-                if stop_flag():
-                    break
-
-                try:
-                    axis_service.go_to(0, int(pos))
-                    if stop_flag():
-                        break
-
-                    try:
-                        df = cooler.get_dataframe()
-                        if hasattr(df, "to_dict"):
-                            meta_rows.append(df.to_dict(orient="records")[0] if len(df) else {})
-                    except Exception:
-                        pass
-
-                    filename = (pos / step_size)  
-                    img, res = self.capture_save_measure(pos, filename, raw_dir, pgm_dir)
-                    if res is None:
-                        continue
-
-                    dx_list.append(res.Dx_mm)
-                    dy_list.append(res.Dy_mm)
-                    z_list.append(pos / step_size)
-
-                except Exception as e:
-                    if stop_flag():
-                        break
-                    print(f"Scan error at pos {pos}: {e}")
-                    traceback.print_exc()
+        # Kadras per TriggerSoftware tik ašiai sustojus (nustatymas "capture_mode").
+        triggered = None
+        if session is not None and getattr(w, "_triggered_capture_enabled", lambda: False)():
+            triggered = TriggeredCapture(session, axis_service, axis_no=0).start()
 
-        finally:
+        # Kolerio rodmenys (TCr r) išsiunčiami tame pačiame pakete kaip judesys.
+        cooler_query = [AxisControllerCommands.get_cooler_data()]
+
+        def move(pos):
+            if triggered is not None:
+                replies = triggered.move(int(pos), queries=cooler_query)
+            else:
+                replies = axis_service.go_to(0, int(pos), queries=cooler_query)
             try:
-                if acquisition_started and w.cam is not None and hasattr(w.cam, "IsStreaming") and w.cam.IsStreaming():
-                    w.cam.EndAcquisition()
+                df = cooler.dataframe_from_response(replies[0] if replies else None)
+                if hasattr(df, "to_dict"):
+                    meta_rows.append(df.to_dict(orient="records")[0] if len(df) else {})
             except Exception:
                 pass
 
+        exposures = {}
+
+        def capture(pos):
+            img = triggered.capture(pos, self.capture_image) if triggered is not None else self.capture_image(pos)
+            exposures[pos] = float(getattr(w, "last_capture_exposure", None)
+                                   or getattr(w, "last_known_exposure_time", float("nan")))
+            return img
+
+        def process(_i, pos, img):
+            res = self.save_measure(img, pos, pos / step_size, raw_dir, pgm_dir, writer)
+            container.add_frame(img, z_mm=pos / step_size, z_steps=pos, exposure_us=exposures.get(pos),
+                                beam=res, name=str(pos / step_size))
+            return res
+
+        def on_result(_i, pos, res):
+            dx_list.append(res.Dx_mm)
+            dy_list.append(res.Dy_mm)
+            z_list.append(pos / step_size)
+
+            if m2_fitter is not None:
+                m2_fitter.add(pos / step_size, res.Dx_mm, res.Dy_mm)
+                return early_stop and m2_fitter.converged
+            return False
+
+        # Judesys + kadras nuosekliai, išsaugojimas + analizė lygiagrečiai (rezultatai z tvarka).
+        executor = PipelinedScanExecutor(
+            move_fn=move,
+            capture_fn=capture,
+            process_fn=process,
+            stop_flag=stop_flag,
+        )
+
+        try:
+            executor.run(track, on_result=on_result)
+        finally:
+            stats = writer.close()
+            print(f"Frame writer: {int(stats['frames'])} frames, {int(stats['batches'])} batches, "
+                  f"blocked {stats['blocked_s']:.2f} s, write {stats['write_s']:.2f} s")
+            try:
+                container.set_cooler(meta_rows)
+                container.close()
+            except Exception:
+                traceback.print_exc()
+            if triggered is not None:
+                triggered.stop()
+            if session is not None:
+                session.stop()
+
         meta_df = None
         try:
             meta_df = pd.DataFrame(meta_rows) if meta_rows else pd.DataFrame()
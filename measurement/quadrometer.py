@@ -2,7 +2,281 @@ import numpy as np
 import math
 import matplotlib.pyplot as plt
 from scipy.optimize import least_squares
-from typing import Dict
+from typing import Dict, List, Optional
+
+
+_NAN_FIT = {"ok": 0.0, "M2": float("nan"), "z0": float("nan"), "d0": float("nan"), "rmse_mm": float("nan")}
+
+_RADIUS_METRICS = ("d4sigma_radius", "4sigma_radius", "iso11146_radius", "1e2_radius", "fwhm_radius")
+
+
+def _metric_scale(metric) -> float:
+    # Spindulio metrikos -> diametras (fitas visada su diametrais); kitos paliekamos kaip yra.
+    return 2.0 if str(metric).lower() in _RADIUS_METRICS else 1.0
+
+
+def _seed_from_edges(z: np.ndarray, d: np.ndarray, lam_mm: float) -> np.ndarray:
+    # Euristinis startas: juosmuo ties min(d), M2 iš kraštinių taškų nuolydžio.
+    i0 = int(np.argmin(d))
+    z0_0 = float(z[i0])
+    d0_0 = float(max(np.min(d), 1e-12))
+
+    left = max(1, int(0.15 * z.size))
+    right = max(1, int(0.15 * z.size))
+    idxs = np.r_[np.arange(0, left), np.arange(z.size - right, z.size)]
+    idxs = np.unique(idxs)
+    if idxs.size < 2:
+        idxs = np.arange(z.size)
+
+    zz = z[idxs]
+    dd = d[idxs]
+    denom = np.maximum(np.abs(zz - z0_0), 1e-6)
+    slope = float(np.median(dd / denom))
+
+    M2_0 = float(max(slope * math.pi * d0_0 / (4.0 * lam_mm), 0.8))
+    return np.array([math.log(d0_0), z0_0, math.log(M2_0)], dtype=float)
+
+
+def fit_m2_linear(
+    z_mm: np.ndarray,
+    d_mm: np.ndarray,
+    lam_mm: float,
+    *,
+    min_points: int = 8,
+) -> Dict[str, float]:
+    """
+    Uždaro pavidalo ISO 11146 fitas: d^2 = A + B z + C z^2 (svertinis tiesinis MK).
+    z0 = -B/2C, d0 = sqrt((4AC - B^2)/4C), M2 = pi/(8 lam) * sqrt(4AC - B^2).
+    Be iteracijų - tinka live peržiūrai ir kaip tikslus startas Huber fitui.
+    """
+    z = np.asarray(z_mm, dtype=float)
+    d = np.asarray(d_mm, dtype=float)
+
+    ok = np.isfinite(z) & np.isfinite(d) & (d > 0)
+    z = z[ok]
+    d = d[ok]
+    if z.size < max(int(min_points), 3):
+        return dict(_NAN_FIT)
+
+    # sigma(d^2) ~ 2 d sigma(d) -> eilutes dalinam iš d; z centruojam dėl sąlygotumo.
+    zc = float(np.mean(z))
+    t = z - zc
+    wr = 1.0 / d
+    G = np.c_[np.ones_like(t), t, t * t] * wr[:, None]
+    coef, *_ = np.linalg.lstsq(G, d * d * wr, rcond=None)
+    A, B, C = (float(v) for v in coef)
+
+    disc = 4.0 * A * C - B * B
+    if not (np.isfinite(disc) and C > 0.0 and disc > 0.0):
+        return dict(_NAN_FIT)
+
+    z0 = zc - B / (2.0 * C)
+    d0 = math.sqrt(disc / (4.0 * C))
+    M2 = math.pi / (8.0 * float(lam_mm)) * math.sqrt(disc)
+
+    d_fit = np.sqrt(np.maximum(A + B * t + C * t * t, 0.0))
+    rmse = float(np.sqrt(np.mean((d_fit - d) ** 2)))
+    return {"ok": 1.0, "M2": float(M2), "z0": float(z0), "d0": float(d0), "rmse_mm": rmse, "nfev": 0.0}
+
+
+def fit_m2_from_d4sigma(
+    z_mm: np.ndarray,
+    d_mm: np.ndarray,
+    lam_mm: float,
+    *,
+    p0: Optional[np.ndarray] = None,
+    max_nfev: int = 8000,
+    min_points: int = 8,
+) -> Dict[str, float]:
+    """
+    Huber hiperbolės d(z) fitas. p0 = (ln d0, z0, ln M2) - warm start (pvz. iš ankstesnio fito);
+    be jo startuojama iš fit_m2_linear (o jei jis nepavyksta - euristinis startas).
+    *_std - 1 sigma iš Jakobiano (apytikslė).
+    """
+    z = np.asarray(z_mm, dtype=float)
+    d = np.asarray(d_mm, dtype=float)
+
+    ok = np.isfinite(z) & np.isfinite(d) & (d > 0)
+    z = z[ok]
+    d = d[ok]
+    if z.size < int(min_points):
+        return dict(_NAN_FIT)
+
+    if p0 is None or not np.all(np.isfinite(p0)):
+        lin = fit_m2_linear(z, d, lam_mm, min_points=min_points)
+        if lin["ok"] and lin["d0"] > 0.0 and lin["M2"] > 0.0:
+            p0 = np.array([math.log(lin["d0"]), lin["z0"], math.log(lin["M2"])], dtype=float)
+        else:
+            p0 = _seed_from_edges(z, d, lam_mm)
+
+    def model_d(zv: np.ndarray, p: np.ndarray) -> np.ndarray:
+        d0 = float(np.exp(p[0]))
+        z0 = float(p[1])
+        M2 = float(np.exp(p[2]))
+        a = (M2 * lam_mm) / (math.pi * d0)
+        d2 = (d0 * d0) + 16.0 * (a * a) * (zv - z0) * (zv - z0)
+        return np.sqrt(np.maximum(d2, 0.0))
+
+    def resid(p: np.ndarray) -> np.ndarray:
+        return model_d(z, p) - d
+
+    scale = float(np.median(np.abs(d - np.median(d))))
+    if not np.isfinite(scale) or scale <= 0:
+        scale = 1.0
+
+    res = least_squares(resid, p0, loss="huber", f_scale=scale, max_nfev=int(max_nfev))
+
+    d0 = float(np.exp(res.x[0]))
+    z0 = float(res.x[1])
+    M2 = float(np.exp(res.x[2]))
+
+    d_fit = model_d(z, res.x)
+    rmse = float(np.sqrt(np.mean((d_fit - d) ** 2)))
+
+    # Kovariacija ~ s^2 (J^T J)^-1; ln parametrams sigma -> santykinė paklaida.
+    std = np.full(3, np.nan)
+    dof = z.size - 3
+    if dof > 0:
+        try:
+            s2 = float(np.sum((d_fit - d) ** 2)) / dof
+            cov = np.linalg.pinv(res.jac.T @ res.jac) * s2
+            std = np.sqrt(np.maximum(np.diag(cov), 0.0))
+        except Exception:
+            pass
+
+    return {
+        "ok": 1.0, "M2": M2, "z0": z0, "d0": d0, "rmse_mm": rmse,
+        "M2_std": M2 * float(std[2]), "z0_std": float(std[1]), "d0_std": d0 * float(std[0]),
+        "nfev": float(res.nfev),
+    }
+
+
+class OnlineM2Fitter:
+    """
+    M2 fitas, atnaujinamas po kiekvieno skenavimo taško (z, Dx, Dy mm, diametrai).
+    Kiekvienas fitas startuoja iš ankstesnio sprendinio, todėl užtenka kelių iteracijų.
+    converged: juosmuo apsuptas taškais iš abiejų pusių, o M2 x/y paskutinius
+    stable_points kartų kito mažiau nei rel_tol ir jų sigma < rel_tol.
+
+    metric - tas pats, kas galutiniam compute_m2_hyperbola (spindulio metrikos dauginamos iš 2),
+    kad ankstyvas sustojimas sektų tą patį dydį. z lango nėra: compute_m2_hyperbola z_window
+    nepritaiko (fituoja visus taškus), todėl ir čia naudojami visi z.
+    """
+
+    AXES = ("x", "y", "star")
+
+    def __init__(
+        self,
+        wavelength_mm: float,
+        *,
+        min_points: int = 8,
+        rel_tol: float = 0.02,
+        stable_points: int = 3,
+        min_points_per_side: int = 3,
+        max_nfev: int = 200,
+        metric: str = "d4sigma_diameter",
+    ):
+        self.lam_mm = float(wavelength_mm)
+        self.metric = metric
+        self._scale = _metric_scale(metric)
+        self.min_points = int(min_points)
+        self.rel_tol = float(rel_tol)
+        self.stable_points = int(stable_points)
+        self.min_points_per_side = int(min_points_per_side)
+        self.max_nfev = int(max_nfev)
+
+        self.z: List[float] = []
+        self.dx: List[float] = []
+        self.dy: List[float] = []
+        self._p: Dict[str, Optional[np.ndarray]] = {a: None for a in self.AXES}
+        self._history: List[tuple] = []
+        self.estimate: Optional[Dict[str, Dict[str, float]]] = None
+        self.converged = False
+
+    def __len__(self) -> int:
+        return len(self.z)
+
+    def add(self, z_mm: float, dx_mm: float, dy_mm: float) -> Optional[Dict[str, Dict[str, float]]]:
+        """Prideda tašką ir grąžina preliminarų {x, y, star} įvertį (None, kol taškų per mažai)."""
+        self.z.append(float(z_mm))
+        self.dx.append(self._scale * float(dx_mm))
+        self.dy.append(self._scale * float(dy_mm))
+        return self._refit()
+
+    def rebuild(self, z_mm, dx_mm, dy_mm) -> Optional[Dict[str, Dict[str, float]]]:
+        """
+        Taškų aibė pakeičiama nauja (pvz. po prune) ir fituojama iš naujo be ankstesnių
+        sprendinių ir istorijos - įvertis ir converged atitinka tik likusius taškus.
+        """
+        self.z = [float(v) for v in z_mm]
+        self.dx = [self._scale * float(v) for v in dx_mm]
+        self.dy = [self._scale * float(v) for v in dy_mm]
+        self._p = {a: None for a in self.AXES}
+        self._history = []
+        self.estimate = None
+        self.converged = False
+        return self._refit()
+
+    def _refit(self) -> Optional[Dict[str, Dict[str, float]]]:
+        if len(self.z) < self.min_points:
+            return None
+
+        z = np.asarray(self.z, dtype=float)
+        dx = np.asarray(self.dx, dtype=float)
+        dy = np.asarray(self.dy, dtype=float)
+        data = {"x": dx, "y": dy, "star": np.sqrt(np.maximum(dx, 0.0) * np.maximum(dy, 0.0))}
+
+        est: Dict[str, Dict[str, float]] = {}
+        for axis in self.AXES:
+            r = self._fit_axis(z, data[axis], self._p[axis])
+            if self._p[axis] is not None and not self._is_sane(r, data[axis]):
+                r = self._fit_axis(z, data[axis], None)
+            if self._is_sane(r, data[axis]):
+                self._p[axis] = np.array([math.log(r["d0"]), r["z0"], math.log(r["M2"])], dtype=float)
+            else:
+                self._p[axis] = None
+            est[axis] = r
+
+        self.estimate = est
+        self._history.append((est["x"]["M2"], est["y"]["M2"]))
+        self.converged = self._check_converged(z, est)
+        return est
+
+    def _fit_axis(self, z: np.ndarray, d: np.ndarray, p0: Optional[np.ndarray]) -> Dict[str, float]:
+        try:
+            return fit_m2_from_d4sigma(z, d, self.lam_mm, p0=p0,
+                                       max_nfev=self.max_nfev if p0 is not None else 8000,
+                                       min_points=self.min_points)
+        except Exception:
+            return dict(_NAN_FIT)
+
+    @staticmethod
+    def _is_sane(r: Dict[str, float], d: np.ndarray) -> bool:
+        # Kol juosmuo nepasiektas, fitas gali išsigimti (d0 -> 0, M2 -> 0) - nuo tokio nestartuojam.
+        if not r["ok"] or not (np.isfinite(r["M2"]) and np.isfinite(r["d0"])):
+            return False
+        dpos = d[np.isfinite(d) & (d > 0)]
+        return r["M2"] >= 0.5 and dpos.size > 0 and r["d0"] >= 0.1 * float(np.min(dpos))
+
+    def _check_converged(self, z: np.ndarray, est: Dict[str, Dict[str, float]]) -> bool:
+        if len(self._history) < self.stable_points:
+            return False
+
+        for axis in ("x", "y"):
+            r = est[axis]
+            if not r["ok"]:
+                return False
+            z0 = float(r["z0"])
+            if np.sum(z < z0) < self.min_points_per_side or np.sum(z > z0) < self.min_points_per_side:
+                return False
+            if not (float(r["M2_std"]) < self.rel_tol * float(r["M2"])):
+                return False
+
+        recent = np.asarray(self._history[-self.stable_points:], dtype=float)
+        if not np.all(np.isfinite(recent)):
+            return False
+        spread = (recent.max(axis=0) - recent.min(axis=0)) / np.maximum(np.abs(recent[-1]), 1e-12)
+        return bool(np.all(spread < self.rel_tol))
 
 
 def compute_m2_hyperbola(
@@ -12,6 +286,7 @@ def compute_m2_hyperbola(
     max_iter=8000,
     min_points=8,
     return_fig=False,
+    solver="robust",
     units="mm",
     title=None,
     figsize=(12, 7),
@@ -29,61 +304,6 @@ def compute_m2_hyperbola(
         d2 = (d0 * d0) + 16.0 * (a * a) * (zv - z0) * (zv - z0)
         return np.sqrt(np.maximum(d2, 0.0))
     
-    def fit_m2_from_d4sigma(z_mm: np.ndarray, d_mm: np.ndarray, lam_mm: float) -> Dict[str, float]:
-        z = np.asarray(z_mm, dtype=float)
-        d = np.asarray(d_mm, dtype=float)
-
-        ok = np.isfinite(z) & np.isfinite(d) & (d > 0)
-        z = z[ok]
-        d = d[ok]
-        if z.size < 8:
-            return {"ok": 0.0, "M2": float("nan"), "z0": float("nan"), "d0": float("nan"), "rmse_mm": float("nan")}
-
-        i0 = int(np.argmin(d))
-        z0_0 = float(z[i0])
-        d0_0 = float(max(np.min(d), 1e-12))
-
-        left = max(1, int(0.15 * z.size))
-        right = max(1, int(0.15 * z.size))
-        idxs = np.r_[np.arange(0, left), np.arange(z.size - right, z.size)]
-        idxs = np.unique(idxs)
-        if idxs.size < 2:
-            idxs = np.arange(z.size)
-
-        zz = z[idxs]
-        dd = d[idxs]
-        denom = np.maximum(np.abs(zz - z0_0), 1e-6)
-        slope = float(np.median(dd / denom))
-
-        M2_0 = float(max(slope * math.pi * d0_0 / (4.0 * lam_mm), 0.8))
-        p0 = np.array([math.log(d0_0), z0_0, math.log(M2_0)], dtype=float)
-
-        def model_d(zv: np.ndarray, p: np.ndarray) -> np.ndarray:
-            d0 = float(np.exp(p[0]))
-            z0 = float(p[1])
-            M2 = float(np.exp(p[2]))
-            a = (M2 * lam_mm) / (math.pi * d0)
-            d2 = (d0 * d0) + 16.0 * (a * a) * (zv - z0) * (zv - z0)
-            return np.sqrt(np.maximum(d2, 0.0))
-
-        def resid(p: np.ndarray) -> np.ndarray:
-            return model_d(z, p) - d
-
-        scale = float(np.median(np.abs(d - np.median(d))))
-        if not np.isfinite(scale) or scale <= 0:
-            scale = 1.0
-
-        res = least_squares(resid, p0, loss="huber", f_scale=scale, max_nfev=8000)
-
-        d0 = float(np.exp(res.x[0]))
-        z0 = float(res.x[1])
-        M2 = float(np.exp(res.x[2]))
-
-        d_fit = model_d(z, res.x)
-        rmse = float(np.sqrt(np.mean((d_fit - d) ** 2)))
-
-        return {"ok": 1.0, "M2": M2, "z0": z0, "d0": d0, "rmse_mm": rmse}
-
     def fit_m2_from_d4sigma_NOFILTER(z_mm: np.ndarray, d_mm: np.ndarray, lam_mm: float) -> dict:
         zloc = np.asarray(z_mm, dtype=float).ravel()
         dloc = np.asarray(d_mm, dtype=float).ravel()
@@ -178,18 +398,26 @@ def compute_m2_hyperbola(
     else:
         z_mm, dx_mm, dy_mm = z, dx, dy
 
-    m = str(metric).lower()
-    if m in ("d4sigma_radius", "4sigma_radius", "iso11146_radius", "1e2_radius", "fwhm_radius"):
-        dx_mm = 2.0 * dx_mm
-        dy_mm = 2.0 * dy_mm
+    scale = _metric_scale(metric)
+    if scale != 1.0:
+        dx_mm = scale * dx_mm
+        dy_mm = scale * dy_mm
 
     ok_mask = np.ones_like(z_mm, dtype=bool)
 
+    # solver="robust": Huber least_squares (startas iš tiesinio fito); "linear": tik uždaro pavidalo fitas.
+    if solver == "robust":
+        fit = lambda zv, dv, lam: fit_m2_from_d4sigma(zv, dv, lam, max_nfev=int(max_iter), min_points=int(min_points))
+    elif solver == "linear":
+        fit = lambda zv, dv, lam: fit_m2_linear(zv, dv, lam, min_points=int(min_points))
+    else:
+        raise ValueError("solver must be 'robust' or 'linear'")
+
     lam_mm = float(wavelength)
-    m2x = fit_m2_from_d4sigma(z_mm, dx_mm, lam_mm)
-    m2y = fit_m2_from_d4sigma(z_mm, dy_mm, lam_mm)
+    m2x = fit(z_mm, dx_mm, lam_mm)
+    m2y = fit(z_mm, dy_mm, lam_mm)
     dstar = np.sqrt(np.maximum(dx_mm, 0.0) * np.maximum(dy_mm, 0.0))  
-    m2s = fit_m2_from_d4sigma(z_mm, dstar, lam_mm)
+    m2s = fit(z_mm, dstar, lam_mm)
 
     m2x["M2"] = snap_m2_to_one(float(m2x["M2"]))
     m2y["M2"] = snap_m2_to_one(float(m2y["M2"]))
@@ -0,0 +1,242 @@
+import os
+import re
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from threading import Thread
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from measurement.calculations import (
+    BeamISO11146Result,
+    beam_size_iso11146_stack,
+    beam_size_iso11146_vendorlike,
+)
+from storage.frame_archive import FrameArchive, find_frame_archive
+from storage.raw_stack import RawStack, find_raw_stack, memmap_raw_frame
+from storage.run_container import RunContainer, find_run_container
+
+# Tie patys parametrai kaip beam_size_k4_fixed_axes (hand mode).
+BEAM_PARAMS = dict(
+    pixel_size_x_um=3.75,
+    pixel_size_y_um=3.75,
+    k=4.0,
+    border_px=30,
+    border_frac_min=0.08,
+    max_iters=40,
+    rel_tol=1e-7,
+    pixel_center=True,
+    bg_mode="plane",
+    bg_stat="median",
+    noise_nsigma=None,
+    ignore_saturated=False,
+    engine="auto",
+)
+
+FRAME_EXTS = (".pgm", ".raw", ".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff", ".npy")
+
+
+def default_workers() -> int:
+    # Windows ProcessPoolExecutor leidžia ne daugiau 61 proceso.
+    return max(1, min(61, os.cpu_count() or 1))
+
+
+def resolve_frames_dir(folder: str) -> str:
+    """M2_Data_* folderiui grąžina pgm/ (jei yra), kitu atveju raw/; kitaip patį folderį."""
+    for sub in ("pgm", "raw"):
+        d = os.path.join(folder, sub)
+        if os.path.isdir(d) and any(n.lower().endswith(FRAME_EXTS) for n in os.listdir(d)):
+            return d
+    return folder
+
+
+def list_frames(folder: str) -> List[Tuple[float, str]]:
+    """
+    (z, path) poros, surikiuotos pagal z (z imamas iš failo pavadinimo, kaip read_data_folder).
+    Jei folderyje yra run.m2z konteineris, kadrai imami iš jo: path = "<run.m2z>#<kadro nr.>".
+    Taip pat ir su raw_frames.m2a archyvu (folderis arba pats .m2a failas) bei sujungtu
+    raw_stack.npy (RawStack.write_stack_file).
+    """
+    container = find_run_container(folder) if os.path.isdir(folder) else None
+    if container is not None:
+        with RunContainer(container, sort_by_z=False) as rc:
+            items = [(float(r["z_mm"]), f"{container}#{i}") for i, r in enumerate(rc.records)]
+        items.sort(key=lambda t: t[0])
+        return items
+
+    archive = find_frame_archive(folder)
+    if archive is not None:
+        with FrameArchive(archive) as fa:
+            items = [(float(z), f"{archive}#{i}") for i, z in enumerate(fa.z_mm) if np.isfinite(z)]
+        items.sort(key=lambda t: t[0])
+        return items
+
+    stack_file = find_raw_stack(folder)
+    if stack_file is not None:
+        stack = RawStack.from_stack_file(stack_file)
+        items = [(float(z), f"{stack_file}#{i}") for i, z in enumerate(stack.z_mm) if np.isfinite(z)]
+        stack.close()
+        items.sort(key=lambda t: t[0])
+        return items
+
+    frames_dir = resolve_frames_dir(folder)
+    items = []
+    for name in os.listdir(frames_dir):
+        if not name.lower().endswith(FRAME_EXTS):
+            continue
+        m = re.search(r"(-?\d+(\.\d+)?)", name)
+        if not m:
+            continue
+        items.append((float(m.group(1)), os.path.join(frames_dir, name)))
+    items.sort(key=lambda t: t[0])
+    return items
+
+
+def _container_frame(path: str, readers: Optional[Dict[str, object]]) -> np.ndarray:
+    # "<run.m2z>#i" / "<.m2a>#i" / "<raw_stack.npy>#i": su readers atidarytas konteineris (zip + run.json/index.json)
+    # naudojamas visiems to paties failo kadrams; uždaro tas, kas readers sukūrė.
+    source, i = path.rsplit("#", 1)
+    reader = readers.get(source) if readers is not None else None
+    if reader is None:
+        if source.lower().endswith(".m2z"):
+            reader = RunContainer(source, sort_by_z=False)
+        elif source.lower().endswith(".npy"):
+            reader = RawStack.from_stack_file(source)
+        else:
+            reader = FrameArchive(source)
+        if readers is None:
+            with reader:
+                return reader.frame(int(i))
+        readers[source] = reader
+    return reader.frame(int(i))
+
+
+def decode_frame(path: str, width: Optional[int] = None, height: Optional[int] = None,
+                 readers: Optional[Dict[str, object]] = None) -> Optional[np.ndarray]:
+    low = path.lower()
+    if ".m2z#" in low or ".m2a#" in low or ".npy#" in low:
+        return _container_frame(path, readers)
+
+    if low.endswith(".npy"):
+        return np.load(path)
+
+    if low.endswith(".raw"):
+        if not width or not height:
+            raise ValueError(f"{os.path.basename(path)}: .raw needs width/height")
+        return memmap_raw_frame(path, int(width), int(height))
+
+    arr = cv2.imread(path, cv2.IMREAD_UNCHANGED)
+    if arr is not None and arr.ndim == 3:
+        arr = cv2.cvtColor(arr, cv2.COLOR_BGR2GRAY)
+    return arr
+
+
+def _analyse_chunk(task) -> List[Tuple[float, str, Optional[BeamISO11146Result]]]:
+    # Vykdoma proceso baseine: dekoduoja savo kadrų dalį ir analizuoja ją vienu stack kvietimu.
+    chunk, width, height, params = task
+    zs, paths, frames = [], [], []
+    out: List[Tuple[float, str, Optional[BeamISO11146Result]]] = []
+
+    # Atskiri .raw kadrai - vienas RawStack visai daliai (memmap, be kopijų).
+    raw = [(z, p) for z, p in chunk if p.lower().endswith(".raw")]
+    raw_frames = {}
+    if raw and width and height:
+        stack = RawStack.from_paths([p for _z, p in raw], int(width), int(height))
+        for k, (_z, p) in enumerate(raw):
+            try:
+                raw_frames[p] = stack[k]
+            except Exception:
+                traceback.print_exc()
+                raw_frames[p] = None
+
+    readers: Dict[str, object] = {}
+    try:
+        for z, path in chunk:
+            try:
+                arr = raw_frames[path] if path in raw_frames else decode_frame(path, width, height, readers)
+            except Exception:
+                traceback.print_exc()
+                arr = None
+            if arr is None or arr.ndim != 2:
+                out.append((z, path, None))
+                continue
+            zs.append(z)
+            paths.append(path)
+            frames.append(arr)
+    finally:
+        for reader in readers.values():
+            reader.close()
+
+    if frames and all(f.shape == frames[0].shape for f in frames):
+        stack = beam_size_iso11146_stack(frames, **params)
+        out.extend((z, p, stack.frame(i)) for i, (z, p) in enumerate(zip(zs, paths)))
+    else:
+        for z, p, f in zip(zs, paths, frames):
+            out.append((z, p, beam_size_iso11146_vendorlike(f, roi=True, **params)))
+
+    out.sort(key=lambda t: t[0])
+    return out
+
+
+def reanalyse_folder(
+    folder: str,
+    *,
+    max_workers: Optional[int] = None,
+    frames_per_task: int = 4,
+    width: Optional[int] = None,
+    height: Optional[int] = None,
+    params: Optional[dict] = None,
+) -> Iterator[Tuple[float, str, Optional[BeamISO11146Result]]]:
+    """
+    Išsaugoto matavimo folderio (raw/ ar pgm/, kaip rašo storage.converter._save_data)
+    peranalizavimas per ProcessPoolExecutor. Rezultatai grąžinami z tvarka, kai tik
+    paruošiama kita dalis; None vietoje rezultato - kadro nepavyko nuskaityti.
+    """
+    frames = list_frames(folder)
+    if not frames:
+        return
+
+    if width is None or height is None:
+        from config.models import CameraDefaults
+        defaults = CameraDefaults()
+        width = width or int(defaults.width or 0) or None
+        height = height or int(defaults.height or 0) or None
+
+    params = dict(BEAM_PARAMS if params is None else params)
+    step = max(int(frames_per_task), 1)
+    tasks = [(frames[i:i + step], width, height, params) for i in range(0, len(frames), step)]
+
+    workers = min(max_workers or default_workers(), len(tasks))
+    with ProcessPoolExecutor(max_workers=workers) as ex:
+        for results in ex.map(_analyse_chunk, tasks):
+            yield from results
+
+
+def reanalyse_folder_async(
+    folder: str,
+    on_result: Optional[Callable[[float, str, Optional[BeamISO11146Result]], None]] = None,
+    on_done: Optional[Callable[[List[Tuple[float, str, Optional[BeamISO11146Result]]]], None]] = None,
+    on_error: Optional[Callable[[Exception], None]] = None,
+    **kwargs,
+) -> Thread:
+    """reanalyse_folder foniniame thread'e; callback'ai kviečiami iš to thread'o (UI -> per ui_call)."""
+
+    def run():
+        collected = []
+        try:
+            for z, path, res in reanalyse_folder(folder, **kwargs):
+                collected.append((z, path, res))
+                if on_result is not None:
+                    on_result(z, path, res)
+        except Exception as e:
+            traceback.print_exc()
+            if on_error is not None:
+                on_error(e)
+            return
+        if on_done is not None:
+            on_done(collected)
+
+    t = Thread(target=run, daemon=True)
+    t.start()
+    return t
@@ -0,0 +1,128 @@
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+class PipelinedScanExecutor:
+    """
+    Judesys/kadras eina nuosekliai, o išsaugojimas ir analizė - worker thread'uose.
+    Kitas judesys paleidžiamas iškart po kadro, todėl ašis nelaukia analizės ir disko.
+    Laukiančių kadrų skaičius ribojamas max_pending (atmintis), rezultatai grąžinami
+    ir on_result kviečiamas pozicijų tvarka.
+
+    move_fn(pos), capture_fn(pos) -> img | None, process_fn(i, pos, img) -> res | None.
+    """
+
+    def __init__(
+        self,
+        move_fn: Callable[[int], Any],
+        capture_fn: Callable[[int], Any],
+        process_fn: Callable[[int, int, Any], Any],
+        *,
+        max_workers: int = 2,
+        max_pending: int = 4,
+        stop_flag: Optional[Callable[[], bool]] = None,
+    ):
+        self.move_fn = move_fn
+        self.capture_fn = capture_fn
+        self.process_fn = process_fn
+        self.max_workers = max(int(max_workers), 1)
+        self.max_pending = max(int(max_pending), 1)
+        self.stop_flag = stop_flag or (lambda: False)
+
+    def run(
+        self,
+        positions,
+        on_result: Optional[Callable[[int, int, Any], Optional[bool]]] = None,
+    ) -> List[Tuple[int, int, Any]]:
+        """
+        Grąžina [(i, pos, res)] pozicijų tvarka (be nepavykusių kadrų).
+        on_result(i, pos, res) gali grąžinti True - tada nauji judesiai nebeleidžiami.
+        """
+        slots = threading.BoundedSemaphore(self.max_pending)
+        lock = threading.Lock()
+        deliver_lock = threading.Lock()
+        done: Dict[int, Tuple[int, Any]] = {}
+        ordered: List[Tuple[int, int, Any]] = []
+        state = {"next": 0, "stop": False}
+
+        def ready():
+            # Kviečiama su lock: paeiliui paimami visi jau paruošti rezultatai.
+            batch = []
+            while state["next"] in done:
+                i = state["next"]
+                pos, res = done.pop(i)
+                state["next"] += 1
+                if res is not None:
+                    batch.append((i, pos, res))
+            return batch
+
+        def deliver():
+            # on_result (pvz. online M2 fitas) kviečiamas be lock, todėl judesių ciklas jo nelaukia.
+            # Tvarką laiko deliver_lock: jį turintis thread'as perduoda ir kitų paruoštus
+            # rezultatus, o kiti nelaukia ir grįžta.
+            while deliver_lock.acquire(blocking=False):
+                try:
+                    while True:
+                        with lock:
+                            batch = ready()
+                        if not batch:
+                            break
+                        for i, pos, res in batch:
+                            ordered.append((i, pos, res))
+                            if on_result is None:
+                                continue
+                            try:
+                                if on_result(i, pos, res):
+                                    with lock:
+                                        state["stop"] = True
+                            except Exception:
+                                traceback.print_exc()
+                finally:
+                    deliver_lock.release()
+                # Rezultatas galėjo atsirasti tarp paskutinio ready() ir release().
+                with lock:
+                    if state["next"] not in done:
+                        return
+
+        def job(i, pos, img):
+            res = None
+            try:
+                res = self.process_fn(i, pos, img)
+            except Exception:
+                traceback.print_exc()
+            finally:
+                with lock:
+                    done[i] = (pos, res)
+                slots.release()
+                deliver()
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as ex:
+            for i, pos in enumerate(positions):
+                slots.acquire()
+                with lock:
+                    stop = state["stop"]
+                if stop or self.stop_flag():
+                    slots.release()
+                    break
+
+                img = None
+                try:
+                    self.move_fn(pos)
+                    img = self.capture_fn(pos)
+                except Exception as e:
+                    print(f"Scan error at pos {pos}: {e}")
+                    traceback.print_exc()
+
+                if img is None:
+                    # Perduos kito kadro job'as (arba galutinis deliver()) - judesių ciklas on_result nelaukia.
+                    with lock:
+                        done[i] = (pos, None)
+                    slots.release()
+                    continue
+
+                ex.submit(job, i, pos, img)
+
+        deliver()
+        return ordered
@@ -0,0 +1,116 @@
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+
+class PositionLatency:
+    """Kiekvienos skenavimo pozicijos laikų suskirstymas (s) ir jų suvestinė."""
+
+    PHASES = ("command_s", "in_position_s", "detect_s", "trigger_s", "capture_s", "total_s")
+
+    def __init__(self):
+        self.rows: List[Dict[str, Any]] = []
+
+    def add(self, pos: int, **phases) -> None:
+        row = {"pos": int(pos)}
+        row.update(phases)
+        self.rows.append(row)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        out = {}
+        for phase in self.PHASES:
+            values = np.array([r[phase] for r in self.rows if r.get(phase) is not None], dtype=np.float64)
+            if values.size == 0:
+                continue
+            out[phase] = {
+                "median": float(np.median(values)),
+                "p95": float(np.percentile(values, 95)),
+                "max": float(values.max()),
+                "sum": float(values.sum()),
+            }
+        return out
+
+    def report(self, title: str = "Triggered capture") -> str:
+        lines = [f"{title}: {len(self.rows)} positions"]
+        for phase, s in self.summary().items():
+            lines.append(f"  {phase:<14} median {s['median'] * 1000:8.1f} ms  p95 {s['p95'] * 1000:8.1f} ms  "
+                         f"max {s['max'] * 1000:8.1f} ms  total {s['sum']:.2f} s")
+        return "\n".join(lines)
+
+
+class TriggeredCapture:
+    """
+    Kadras tik ašiai sustojus: judesys laukia in-position, tada TriggerSoftware -> lygiai
+    vienas kadras (start() perjungia kamerą į programinį trigerį, stop() grąžina ir spausdina suvestinę).
+    Jei kamera trigerio nepalaiko, kadrai imami iš srauto (frame_after), bet vis tiek po judesio.
+
+    go_to/home atitinka AxisService, todėl objektą galima perduoti find_focus_adaptive.
+    Kiekvienai pozicijai įrašoma: komanda, laukimas in-position (ir jo patvirtinimo vėlavimas),
+    trigeris -> kadras, visas kadras (su saturacijos pakartojimais) ir viso judesys -> kadras.
+    """
+
+    def __init__(self, session, axis_service, axis_no: int = 0, title: str = "Triggered capture"):
+        self.session = session
+        self.axis_service = axis_service
+        self.axis_no = int(axis_no)
+        self.title = title
+        self.triggered = False
+        self.latency = PositionLatency()
+        self._move: Optional[Dict[str, float]] = None
+
+    def start(self) -> "TriggeredCapture":
+        if self.session is not None:
+            self.triggered = self.session.set_software_trigger(True)
+        if not self.triggered:
+            print("Software trigger unavailable, capturing from the free-running stream after each move")
+        return self
+
+    def stop(self) -> None:
+        if self.triggered:
+            self.session.set_software_trigger(False)
+            self.triggered = False
+        if self.latency.rows:
+            print(self.latency.report(self.title))
+            self.latency = PositionLatency()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+    def go_to(self, axis_no: int, pos: int, queries=None):
+        t0 = time.monotonic()
+        replies = self.axis_service.go_to(axis_no, int(pos), wait=True, queries=queries)
+        timing = getattr(self.axis_service.controller, "last_move_timing", None) or {}
+        self._move = {
+            "t0": t0,
+            "command_s": timing.get("command_s"),
+            "in_position_s": timing.get("in_position_s"),
+            "detect_s": timing.get("detect_s"),
+        }
+        return replies
+
+    def home(self, axis_no: int) -> None:
+        self.axis_service.home(axis_no)
+
+    def move(self, pos: int, queries=None):
+        return self.go_to(self.axis_no, pos, queries=queries)
+
+    def capture(self, pos: int, capture_fn: Callable[[int], Any]):
+        move, self._move = self._move or {}, None
+        t0 = time.monotonic()
+        img = capture_fn(pos)
+        t1 = time.monotonic()
+        self.latency.add(
+            pos,
+            command_s=move.get("command_s"),
+            in_position_s=move.get("in_position_s"),
+            detect_s=move.get("detect_s"),
+            trigger_s=self.session.last_trigger_s if self.triggered else None,
+            capture_s=t1 - t0,
+            total_s=t1 - move.get("t0", t0),
+        )
+        return img
@@ -5,6 +5,8 @@ from pathlib import Path
 import numpy as np
 import cv2
 
+from storage.raw_stack import memmap_raw_frame
+
 BAYER_MAP = {
     "bayerRG8": cv2.COLOR_BayerRG2BGR,
     "bayerBG8": cv2.COLOR_BayerBG2BGR,
@@ -13,26 +15,17 @@ BAYER_MAP = {
 }
 
 def read_raw(path: Path, width: int, height: int, fmt: str) -> np.ndarray:
-    data = path.read_bytes()
-
+    # memmap - failas neperskaitomas į atskirą bytes buferį. Kol grąžintas masyvas gyvas,
+    # .raw failas atidarytas (Windows neleis jo ištrinti) - convert_folder jį paleidžia po imwrite.
     if fmt == "mono8":
-        expected = width * height
-        if len(data) < expected:
-            raise ValueError(f"{path.name}: per mažas failas ({len(data)} B), reikia {expected} B")
-        return np.frombuffer(data[:expected], dtype=np.uint8).reshape((height, width))
+        return memmap_raw_frame(str(path), width, height, np.uint8)
 
     if fmt == "mono16":
-        expected = width * height * 2
-        if len(data) < expected:
-            raise ValueError(f"{path.name}: per mažas failas ({len(data)} B), reikia {expected} B")
-        return np.frombuffer(data[:expected], dtype=np.uint16).reshape((height, width))
+        return memmap_raw_frame(str(path), width, height, np.uint16)
 
     if fmt in BAYER_MAP:
-        expected = width * height
-        if len(data) < expected:
-            raise ValueError(f"{path.name}: per mažas failas ({len(data)} B), reikia {expected} B")
-        raw = np.frombuffer(data[:expected], dtype=np.uint8).reshape((height, width))
-        return cv2.cvtColor(raw, BAYER_MAP[fmt])
+        raw = memmap_raw_frame(str(path), width, height, np.uint8)
+        return cv2.cvtColor(np.asarray(raw), BAYER_MAP[fmt])
 
     raise ValueError(f"Nežinomas fmt: {fmt}. Naudok: mono8, mono16, bayerRG8, bayerBG8, bayerGR8, bayerGB8")
 
@@ -15,6 +15,7 @@ from devices.laser.laser_service import LaserService
 from measurement.measurement_service import MeasurementService
 from storage.storage_service import StorageService
 from storage.converter import _save_data
+from devices.camera.frame_pool import shared_frame
 from measurement.focus import generate_track_by_focus
 
 
@@ -174,7 +175,7 @@ class CameraWorker:
             return None, None
 
         filename = str(int(idx))
-        self.images_dict[filename] = img.copy()
+        self.images_dict[filename] = shared_frame(img)
         _save_data(self, raw_dir, pgm_dir, img, filename, position, position)
 
         res = self.beam(img)
@@ -0,0 +1,186 @@
+import hashlib
+import json
+import os
+import re
+import struct
+import threading
+import zipfile
+import zlib
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+ARCHIVE_NAME = "raw_frames.m2a"
+
+# Kadro įrašo antraštė: magic, prediktorius (0 - nėra, 1 - kairys kaimynas), H, W, dtype.
+_MAGIC = b"M2F1"
+_HEADER = struct.Struct("<4sBII8s")
+_PRED_NONE = 0
+_PRED_LEFT = 1
+
+
+def _deflate(buf, level: int) -> bytes:
+    # Z_RLE: beam kadruose dominuoja triukšmingas tamsus fonas, tad LZ77 paieška beveik
+    # nieko neduoda - RLE + Huffman spaudžia panašiai ar geriau ir ~10x greičiau.
+    c = zlib.compressobj(level, zlib.DEFLATED, 15, 9, zlib.Z_RLE)
+    return c.compress(buf) + c.flush()
+
+
+def encode_frame(image, level: int = 6) -> bytes:
+    """
+    Lossless kadro kodavimas: bandomi du variantai (be prediktoriaus ir kairio kaimyno
+    skirtumas mod 2^bits) ir paliekamas mažesnis. Skirtumas padeda ant lygaus pluošto
+    ir soties plokščių, triukšmingam fonui geriau be jo.
+    """
+    arr = np.ascontiguousarray(image)
+    if arr.ndim != 2:
+        raise ValueError(f"encode_frame: reikia [H, W], yra {arr.shape}")
+    if arr.dtype.kind not in "ui":
+        raise ValueError(f"encode_frame: nepalaikomas dtype {arr.dtype}")
+
+    best_pred, best = _PRED_NONE, _deflate(arr, level)
+    diff = arr.copy()
+    np.subtract(arr[:, 1:], arr[:, :-1], out=diff[:, 1:])
+    alt = _deflate(diff, level)
+    if len(alt) < len(best):
+        best_pred, best = _PRED_LEFT, alt
+
+    h, w = arr.shape
+    header = _HEADER.pack(_MAGIC, best_pred, h, w, arr.dtype.str.encode("ascii"))
+    return header + best
+
+
+def decode_frame_bytes(payload: bytes) -> np.ndarray:
+    magic, pred, h, w, dt = _HEADER.unpack_from(payload, 0)
+    if magic != _MAGIC:
+        raise ValueError("not an M2 archive frame")
+    dtype = np.dtype(dt.rstrip(b"\0").decode("ascii"))
+    arr = np.frombuffer(zlib.decompress(payload[_HEADER.size:]), dtype=dtype).reshape(h, w)
+    if pred == _PRED_LEFT:
+        # cumsum tame pačiame dtype persisuka mod 2^bits - tiksliai atstato originalą
+        return np.cumsum(arr, axis=1, dtype=dtype)
+    return arr.copy()
+
+
+def frame_digest(image) -> str:
+    """Kadro turinio hash (dtype, forma ir pikseliai) - ar archyve tas pats kadras, ne tik vardas."""
+    arr = np.ascontiguousarray(image)
+    h = hashlib.blake2b(digest_size=16)
+    h.update(f"{arr.dtype.str}{arr.shape}".encode("ascii"))
+    h.update(memoryview(arr).cast("B"))
+    return h.hexdigest()
+
+
+def _z_from_name(name: str) -> Optional[float]:
+    m = re.search(r"(-?\d+(\.\d+)?)", str(name))
+    return float(m.group(1)) if m else None
+
+
+class FrameArchiveWriter:
+    """
+    Viso matavimo raw kadrai viename faile (zip be papildomo spaudimo, kiekvienas kadras
+    suspaustas encode_frame), kad į SMB keliautų vienas didelis failas vietoj šimtų mažų.
+    add() galima kviesti iš kelių thread'ų.
+    """
+
+    def __init__(self, path: str, *, level: int = 6, meta: Optional[Dict[str, Any]] = None):
+        self.path = path
+        self.level = int(level)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._zf = zipfile.ZipFile(path, "w", compression=zipfile.ZIP_STORED, allowZip64=True)
+        self._lock = threading.Lock()
+        self._frames: List[Dict[str, Any]] = []
+        self._meta: Dict[str, Any] = dict(meta or {})
+        self._raw_bytes = 0
+        self._stored_bytes = 0
+        self._closed = False
+
+    def add(self, name, image, *, z_mm: Optional[float] = None) -> int:
+        payload = encode_frame(image, self.level)
+        z = z_mm if z_mm is not None else _z_from_name(name)
+        rec = {"name": str(name), "z_mm": float(z) if z is not None else None, "digest": frame_digest(image)}
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("FrameArchiveWriter is closed")
+            i = len(self._frames)
+            rec["member"] = f"frames/{i:06d}.m2f"
+            self._zf.writestr(rec["member"], payload)
+            self._frames.append(rec)
+            self._raw_bytes += int(np.asarray(image).nbytes)
+            self._stored_bytes += len(payload)
+            return i
+
+    def ratio(self) -> float:
+        with self._lock:
+            return self._stored_bytes / self._raw_bytes if self._raw_bytes else 1.0
+
+    def close(self) -> str:
+        with self._lock:
+            if self._closed:
+                return self.path
+            self._closed = True
+            index = {"version": 1, "meta": self._meta, "frames": self._frames}
+            self._zf.writestr("index.json", json.dumps(index))
+            self._zf.close()
+        return self.path
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+def write_frame_archive(path: str, items, *, level: int = 6, meta: Optional[Dict[str, Any]] = None) -> str:
+    """items: (vardas, kadras) poros, pvz. images_dict.items()."""
+    with FrameArchiveWriter(path, level=level, meta=meta) as w:
+        for name, image in items:
+            w.add(name, image)
+    return path
+
+
+class FrameArchive:
+    """Archyvo skaitymas: kadrai įrašymo tvarka, frame(i) dekoduoja tik vieną kadrą."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._zf = zipfile.ZipFile(path, "r")
+        index = json.loads(self._zf.read("index.json"))
+        self.records: List[Dict[str, Any]] = index.get("frames", [])
+        self.meta: Dict[str, Any] = index.get("meta", {})
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    @property
+    def names(self) -> List[str]:
+        return [r["name"] for r in self.records]
+
+    @property
+    def z_mm(self) -> np.ndarray:
+        return np.array([np.nan if r.get("z_mm") is None else r["z_mm"] for r in self.records], dtype=float)
+
+    def frame(self, i: int) -> np.ndarray:
+        return decode_frame_bytes(self._zf.read(self.records[i]["member"]))
+
+    def items(self) -> Iterator[Tuple[str, np.ndarray]]:
+        for i, r in enumerate(self.records):
+            yield r["name"], self.frame(i)
+
+    def close(self) -> None:
+        self._zf.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+def find_frame_archive(folder: str) -> Optional[str]:
+    if os.path.isfile(folder) and folder.lower().endswith(".m2a"):
+        return folder
+    path = os.path.join(folder, ARCHIVE_NAME)
+    return path if os.path.isfile(path) else None
@@ -0,0 +1,140 @@
+import os
+import shutil
+import tempfile
+import threading
+import weakref
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from storage.converter import _safe_name
+
+
+class FrameStore(MutableMapping):
+    """
+    images_dict pakaitalas: dict API (items/keys/pop/in), bet RAM'e laikoma ne daugiau
+    budget_bytes. Seniausiai naudoti kadrai (LRU) iškeliami į diską: jei kadrui nurodytas jau
+    įrašytas .raw failas (backing_path) - tiesiog pamirštama RAM kopija, kitaip kadras
+    įrašomas į laikiną spill katalogą. Iškelti kadrai grąžinami kaip read-only np.memmap.
+    Raktų tvarka = įdėjimo tvarka (kaip dict), todėl GIF kadrų seka nesikeičia.
+    """
+
+    def __init__(self, budget_bytes: int = 512 * 2 ** 20, spill_dir: Optional[str] = None):
+        self.budget_bytes = int(budget_bytes)
+        self._lock = threading.RLock()
+        self._order: Dict[str, None] = {}
+        self._ram: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._ram_bytes = 0
+        # key -> (path, shape, dtype, owned)
+        self._disk: Dict[str, Tuple[str, tuple, np.dtype, bool]] = {}
+        self._backing: Dict[str, str] = {}
+        self._spill_dir = spill_dir
+        self._finalizer = None
+
+    # --- MutableMapping ---
+    def __setitem__(self, key, arr) -> None:
+        self.put(key, arr)
+
+    def __getitem__(self, key) -> np.ndarray:
+        key = str(key)
+        with self._lock:
+            arr = self._ram.get(key)
+            if arr is not None:
+                self._ram.move_to_end(key)
+                return arr
+            if key not in self._disk:
+                raise KeyError(key)
+            path, shape, dtype, _owned = self._disk[key]
+        return np.memmap(path, dtype=dtype, mode="r", shape=shape)
+
+    def __delitem__(self, key) -> None:
+        key = str(key)
+        with self._lock:
+            if key not in self._order:
+                raise KeyError(key)
+            del self._order[key]
+            self._backing.pop(key, None)
+            arr = self._ram.pop(key, None)
+            if arr is not None:
+                self._ram_bytes -= arr.nbytes
+            disk = self._disk.pop(key, None)
+        if disk is not None and disk[3]:
+            try:
+                os.remove(disk[0])
+            except OSError:
+                pass
+
+    def __iter__(self):
+        with self._lock:
+            return iter(list(self._order))
+
+    def __len__(self) -> int:
+        return len(self._order)
+
+    def __contains__(self, key) -> bool:
+        return str(key) in self._order
+
+    # --- papildomai ---
+    def put(self, key, arr, backing_path: Optional[str] = None) -> None:
+        """Įdeda kadrą; backing_path - jau įrašytas (ar rašomas) .raw su tais pačiais baitais."""
+        key = str(key)
+        arr = np.asarray(arr)
+        if key in self._order:
+            del self[key]
+        with self._lock:
+            self._order[key] = None
+            self._ram[key] = arr
+            self._ram_bytes += arr.nbytes
+            if backing_path:
+                self._backing[key] = str(backing_path)
+            self._evict()
+
+    def attach_file(self, key, backing_path: str) -> None:
+        with self._lock:
+            if str(key) in self._order:
+                self._backing[str(key)] = str(backing_path)
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                "frames": float(len(self._order)),
+                "ram_frames": float(len(self._ram)),
+                "ram_bytes": float(self._ram_bytes),
+                "disk_frames": float(len(self._disk)),
+                "budget_bytes": float(self.budget_bytes),
+            }
+
+    def close(self) -> None:
+        self.clear()
+        if self._finalizer is not None:
+            self._finalizer()
+
+    def _evict(self) -> None:
+        # Kviečiama su lock. Paskutinis (ką tik įdėtas) kadras RAM'e lieka visada.
+        while self._ram_bytes > self.budget_bytes and len(self._ram) > 1:
+            key, arr = self._ram.popitem(last=False)
+            self._ram_bytes -= arr.nbytes
+            try:
+                self._disk[key] = self._spill(key, arr)
+            except Exception:
+                # Nepavyko iškelti - paliekam RAM'e, kad nedingtų duomenys.
+                self._ram[key] = arr
+                self._ram.move_to_end(key, last=False)
+                self._ram_bytes += arr.nbytes
+                raise
+
+    def _spill(self, key: str, arr: np.ndarray):
+        arr = np.ascontiguousarray(arr)
+        path = self._backing.get(key)
+        # Backing .raw tinka tik jei jau pilnai įrašytas (FrameWriter gali dar nespėti).
+        if path and os.path.isfile(path) and os.path.getsize(path) == arr.nbytes:
+            return path, arr.shape, arr.dtype, False
+
+        if self._spill_dir is None:
+            self._spill_dir = tempfile.mkdtemp(prefix="m2_frames_")
+            self._finalizer = weakref.finalize(self, shutil.rmtree, self._spill_dir, True)
+        path = os.path.join(self._spill_dir, f"{_safe_name(key)}.raw")
+        arr.tofile(path)
+        return path, arr.shape, arr.dtype, True
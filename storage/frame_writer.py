@@ -0,0 +1,153 @@
+import os
+import queue
+import threading
+import time
+import traceback
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from storage.converter import _pgm_payload, _safe_name, _save_data
+
+
+class FrameWriter:
+    """
+    Foninis raw/pgm rašytojas vienam matavimui (tas pats formatas kaip _save_data).
+    Katalogai sukuriami vieną kartą, kadrai rašomi partijomis atskirame thread'e.
+    Eilė ribota (max_queue): jei diskas nespėja, submit() laukia - tai matosi stats()
+    kaip back-pressure (blocked_puts / blocked_s).
+    """
+
+    def __init__(self, raw_dir, pgm_dir, *, max_queue: int = 32, batch_size: int = 8, fsync: bool = False):
+        self.raw_dir = Path(raw_dir).expanduser().resolve()
+        self.pgm_dir = Path(pgm_dir).expanduser().resolve()
+        self.raw_dir.mkdir(parents=True, exist_ok=True)
+        self.pgm_dir.mkdir(parents=True, exist_ok=True)
+
+        self.batch_size = max(int(batch_size), 1)
+        self.fsync = bool(fsync)
+        self._q: "queue.Queue" = queue.Queue(maxsize=max(int(max_queue), 1))
+        self._lock = threading.Lock()
+        self._stats: Dict[str, float] = {
+            "frames": 0.0, "bytes": 0.0, "batches": 0.0, "errors": 0.0,
+            "max_queue_depth": 0.0, "blocked_puts": 0.0, "blocked_s": 0.0,
+            "write_s": 0.0, "fsync_s": 0.0,
+        }
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def paths_for(self, base_name) -> Tuple[str, str]:
+        safe_name = _safe_name(base_name)
+        return str(self.raw_dir / f"{safe_name}.raw"), str(self.pgm_dir / f"{safe_name}.pgm")
+
+    def submit(self, image, base_name) -> Tuple[str, str]:
+        """Įdeda kadrą į eilę ir iškart grąžina būsimus (raw, pgm) kelius. Masyvo po to nekeisti."""
+        if self._closed:
+            raise RuntimeError("FrameWriter is closed")
+        item = (np.asarray(image), base_name)
+        try:
+            self._q.put_nowait(item)
+        except queue.Full:
+            t0 = time.perf_counter()
+            self._q.put(item)
+            with self._lock:
+                self._stats["blocked_puts"] += 1
+                self._stats["blocked_s"] += time.perf_counter() - t0
+        with self._lock:
+            self._stats["max_queue_depth"] = max(self._stats["max_queue_depth"], float(self._q.qsize()))
+        return self.paths_for(base_name)
+
+    def flush(self) -> None:
+        """Laukia, kol visi pateikti kadrai bus įrašyti (pvz. prieš prune_everything)."""
+        self._q.join()
+
+    def close(self) -> Dict[str, float]:
+        if not self._closed:
+            self._closed = True
+            self._q.put(None)
+            self._thread.join()
+        return self.stats()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            out = dict(self._stats)
+        out["queue_depth"] = float(self._q.qsize())
+        return out
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def _run(self):
+        while True:
+            item = self._q.get()
+            batch = [item]
+            while item is not None and len(batch) < self.batch_size:
+                try:
+                    item = self._q.get_nowait()
+                except queue.Empty:
+                    break
+                batch.append(item)
+
+            frames = [b for b in batch if b is not None]
+            if frames:
+                self._write_batch(frames)
+            for _ in batch:
+                self._q.task_done()
+            if batch[-1] is None:
+                return
+
+    def _write_file(self, path, chunks) -> float:
+        # Grąžina fsync laiką (0, jei fsync išjungtas).
+        with open(path, "wb") as f:
+            for c in chunks:
+                f.write(c)
+            if not self.fsync:
+                return 0.0
+            f.flush()
+            t1 = time.perf_counter()
+            os.fsync(f.fileno())
+            return time.perf_counter() - t1
+
+    def _write_batch(self, frames):
+        t0 = time.perf_counter()
+        fsync_s = 0.0
+        nbytes = 0
+        errors = 0
+        for image, base_name in frames:
+            try:
+                raw_path, pgm_path = self.paths_for(base_name)
+                raw = np.ascontiguousarray(image)
+                fsync_s += self._write_file(raw_path, (raw,))
+                nbytes += raw.nbytes
+
+                data, maxval = _pgm_payload(image)
+                h, w = int(data.shape[0]), int(data.shape[1])
+                header = f"P5\n{w} {h}\n{maxval}\n".encode("ascii")
+                data = np.ascontiguousarray(data)
+                fsync_s += self._write_file(pgm_path, (header, data))
+                nbytes += len(header) + data.nbytes
+            except Exception:
+                errors += 1
+                print(f"[ERR] Failed to save data: {base_name}")
+                traceback.print_exc()
+
+        with self._lock:
+            self._stats["frames"] += len(frames) - errors
+            self._stats["bytes"] += nbytes
+            self._stats["batches"] += 1
+            self._stats["errors"] += errors
+            self._stats["write_s"] += time.perf_counter() - t0
+            self._stats["fsync_s"] += fsync_s
+
+
+def persist_frame(writer: Optional[FrameWriter], owner, raw_dir, pgm_dir, image, base_name, position):
+    # Su writer - į eilę, be jo - sinchroniškai kaip anksčiau.
+    if writer is not None:
+        return writer.submit(image, base_name)
+    return _save_data(owner, raw_dir, pgm_dir, image, base_name, position, position)
@@ -1,43 +1,159 @@
+import io
 import numpy as np
 import os
+import struct
 import tkinter as tk
-from utils.ColorIm import convert_to_color_image
-import matplotlib
-matplotlib.use('Agg')  
-import matplotlib.pyplot as plt
-from matplotlib.animation import ArtistAnimation, PillowWriter
+import cv2
+from utils.ColorIm import color_lut
+from storage.raw_stack import RawStack
 import traceback
 from PIL import Image, ImageTk
 
-def create_gif_from_arrays(data_dict, folder_name, interval=500, apply_color=True):
+
+def _to_uint8(array):
+    # Ne uint8 kadrai ištempiami į 0..255 (min/max), kaip anksčiau, bet C kode.
+    array = np.asarray(array)
+    if array.dtype == np.uint8:
+        return array
+    lo, hi = float(np.min(array)), float(np.max(array))
+    if hi <= lo:
+        return np.zeros(array.shape, dtype=np.uint8)
+    return cv2.convertScaleAbs(array, alpha=255.0 / (hi - lo), beta=-lo * 255.0 / (hi - lo))
+
+
+def _skip_sub_blocks(data, pos):
+    while data[pos]:
+        pos += data[pos] + 1
+    return pos + 1
+
+
+class GifStreamWriter:
+    """
+    GIF rašymas po vieną kadrą: failo antraštė su globalia palete rašoma iškart, o kiekvienas
+    kadras LZW užkoduojamas PIL (C kode) ir iškart nurašomas į failą. Atmintyje laikomas tik
+    einamasis kadras, todėl atmintis nepriklauso nuo kadrų skaičiaus.
+    Kadras - [H, W] uint8 paletės indeksai (pvz. 8 bit intensyvumas su ColorIm LUT).
+    """
+
+    def __init__(self, path, width, height, palette, *, duration_ms=1000 / 30, loop=0):
+        self.path = path
+        self.width, self.height = int(width), int(height)
+        self.palette = bytes(np.asarray(palette, dtype=np.uint8).reshape(256, 3).tobytes())
+        self.delay_cs = max(int(round(duration_ms / 10.0)), 1)
+        self.frames = 0
+        self._f = open(path, "wb")
+        # Logical screen: globali 256 spalvų paletė (0xF7), fonas 0.
+        self._f.write(b"GIF89a" + struct.pack("<HHBBB", self.width, self.height, 0xF7, 0, 0) + self.palette)
+        # NETSCAPE2.0: kartojimas (0 - be galo)
+        self._f.write(b"!\xff\x0bNETSCAPE2.0\x03\x01" + struct.pack("<H", int(loop)) + b"\x00")
+
+    def add(self, indices):
+        idx = np.ascontiguousarray(indices, dtype=np.uint8)
+        if idx.shape != (self.height, self.width):
+            idx = cv2.resize(idx, (self.width, self.height), interpolation=cv2.INTER_AREA)
+        im = Image.frombuffer("P", (self.width, self.height), idx, "raw", "P", 0, 1)
+        im.putpalette(self.palette)
+        buf = io.BytesIO()
+        im.save(buf, format="GIF", optimize=False)
+        # Graphic Control Extension: kadro trukmė
+        self._f.write(b"!\xf9\x04\x00" + struct.pack("<H", self.delay_cs) + b"\x00\x00")
+        self._f.write(self._image_block(buf.getvalue()))
+        self.frames += 1
+
+    def _image_block(self, data):
+        # Iš vieno kadro GIF paimamas image descriptor + LZW duomenys; jei PIL paletę
+        # perrašė kitaip nei mūsų globali - ji įdedama kaip lokali kadro paletė.
+        packed = data[10]
+        pos = 13
+        frame_palette = b""
+        if packed & 0x80:
+            n = 3 * 2 ** ((packed & 7) + 1)
+            frame_palette = data[pos:pos + n]
+            pos += n
+        while data[pos] == 0x21:
+            pos = _skip_sub_blocks(data, pos + 2)
+        if data[pos] != 0x2C:
+            raise ValueError("unexpected GIF block from encoder")
+
+        desc = bytearray(data[pos:pos + 10])
+        pos += 10
+        local = b""
+        if desc[9] & 0x80:
+            n = 3 * 2 ** ((desc[9] & 7) + 1)
+            local = data[pos:pos + n]
+            pos += n
+        elif frame_palette and frame_palette != self.palette:
+            desc[9] |= 0x80 | (packed & 7)
+            local = frame_palette
+
+        end = _skip_sub_blocks(data, pos + 1)  # LZW min code size + sub-blocks
+        return bytes(desc) + local + data[pos:end]
+
+    def close(self):
+        if self._f is not None:
+            self._f.write(b";")
+            self._f.close()
+            self._f = None
+        return self.path
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+def write_gif_stream(frames, gif_path, *, apply_color=True, fps=30, scale=1.0, stride=1, loop=0):
+    """
+    frames: kadrų arba (vardas, kadras) porų iteruojamas (pvz. images_dict.items() ar RawStack).
+    scale < 1 - sumažinimas (INTER_AREA), stride - imamas kas stride-tasis kadras.
+    """
+    if apply_color:
+        palette = color_lut()
+    else:
+        palette = np.repeat(np.arange(256, dtype=np.uint8)[:, None], 3, axis=1)
+
+    writer = None
     try:
-        gif_path = os.path.join(folder_name, f"{folder_name}.gif")
+        for n, item in enumerate(frames):
+            if n % max(int(stride), 1):
+                continue
+            array = item[1] if isinstance(item, tuple) else item
+            array = _to_uint8(array)
+            if array.ndim != 2:
+                continue
+            if writer is None:
+                h, w = array.shape
+                if scale != 1.0:
+                    w, h = max(int(round(w * scale)), 1), max(int(round(h * scale)), 1)
+                writer = GifStreamWriter(gif_path, w, h, palette, duration_ms=1000.0 / fps, loop=loop)
+            writer.add(array)
+    finally:
+        if writer is not None:
+            writer.close()
+    return gif_path if writer is not None else None
+
+
+def create_gif_from_arrays(data_dict, folder_name, interval=500, apply_color=True, *, fps=30, scale=0.5, stride=1):
+    # interval paliktas suderinamumui (anksčiau PillowWriter vis tiek rašė fps=30).
+    # scale=0.5 - maždaug tokio dydžio, kokį duodavo matplotlib figūra.
+    # data_dict gali būti ir kelias (matavimo / raw folderis ar stack failas) - tada kadrai
+    # skaitomi per RawStack memmap, po vieną.
+    try:
+        folder_name = str(folder_name).rstrip("/\\")
+        gif_path = os.path.join(folder_name, f"{os.path.basename(folder_name)}.gif")
+
+        if isinstance(data_dict, (str, os.PathLike)):
+            data_dict = RawStack.open(os.fspath(data_dict))
+        items = data_dict.items() if hasattr(data_dict, "items") else data_dict
+        if write_gif_stream(items, gif_path, apply_color=apply_color, fps=fps, scale=scale, stride=stride) is None:
+            print("No frames for GIF")
+            return None
 
-        fig, ax = plt.subplots()
-        ax.set_axis_off()
-        
-        frames = []
-        
-        for key, array in data_dict.items():
-            if array.dtype != np.uint8:
-                array = ((array - array.min()) * (255.0 / (array.max() - array.min()))).astype(np.uint8)
-            
-            if apply_color:
-                array = convert_to_color_image(array)
-                
-            frame = ax.imshow(array, animated=True)
-            frames.append([frame])
-        
-        ani = ArtistAnimation(fig, frames, interval=interval, blit=True, repeat=True)
-        
-        writer = PillowWriter(fps=30)
-        ani.save(gif_path, writer=writer)
-        
-        plt.close(fig)  
-        
         print(f"GIF saved to: {gif_path}")
         return gif_path
-        
+
     except Exception as e:
         print(f"Error creating GIF: {e}")
         print(traceback.format_exc())
@@ -0,0 +1,209 @@
+import json
+import os
+import re
+from typing import Iterator, List, Optional, Tuple
+
+import numpy as np
+
+STACK_NAME = "raw_stack.npy"
+
+
+def memmap_raw_frame(path: str, width: int, height: int, dtype=np.uint8) -> np.ndarray:
+    """
+    Vienas .raw kadras kaip read-only memmap [H, W] (be kopijos; failas gali būti ilgesnis).
+    Kol memmap (ar bet kuris jo view) gyvas, failas lieka atidarytas - Windows jo neleis
+    ištrinti ar perrašyti. Ilgiau laikomam kadrui - np.array(...) kopija.
+    """
+    dtype = np.dtype(dtype)
+    expected = int(width) * int(height) * dtype.itemsize
+    size = os.path.getsize(path)
+    if size < expected:
+        raise ValueError(f"{os.path.basename(path)}: per mažas failas ({size} B), reikia {expected} B")
+    return np.memmap(path, dtype=dtype, mode="r", shape=(int(height), int(width)))
+
+
+def _z_from_name(name: str) -> Optional[float]:
+    m = re.search(r"(-?\d+(\.\d+)?)", name)
+    return float(m.group(1)) if m else None
+
+
+def _default_frame_size() -> Tuple[Optional[int], Optional[int]]:
+    from config.models import CameraDefaults
+    defaults = CameraDefaults()
+    return int(defaults.width or 0) or None, int(defaults.height or 0) or None
+
+
+def _has_raw_frames(folder: str, ext: str = ".raw") -> bool:
+    return os.path.isdir(folder) and any(n.lower().endswith(ext) for n in os.listdir(folder))
+
+
+def find_raw_stack(folder: str) -> Optional[str]:
+    """Sujungtas stack failas: pats kelias (.npy) arba folderyje / jo raw/ esantis raw_stack.npy."""
+    if os.path.isfile(folder) and folder.lower().endswith(".npy"):
+        return folder
+    for d in (folder, os.path.join(folder, "raw")):
+        path = os.path.join(d, STACK_NAME)
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+class RawStack:
+    """
+    Archyvuoto matavimo kadrai kaip [N, H, W] be pilno įkėlimo į RAM.
+
+    - RawStack.from_stack_file(): vienas sujungtas failas (.npy arba be antraštės .raw)
+      -> self.array yra tikras np.memmap [N, H, W] (zero-copy, OS puslapiuoja pati).
+    - RawStack.from_folder() / from_paths(): atskiri .raw kadrai (kaip rašo _save_data)
+      -> kiekvienas kadras atidaromas kaip memmap tik kai jo prireikia.
+    - RawStack.open(): bet kuris iš jų pagal kelią (stack failas, matavimo ar raw/ folderis).
+
+    stack[i] -> [H, W] kadras, stack[a:b] -> [n, H, W] (folderio atveju - kopija),
+    items() -> (vardas, kadras) poros z tvarka (tinka create_gif_from_arrays).
+    Grąžinti kadrai - memmap'ai: kol jie gyvi, failai atidaryti (Windows neleis jų ištrinti);
+    close() atleidžia paties stack'o nuorodą.
+    """
+
+    def __init__(self, *, paths: Optional[List[str]] = None, array: Optional[np.ndarray] = None,
+                 names: Optional[List[str]] = None, z_mm: Optional[np.ndarray] = None,
+                 width: int = 0, height: int = 0, dtype=np.uint8):
+        self.paths = paths
+        self.array = array
+        self.dtype = np.dtype(array.dtype if array is not None else dtype)
+        if array is not None:
+            n, self.height, self.width = (int(v) for v in array.shape)
+        else:
+            n, self.height, self.width = len(paths or []), int(height), int(width)
+        self.names = names if names is not None else [str(i) for i in range(n)]
+        self.z_mm = np.asarray(z_mm if z_mm is not None else np.arange(n), dtype=float)
+
+    @classmethod
+    def from_paths(cls, paths: List[str], width: int, height: int, dtype=np.uint8,
+                   names: Optional[List[str]] = None, z_mm=None) -> "RawStack":
+        if names is None:
+            names = [os.path.splitext(os.path.basename(p))[0] for p in paths]
+        if z_mm is None:
+            z_mm = np.array([_z_from_name(n) if _z_from_name(n) is not None else np.nan for n in names], dtype=float)
+        return cls(paths=list(paths), names=list(names), z_mm=z_mm, width=width, height=height, dtype=dtype)
+
+    @classmethod
+    def from_folder(cls, folder: str, width: int, height: int, dtype=np.uint8, ext: str = ".raw") -> "RawStack":
+        items: List[Tuple[float, str, str]] = []
+        for name in os.listdir(folder):
+            if not name.lower().endswith(ext):
+                continue
+            z = _z_from_name(name)
+            if z is None:
+                continue
+            items.append((z, os.path.splitext(name)[0], os.path.join(folder, name)))
+        items.sort(key=lambda t: t[0])
+        return cls.from_paths(
+            [p for _z, _n, p in items], width, height, dtype,
+            names=[n for _z, n, _p in items], z_mm=np.array([z for z, _n, _p in items], dtype=float),
+        )
+
+    @classmethod
+    def from_stack_file(cls, path: str, width: Optional[int] = None, height: Optional[int] = None,
+                        dtype=np.uint8, z_mm=None) -> "RawStack":
+        if path.lower().endswith(".npy"):
+            arr = np.load(path, mmap_mode="r")
+            if arr.ndim != 3:
+                raise ValueError(f"{os.path.basename(path)}: reikia [N, H, W], yra {arr.shape}")
+        else:
+            if not width or not height:
+                raise ValueError(f"{os.path.basename(path)}: .raw stack needs width/height")
+            dtype = np.dtype(dtype)
+            frame_bytes = int(width) * int(height) * dtype.itemsize
+            n = os.path.getsize(path) // frame_bytes
+            arr = np.memmap(path, dtype=dtype, mode="r", shape=(int(n), int(height), int(width)))
+
+        names = None
+        try:
+            # write_stack_file šalia įrašo kadrų vardus ir z
+            with open(path + ".json", "r", encoding="utf-8") as f:
+                side = json.load(f)
+            names = [str(n) for n in side.get("names", [])] or None
+            if z_mm is None and side.get("z_mm") is not None:
+                z_mm = np.asarray(side["z_mm"], dtype=float)
+        except (OSError, ValueError):
+            pass
+        if names is not None and len(names) != arr.shape[0]:
+            names = None
+        if z_mm is not None and len(z_mm) != arr.shape[0]:
+            z_mm = None
+        return cls(array=arr, names=names, z_mm=z_mm)
+
+    @classmethod
+    def open(cls, path: str, width: Optional[int] = None, height: Optional[int] = None,
+             dtype=np.uint8) -> "RawStack":
+        """Stack failas arba folderis (su raw_stack.npy, raw/ pofolderiu ar .raw kadrais)."""
+        stack_file = find_raw_stack(path)
+        if stack_file is None and os.path.isfile(path):
+            stack_file = path
+        if (not width or not height) and (stack_file is None or not stack_file.lower().endswith(".npy")):
+            dw, dh = _default_frame_size()
+            width, height = width or dw, height or dh
+        if stack_file is not None:
+            return cls.from_stack_file(stack_file, width, height, dtype)
+
+        for d in (os.path.join(path, "raw"), path):
+            if _has_raw_frames(d):
+                if not width or not height:
+                    raise ValueError(f"{d}: .raw frames need width/height")
+                return cls.from_folder(d, int(width), int(height), dtype)
+        raise FileNotFoundError(f"No raw frames in {path}")
+
+    def __len__(self) -> int:
+        return int(self.array.shape[0]) if self.array is not None else len(self.paths)
+
+    @property
+    def shape(self) -> Tuple[int, int, int]:
+        return (len(self), self.height, self.width)
+
+    def __getitem__(self, i):
+        if self.array is not None:
+            return self.array[i]
+        if isinstance(i, slice):
+            idx = range(*i.indices(len(self)))
+            out = np.empty((len(idx), self.height, self.width), dtype=self.dtype)
+            for k, j in enumerate(idx):
+                out[k] = self[j]
+            return out
+        return memmap_raw_frame(self.paths[int(i)], self.width, self.height, self.dtype)
+
+    def __iter__(self) -> Iterator[np.ndarray]:
+        for i in range(len(self)):
+            yield self[i]
+
+    def items(self) -> Iterator[Tuple[str, np.ndarray]]:
+        for i in range(len(self)):
+            yield self.names[i], self[i]
+
+    def frame(self, i: int) -> np.ndarray:
+        return self[int(i)]
+
+    def write_stack_file(self, path: str, chunk: int = 16) -> "RawStack":
+        """
+        Sujungia kadrus į vieną .npy (open_memmap), rašant po chunk kadrų; šalia - <path>.json su
+        vardais ir z. Grąžina memmap stack'ą.
+        """
+        out = np.lib.format.open_memmap(path, mode="w+", dtype=self.dtype, shape=self.shape)
+        for a in range(0, len(self), max(int(chunk), 1)):
+            b = min(a + int(chunk), len(self))
+            out[a:b] = self[a:b]
+        out.flush()
+        del out
+        with open(path + ".json", "w", encoding="utf-8") as f:
+            json.dump({"names": list(self.names), "z_mm": [float(z) for z in self.z_mm]}, f)
+        return RawStack.from_stack_file(path)
+
+    def close(self) -> None:
+        self.array = None
+        self.paths = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
@@ -0,0 +1,151 @@
+import io
+import json
+import os
+import threading
+import zipfile
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+RUN_CONTAINER_NAME = "run.m2z"
+
+# Beam rezultato laukai, kurie saugomi konteineryje (BeamAxesResult / BeamISO11146Result).
+BEAM_FIELDS = ("Dx_mm", "Dy_mm", "D_major_mm", "D_minor_mm", "theta_deg")
+
+
+class RunContainerWriter:
+    """
+    Vieno matavimo konteineris: zip failas, kuriame kiekvienas kadras - atskiras .npy
+    įrašas (chunk'as, atsitiktinė prieiga), o z, ekspozicija, beam rezultatai ir cooler
+    eilutės - run.json. compress=True -> ZIP_DEFLATED (raw 8 bit kadrai spaudžiasi gerai).
+    add_frame galima kviesti iš kelių thread'ų.
+    """
+
+    def __init__(self, path: str, *, compress: bool = False, meta: Optional[Dict[str, Any]] = None):
+        self.path = path
+        d = os.path.dirname(os.path.abspath(path))
+        os.makedirs(d, exist_ok=True)
+        self._zf = zipfile.ZipFile(
+            path, "w", compression=zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED, allowZip64=True
+        )
+        self._lock = threading.Lock()
+        self._frames: List[Dict[str, Any]] = []
+        self._cooler: List[Dict[str, Any]] = []
+        self._meta: Dict[str, Any] = dict(meta or {})
+        self._closed = False
+
+    def add_frame(self, image, *, z_mm: float, z_steps: Optional[int] = None,
+                  exposure_us: Optional[float] = None, beam=None, name: Optional[str] = None) -> int:
+        arr = np.ascontiguousarray(image)
+
+        rec: Dict[str, Any] = {
+            "z_mm": float(z_mm),
+            "z_steps": int(z_steps) if z_steps is not None else None,
+            "exposure_us": float(exposure_us) if exposure_us is not None else None,
+            "name": str(name) if name is not None else None,
+        }
+        if beam is not None:
+            for f in BEAM_FIELDS:
+                v = getattr(beam, f, None)
+                rec[f] = float(v) if v is not None else None
+
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("RunContainerWriter is closed")
+            i = len(self._frames)
+            rec["member"] = f"frames/{i:06d}.npy"
+            # .npy rašomas tiesiai į zip narį - be tarpinio BytesIO ir jo kopijos
+            with self._zf.open(rec["member"], "w", force_zip64=True) as f:
+                np.lib.format.write_array(f, arr, allow_pickle=False)
+            self._frames.append(rec)
+            return i
+
+    def set_cooler(self, rows) -> None:
+        # rows: pandas DataFrame arba dict'ų sąrašas
+        if hasattr(rows, "to_dict"):
+            rows = rows.to_dict(orient="records")
+        with self._lock:
+            self._cooler = [{str(k): _jsonable(v) for k, v in dict(r).items()} for r in (rows or [])]
+
+    def close(self) -> str:
+        with self._lock:
+            if self._closed:
+                return self.path
+            self._closed = True
+            run = {"version": 1, "meta": self._meta, "frames": self._frames, "cooler": self._cooler}
+            self._zf.writestr("run.json", json.dumps(run, default=_jsonable))
+            self._zf.close()
+        return self.path
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+def _jsonable(v):
+    if isinstance(v, np.generic):
+        return v.item()
+    if isinstance(v, float) and not np.isfinite(v):
+        return None
+    if isinstance(v, (str, int, float, bool)) or v is None:
+        return v
+    return str(v)
+
+
+class RunContainer:
+    """Skaitymas: kadrai tvarka pagal z (sort_by_z=True) arba įrašymo tvarka."""
+
+    def __init__(self, path: str, *, sort_by_z: bool = True):
+        self.path = path
+        self._zf = zipfile.ZipFile(path, "r")
+        run = json.loads(self._zf.read("run.json"))
+        frames = run.get("frames", [])
+        if sort_by_z:
+            frames = sorted(frames, key=lambda r: r["z_mm"])
+        self.records: List[Dict[str, Any]] = frames
+        self.meta: Dict[str, Any] = run.get("meta", {})
+        self.cooler_rows: List[Dict[str, Any]] = run.get("cooler", [])
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def column(self, key: str) -> np.ndarray:
+        return np.array([np.nan if r.get(key) is None else r[key] for r in self.records], dtype=float)
+
+    @property
+    def z_mm(self) -> np.ndarray:
+        return self.column("z_mm")
+
+    @property
+    def z_steps(self) -> np.ndarray:
+        return self.column("z_steps")
+
+    @property
+    def exposure_us(self) -> np.ndarray:
+        return self.column("exposure_us")
+
+    def frame(self, i: int) -> np.ndarray:
+        with self._zf.open(self.records[i]["member"]) as f:
+            return np.lib.format.read_array(io.BytesIO(f.read()), allow_pickle=False)
+
+    def iter_frames(self) -> Iterator[Tuple[float, np.ndarray]]:
+        for i, r in enumerate(self.records):
+            yield r["z_mm"], self.frame(i)
+
+    def close(self) -> None:
+        self._zf.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+def find_run_container(folder: str) -> Optional[str]:
+    path = os.path.join(folder, RUN_CONTAINER_NAME)
+    return path if os.path.isfile(path) else None
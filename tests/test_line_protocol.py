@@ -0,0 +1,68 @@
+import socket
+import threading
+import time
+
+from client.line_protocol import LineProtocol
+
+
+def _fake_controller(sock, late_s=1.2):
+    # "MUTE" - atsakymas dingsta, "LATE" - atsako po late_s, kitos - "R:<komanda>".
+    buf = b""
+    while True:
+        try:
+            data = sock.recv(1024)
+        except OSError:
+            return
+        if not data:
+            return
+        buf += data
+        while b"\n" in buf:
+            line, buf = buf.split(b"\n", 1)
+            cmd = line.decode()
+            if cmd == "MUTE":
+                continue
+            if cmd == "LATE":
+                time.sleep(late_s)
+            sock.sendall(f"R:{cmd}\n".encode())
+
+
+def _protocol():
+    ours, theirs = socket.socketpair()
+    ours.settimeout(1.0)
+    threading.Thread(target=_fake_controller, args=(theirs,), daemon=True).start()
+    return LineProtocol(ours, idle_s=0.2), theirs
+
+
+def test_dropped_reply_does_not_shift_later_replies():
+    protocol, theirs = _protocol()
+    try:
+        assert protocol.request("Q1\n", timeout_s=0.3) == ["R:Q1"]
+        assert protocol.request("MUTE\n", timeout_s=0.3) is None
+        for i in range(2, 8):
+            assert protocol.request(f"Q{i}\n", timeout_s=0.5) == [f"R:Q{i}"]
+        assert protocol.stats()["resyncs"] == 1
+    finally:
+        protocol.close()
+        theirs.close()
+
+
+def test_late_reply_is_discarded():
+    protocol, theirs = _protocol()
+    try:
+        assert protocol.request("LATE\n", timeout_s=0.3) is None
+        time.sleep(1.0)  # atsakymas atkeliauja, kai užklausa jau nutraukta
+        assert protocol.request("Q2\n", timeout_s=0.5) == ["R:Q2"]
+        assert protocol.request("Q3\n", timeout_s=0.5) == ["R:Q3"]
+    finally:
+        protocol.close()
+        theirs.close()
+
+
+def test_pipelined_replies_match_in_order():
+    protocol, theirs = _protocol()
+    try:
+        replies = protocol.request_many(["A\n", "B\n", "C\n"], [1, 1, 1], timeout_s=0.5)
+        assert replies == [["R:A"], ["R:B"], ["R:C"]]
+    finally:
+        protocol.close()
+        theirs.close()
@@ -6,8 +6,17 @@ import tkinter as tk
 import tkinter.messagebox as messagebox
 from tkinter import filedialog
 from .tk_utils import ui_call
+from storage.raw_stack import RawStack
 
 def read_data_folder(folder: str):
+    # .raw kadrai (folderis, raw/ ar raw_stack.npy) - per RawStack: reikšmės yra memmap'ai,
+    # į RAM skaitomi tik tada, kai kadras naudojamas.
+    try:
+        stack = RawStack.open(folder)
+    except FileNotFoundError:
+        stack = None
+    if stack is not None:
+        return {float(z): frame for z, frame in zip(stack.z_mm, stack) if np.isfinite(z)}
 
     exts = (".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff", ".pgm", ".npy")
     items = {}
@@ -1,6 +1,7 @@
 import os
 import time
 import traceback
+from collections.abc import Mapping
 import matplotlib.pyplot as plt
 import numpy as np
 import cv2
@@ -12,6 +13,8 @@ from ExternalFileServer.ExternalFilerServerClientConnection import (
     get_smb_client,
     check_server_connection
 )
+from ExternalFileServer.smb.upload_pool import MANIFEST_NAME, SMBUploadPool, UploadJob, UploadManifest
+from storage.frame_archive import ARCHIVE_NAME, FrameArchive, FrameArchiveWriter, frame_digest
 
 
 class AppWindow:
@@ -274,6 +277,11 @@ class AppWindow:
         dlg.bind("<Escape>", lambda e: on_cancel())
 
     def _get_measurement_folder(self):
+        # run_folder nustatomas matavimo pradžioje; gif_path gali dar rodyti į ankstesnį matavimą
+        run_folder = getattr(self.camera_worker, "run_folder", None)
+        if run_folder and os.path.isdir(run_folder):
+            return run_folder
+
         gif_path = getattr(self.camera_worker, "gif_path", None)
         fig_path = getattr(self.camera_worker, "figure_path", None)
 
@@ -369,8 +377,8 @@ class AppWindow:
 
         return new_folder_path
 
-    def _upload_files(self, smb_client, remote_folder_path):
-        uploaded_files = []
+    def _upload_files(self, remote_folder_path):
+        jobs = []
         file_paths = [
             (getattr(self.camera_worker, "gif_path", None), "GIF"),
             (getattr(self.camera_worker, "figure_path", None), "Figure"),
@@ -379,16 +387,12 @@ class AppWindow:
         for file_path, file_type in file_paths:
             if file_path and os.path.exists(file_path):
                 file_name = os.path.basename(file_path)
-                try:
-                    print(f"Uploading {file_type}: {file_path} → {remote_folder_path}/{file_name}")
-                    smb_client.upload_file(file_path, remote_folder_path, file_name)
-                    uploaded_files.append(file_name)
-                except Exception as e:
-                    print(f"Error uploading {file_type.lower()} file: {e}")
-                    messagebox.showerror("SMB Error", f"Error uploading {file_type.lower()} file: {e}")
-        return uploaded_files
+                print(f"Uploading {file_type}: {file_path} → {remote_folder_path}/{file_name}")
+                jobs.append(UploadJob(remote_folder_path, file_name, file_path, label=file_type))
+        return jobs
 
-    def _upload_txt_files(self, smb_client, remote_folder_path):
+    def _upload_txt_files(self, remote_folder_path):
+        jobs = []
         txt_name = "data_results"
         work_path = os.getcwd()
         try:
@@ -397,16 +401,17 @@ class AppWindow:
                     if file.endswith(".txt") and txt_name in file:
                         txt_path = os.path.join(root_, file)
                         print(f"Uploading: {txt_path} → {remote_folder_path}/{file}")
-                        smb_client.upload_file(txt_path, remote_folder_path, file)
+                        jobs.append(UploadJob(remote_folder_path, file, txt_path))
         except Exception as e:
-            print(f"Error uploading txt files: {e}")
+            print(f"Error listing txt files: {e}")
             messagebox.showerror("SMB Error", f"Error uploading txt files: {e}")
+        return jobs
 
-    def _upload_csv_from_same_folder_as_gif_png(self, smb_client, remote_folder_path):
+    def _upload_csv_from_same_folder_as_gif_png(self, remote_folder_path):
         measurement_dir = self._get_measurement_folder()
         if not measurement_dir:
             print("CSV upload skipped: measurement folder not found (no gif_path/figure_path).")
-            return
+            return []
 
         print(f"Looking for CSV files in: {measurement_dir}")
 
@@ -415,52 +420,99 @@ class AppWindow:
         except Exception as e:
             print(f"Error listing measurement folder: {e}")
             traceback.print_exc()
-            return
+            return []
 
         if not csv_files:
             print("No CSV files found in the same folder as GIF/PNG.")
-            return
+            return []
 
         print("CSV files to upload:")
         for f in sorted(csv_files):
             print("  -", f)
 
-        for file in sorted(csv_files):
-            local_path = os.path.join(measurement_dir, file)
-            try:
-                print(f"Uploading CSV: {local_path} → {remote_folder_path}/{file}")
-                smb_client.upload_file(local_path, remote_folder_path, file)
-            except Exception as e:
-                print(f"Error uploading CSV {file}: {e}")
-                messagebox.showerror("SMB Error", f"Error uploading CSV {file}: {e}")
+        return [
+            UploadJob(remote_folder_path, file, os.path.join(measurement_dir, file), label="CSV")
+            for file in sorted(csv_files)
+        ]
 
-    def _convert_and_save_raw_files(self, smb_client, remote_folder_path):
+    def _convert_and_save_raw_files(self, smb_client, remote_folder_path, run_folder=None):
+        # Kadrai siunčiami tiesiai iš images_dict (RAM arba memmap) - be laikinų failų.
         raw_files_folder = self._join_smb(remote_folder_path, "raw files")
 
-        if self._create_new_folder(smb_client, remote_folder_path, "raw files") is None:
-            return
-
         images_dict = getattr(self.camera_worker, "images_dict", None)
-        if not isinstance(images_dict, dict):
+        if not isinstance(images_dict, Mapping) or not images_dict:
             print("No image data found in camera_worker.images_dict")
-            return
+            return []
 
+        if self._create_new_folder(smb_client, remote_folder_path, "raw files") is None:
+            return []
+
+        if get_settings().get("smb_raw_archive", False):
+            archive_path = self._raw_frames_archive(images_dict, run_folder)
+            if archive_path:
+                return [UploadJob(raw_files_folder, ARCHIVE_NAME, archive_path, label="raw archive")]
+
+        jobs = []
+        for file_name, image_array in images_dict.items():
+            if isinstance(image_array, np.ndarray):
+                jobs.append(UploadJob(raw_files_folder, f"{file_name}.raw", image_array, label="raw"))
+            else:
+                print(f"Skipping {file_name}: not a numpy array")
+        return jobs
+
+    @staticmethod
+    def _raw_frames_archive(images_dict, run_folder):
+        # Vienas suspaustas failas vietoj šimtų .raw, šio matavimo aplanke. Jei jau yra su tais
+        # pačiais kadrais (vardai + turinio hash) - naudojamas tas pats (nesikeičia mtime, todėl
+        # resume manifestas jį praleidžia). Be matavimo aplanko - kadrai siunčiami po vieną.
+        if not run_folder or not os.path.isdir(run_folder):
+            return None
+        archive_path = os.path.join(run_folder, ARCHIVE_NAME)
+        frames = [(str(k), v) for k, v in images_dict.items() if isinstance(v, np.ndarray)]
+        names = [name for name, _ in frames]
         try:
-            for file_name, image_array in images_dict.items():
-                if isinstance(image_array, np.ndarray):
-                    raw_file_name = f"{file_name}.raw"
-                    raw_file_path = os.path.join(os.getcwd(), raw_file_name)
-
-                    with open(raw_file_path, "wb") as raw_file:
-                        raw_file.write(image_array.tobytes())
-
-                    smb_client.upload_file(raw_file_path, raw_files_folder, raw_file_name)
-                    os.remove(raw_file_path)
-                else:
-                    print(f"Skipping {file_name}: not a numpy array")
+            if os.path.isfile(archive_path):
+                with FrameArchive(archive_path) as fa:
+                    same = fa.names == names and all(
+                        rec.get("digest") == frame_digest(image) for rec, (_, image) in zip(fa.records, frames)
+                    )
+                if same:
+                    return archive_path
+            with FrameArchiveWriter(archive_path) as w:
+                # Iš jau surinktų kadrų - FrameStore išstumtų kadrų antrą kartą iš disko neskaitom.
+                for file_name, image_array in frames:
+                    w.add(file_name, image_array)
+                print(f"Raw frames archived: {archive_path} ({len(names)} frames, ratio {w.ratio():.2f})")
+            return archive_path
         except Exception as e:
-            print(f"Error converting or uploading raw files: {e}")
-            messagebox.showerror("SMB Error", f"Error converting or uploading raw files: {e}")
+            print(f"Error creating raw frame archive: {e}")
+            traceback.print_exc()
+            return None
+
+    @staticmethod
+    def _upload_manifest_path(run_folder):
+        # Manifestas tik matavimo aplanke; be jo (pvz. tik rankinės nuotraukos) - be resume.
+        if not run_folder:
+            return None
+        return os.path.join(run_folder, MANIFEST_NAME)
+
+    def _run_smb_uploads(self, smb_client, remote_folder_path, jobs, run_folder=None):
+        settings = get_settings()
+        workers = int(settings.get("smb_upload_workers", 3) or 3)
+        manifest_path = self._upload_manifest_path(run_folder)
+        manifest = UploadManifest(manifest_path, remote_root=remote_folder_path) if manifest_path else None
+        if manifest is not None and len(manifest):
+            print(f"Resuming SMB upload: {len(manifest)} files already on server ({manifest.path})")
+
+        pool = SMBUploadPool.from_client(smb_client, workers=workers)
+        try:
+            report = pool.upload(jobs, manifest=manifest)
+        finally:
+            pool.close()
+
+        for remote_path, err in report.failed.items():
+            print(f"Error uploading {remote_path}: {err}")
+        return report
 
     def _get_figure(self):
         fig = None
@@ -507,6 +559,9 @@ class AppWindow:
 
     def save_to_smb(self):
         try:
+            wait_for_gif = getattr(self.camera_worker, "wait_for_gif", None)
+            if callable(wait_for_gif):
+                wait_for_gif()
             if hasattr(self.camera_worker, "show_figure"):
                 try:
                     timestamp = time.strftime("%Y%m%d_%H%M%S")
@@ -549,15 +604,25 @@ class AppWindow:
                 messagebox.showerror("SMB Error", f"Could not create 'test' inside: {laser_parent_folder}")
                 return
 
-            uploaded_files = self._upload_files(smb_client, test_folder_path)
+            run_folder = self._get_measurement_folder()
+            result_jobs = self._upload_files(test_folder_path)
+            jobs = list(result_jobs)
+            jobs += self._upload_txt_files(test_folder_path)
+            jobs += self._upload_csv_from_same_folder_as_gif_png(test_folder_path)
+            jobs += self._convert_and_save_raw_files(smb_client, test_folder_path, run_folder)
+
+            report = self._run_smb_uploads(smb_client, test_folder_path, jobs, run_folder)
+            done = set(report.uploaded) | set(report.skipped)
+            uploaded_files = [j.remote_name for j in result_jobs if j.remote_path in done]
             if uploaded_files:
                 self._show_upload_success(test_folder_path, uploaded_files)
             else:
                 messagebox.showwarning("Warning", "Could not save any files.")
-
-            self._upload_txt_files(smb_client, test_folder_path)
-            self._upload_csv_from_same_folder_as_gif_png(smb_client, test_folder_path)
-            self._convert_and_save_raw_files(smb_client, test_folder_path)
+            if report.failed:
+                messagebox.showerror(
+                    "SMB Error",
+                    f"{len(report.failed)} file(s) failed to upload. Run 'Save to SMB' again to resume."
+                )
 
         except Exception as e:
             print(f"Error saving files to SMB: {e}")
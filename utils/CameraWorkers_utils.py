@@ -4,15 +4,21 @@ import traceback
 
 from utils.analysis_utils import analyze_image
 from devices.camera.camera_settings import update_camera_settings
+from devices.camera.acquisition_session import acquisition_session
 
 def camera_worker_task(instance, cam):
+    # Live ciklas vienintelis ima kadrus iš kameros; skenavimas jų laukia per session.publish
+    session = acquisition_session(instance, cam)
     try:
-        cam.BeginAcquisition()
+        session.start()
+        session.attach_pump()
         
         while instance.running:
             try:
-                raw_image = cam.GetNextImage(2000)  
-                
+                raw_image = session.pump_next(2000)
+                if raw_image is None:
+                    continue
+
                 if raw_image.IsIncomplete():
                     print(f"Image incomplete with status {raw_image.GetImageStatus()}")
                 else:
@@ -23,6 +29,7 @@ def camera_worker_task(instance, cam):
                         instance.start_time = current_time
                     
                     saturation_level, background_level, center_point = analyze_image(instance, raw_image)
+                    session.publish(raw_image, instance.latest_frame)
                     update_camera_settings(instance, cam, saturation_level, background_level)
                     
                     instance.previous_saturation_level = saturation_level
@@ -40,7 +47,8 @@ def camera_worker_task(instance, cam):
     except Exception as ex:
         print(f"Error details: {traceback.format_exc()}")
     finally:
+        session.detach_pump()
         try:
-            cam.EndAcquisition()
+            session.stop()
         except Exception as ex:
             print(f"Error ending acquisition: {ex}")
\ No newline at end of file
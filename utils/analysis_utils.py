@@ -2,19 +2,32 @@
 import numpy as np 
 import traceback
 
+from devices.camera.frame_pool import FRAME_POOL
+
+def _percentile_u8(hist, cum, q):
+    # np.percentile (linear) iš 256 binų histogramos - tas pats rezultatas be rikiavimo
+    rank = q / 100.0 * (cum[-1] - 1)
+    lo = int(np.floor(rank))
+    v_lo = int(np.searchsorted(cum, lo, side="right"))
+    v_hi = int(np.searchsorted(cum, min(lo + 1, cum[-1] - 1), side="right"))
+    return v_lo + (rank - lo) * (v_hi - v_lo)
+
 def analyze_image(self, raw_image):
     try:            
         image_data = raw_image.GetData()
         
-        image_array = np.array(image_data, dtype=np.uint8).reshape(
+        image_array = np.asarray(image_data, dtype=np.uint8).reshape(
             (raw_image.GetHeight(), raw_image.GetWidth())
         )
         
-        self.latest_frame = image_array.copy()
+        # Viena kopija į pool'o buferį; ekranas naudoja tą patį read-only masyvą
+        self.latest_frame = FRAME_POOL.copy_in(image_array)
         
-        saturation_level = np.max(image_array)
+        hist = np.bincount(self.latest_frame.ravel(), minlength=256)
+        cum = np.cumsum(hist)
+        saturation_level = np.uint8(np.flatnonzero(hist)[-1])
         
-        background_level = int(np.percentile(image_array, 5))
+        background_level = int(_percentile_u8(hist, cum, 5))
         
         center_point = {
             "x": raw_image.GetWidth() // 2,
@@ -5,36 +5,49 @@ import cv2
 import threading
 import traceback
 import numpy as np
-import bisect
 import tkinter as tk
 import tkinter.messagebox as messagebox
 from tkinter import filedialog
 from threading import Thread
+from types import SimpleNamespace
 from PIL import Image, ImageTk
 import matplotlib.backends.backend_agg as backend_agg
 
 from devices.device_maneger import DeviceManager
 
-from devices.camera.camera_settings import set_default_configuration
+from devices.camera.camera_settings import set_default_configuration, set_exposure
+from devices.camera.exposure_prior import PRIOR_FILE_NAME, ExposurePrior, default_prior_path
+from devices.camera.exposure_controller import ExposureController
+from devices.camera.frame_pool import shared_frame
+from devices.camera.acquisition_session import acquisition_session
 from utils.json_edit import change_val
 from utils.CameraWorkers_utils import camera_worker_task
 
 from config.load import load_camera_defaults
 from config.models import CameraWorkerParams
 from ui.tk_utils import ui_call
-from ui.dialogs import hand_mode_dialog, read_data_folder
+from ui.dialogs import hand_mode_dialog
 
 from devices.camera.camera_display import prepare_for_tk
 
 from devices.axis.axis_service import AxisService
+from devices.axis.axis_commands import AxisControllerCommands
+from devices.cooler.CoolerComunication.cooler_data import CoolerData
 from devices.laser.laser_service import LaserService
-from measurement.focus import find_focus, generate_track_by_focus
+from measurement.focus import find_focus_adaptive, generate_track_by_focus
 from measurement.measurement_service import MeasurementService
 from storage.storage_service import StorageService
 
 from measurement.calculations import beam_size_k4_fixed_axes
-from measurement.quadrometer import compute_m2_hyperbola
+from measurement.reanalysis import list_frames, reanalyse_folder_async
+from measurement.scan_executor import PipelinedScanExecutor
+from measurement.triggered_capture import TriggeredCapture
+from measurement.quadrometer import OnlineM2Fitter, compute_m2_hyperbola
 from storage.converter import _save_data
+from storage.frame_store import FrameStore
+from storage.gif import create_gif_from_arrays
+from storage.frame_writer import FrameWriter, persist_frame
+from storage.run_container import RUN_CONTAINER_NAME, RunContainerWriter
 
 # IMPORTANT: we only use SimpleCameraCapture + FlirCameraConnection (no CameraService)
 from devices.camera.camera_service import SimpleCameraCapture
@@ -42,6 +55,7 @@ from devices.camera.camera_connection import FlirCameraConnection
 
 
 DEBUG_TRACK = False
+M2_FIT_METRIC = "1e2_diameter"  # galutinis ir online M2 fitas - ta pati metrika
 
 
 def _norm_name(x) -> str:
@@ -147,8 +161,11 @@ class CameraWorker:
         self.previous_saturation_level = 0
         self.previous_background_level = 0
         self.last_known_exposure_time = float(self.camera_defaults.exposure_time)
+        # "model" - ExposureController, "step" - senas calculate_shutter
+        self.exposure_controller = self._make_exposure_controller()
 
-        self.images_dict = {}
+        # Kadrai GIF'ui ir SMB įkėlimui; virš biudžeto seniausi iškeliami į diską (.raw).
+        self.images_dict = FrameStore(budget_bytes=self._frame_store_budget_mb() * 2 ** 20)
         self.latest_frame = None
 
         self.running = False
@@ -160,6 +177,8 @@ class CameraWorker:
 
         self.camera_conn = None
         self.cam = None
+        # Bendras kameros srautas (live, fokusavimas, skenavimas) - devices.camera.acquisition_session
+        self.acquisition_session = None
 
         base_dir = os.path.dirname(os.path.abspath(__file__))
         settings_path = os.path.join(base_dir, "config", "setting.json")
@@ -176,6 +195,9 @@ class CameraWorker:
 
         self.measurement_figure = None
         self.gif_path = None
+        self._gif_thread = None
+        # Dabartinio matavimo aplankas; nustatomas iškart (gif_path atsiranda tik baigus GIF thread'ą)
+        self.run_folder = None
 
         self.measure = MeasurementService(self)
         self.storage = StorageService(self)
@@ -208,6 +230,21 @@ class CameraWorker:
 
         self.raw_dir = None
 
+    def _make_exposure_controller(self):
+        try:
+            mode = self.get_from_settings_json("exposure_control")
+        except Exception:
+            mode = None
+        if str(mode or "model").lower() == "step":
+            return None
+        return ExposureController()
+
+    def _frame_store_budget_mb(self) -> int:
+        try:
+            return int(self.get_from_settings_json("frame_store_budget_mb"))
+        except Exception:
+            return 512
+
     def _require_wavelength_nm(self) -> float:
         if self.wavelength is None:
             raise RuntimeError(
@@ -225,7 +262,7 @@ class CameraWorker:
     def _z_mm_from_idx(self, idx: int) -> float:
         return float(idx)
 
-    def _add_measurement_record(self, measurements, idx: int, res):
+    def _add_measurement_record(self, measurements, idx: int, res, z_steps=None, exposure_us=None):
         dx_mm = float(res.Dx_mm)
         dy_mm = float(res.Dy_mm)
         measurements.append(
@@ -234,9 +271,127 @@ class CameraWorker:
                 "z_mm": self._z_mm_from_idx(int(idx)),
                 "dx_mm": dx_mm,
                 "dy_mm": dy_mm,
+                "z_steps": z_steps,
+                "exposure_us": exposure_us,
             }
         )
 
+    def _preset_exposure(self, prior, pos):
+        # Ekspozicija pagal ankstesnius/šio matavimo kadrus - nustatoma dar prieš judesį.
+        if prior is None or self.cam is None:
+            return
+        exposure = prior.predict(pos)
+        if exposure is not None:
+            set_exposure(self, self.cam, exposure)
+
+    def _capture_for_scan(self, pos, exposures, prior=None, preset=False, attempts=None):
+        if preset:
+            self._preset_exposure(prior, pos)
+        self.last_capture_attempts = None
+        self.last_capture_exposure = None
+        img = SimpleCameraCapture.capture_image_at_position(self, self.cam, None, self.previous_saturation_level)
+        # Ekspozicija, su kuria kadras tikrai darytas (sesija ją žino), kitaip paskutinė nustatyta
+        exposures[int(pos)] = float(self.last_capture_exposure or self.last_known_exposure_time)
+        if img is not None:
+            if prior is not None:
+                prior.observe(pos, exposures[int(pos)], float(np.max(img)), float(self.previous_background_level))
+            if attempts is not None and self.last_capture_attempts is not None:
+                attempts.append(int(self.last_capture_attempts))
+        return img
+
+    def _exposure_prior(self):
+        lower = float(getattr(self, "saturation_lower_bound", 110.0))
+        upper = float(getattr(self, "saturation_upper_bound", 205.0))
+        return ExposurePrior.load(default_prior_path(), target=0.5 * (lower + upper))
+
+    def _save_exposure_prior(self, prior, folder_name, attempts):
+        if prior is None or not len(prior):
+            return
+        prior.save(os.path.join(folder_name, PRIOR_FILE_NAME), default_prior_path())
+        if attempts:
+            first = sum(1 for a in attempts if a == 1)
+            print(f"Exposure prior: {first}/{len(attempts)} positions accepted on the first frame, "
+                  f"mean {sum(attempts) / len(attempts):.2f} frames")
+
+    def _write_run_container(self, folder_name, measurements, cooler_rows=None):
+        # Vienas run.m2z failas su visais (po prune likusiais) kadrais, z, rezultatais ir kolerio rodmenimis.
+        path = os.path.join(folder_name, RUN_CONTAINER_NAME)
+        meta = {"serial": self.serial, "model": self.model, "wavelength_nm": self.wavelength}
+        try:
+            with RunContainerWriter(path, compress=True, meta=meta) as rc:
+                if cooler_rows:
+                    rc.set_cooler(cooler_rows)
+                for m in measurements:
+                    img = self.images_dict.get(str(int(m["idx"])))
+                    if img is None:
+                        continue
+                    rc.add_frame(
+                        img, z_mm=m["z_mm"], z_steps=m.get("z_steps"), exposure_us=m.get("exposure_us"),
+                        beam=SimpleNamespace(Dx_mm=m["dx_mm"], Dy_mm=m["dy_mm"]), name=str(int(m["idx"])),
+                    )
+            return path
+        except Exception:
+            traceback.print_exc()
+            return None
+
+    def _create_gif_background(self, folder_name, measurements):
+        # GIF z tvarka, foniniame thread'e - UI ir M2 skaičiavimas nelaukia.
+        frames = []
+        for m in measurements:
+            img = self.images_dict.get(str(int(m["idx"])))
+            if img is not None:
+                frames.append((str(int(m["idx"])), img))
+        if not frames:
+            return None
+
+        def job():
+            gif_path = create_gif_from_arrays(frames, folder_name)
+            if gif_path:
+                # Tiesiogiai, ne per ui_call: wait_for_gif() iš UI thread'o turi matyti kelią iškart.
+                self.gif_path = gif_path
+                ui_call(self.camera_label, lambda: self.storage.store_gif(gif_path))
+
+        t = Thread(target=job, daemon=True)
+        self._gif_thread = t
+        t.start()
+        return t
+
+    def wait_for_gif(self, timeout_s=None):
+        # Išsaugojimas iškart po matavimo: palaukiam šio matavimo GIF, kad nebūtų paimtas senas.
+        t = self._gif_thread
+        if t is not None and t.is_alive():
+            print("Waiting for the GIF of the current run...")
+            t.join(timeout_s)
+        return self.gif_path
+
+    def _update_online_m2(self, fitter, idx: int, res) -> bool:
+        # Preliminarus M2 po kiekvieno taško; grąžina True, kai įvertis nusistovėjo.
+        try:
+            est = fitter.add(self._z_mm_from_idx(int(idx)), float(res.Dx_mm), float(res.Dy_mm))
+        except Exception:
+            traceback.print_exc()
+            return False
+        if est is not None and est["x"]["ok"] and est["y"]["ok"]:
+            self._ui_status(
+                f"Ongoing... M² x≈{est['x']['M2']:.2f}±{est['x']['M2_std']:.2f}  "
+                f"y≈{est['y']['M2']:.2f}±{est['y']['M2_std']:.2f}"
+            )
+        return bool(fitter.converged)
+
+    def _m2_early_stop_enabled(self) -> bool:
+        try:
+            return bool(self.get_from_settings_json("m2_early_stop"))
+        except Exception:
+            return False
+
+    def _triggered_capture_enabled(self) -> bool:
+        # "triggered" - kadras per TriggerSoftware ašiai sustojus, "free" - senas srautas be laukimo
+        try:
+            mode = self.get_from_settings_json("capture_mode")
+        except Exception:
+            mode = None
+        return str(mode or "triggered").lower() == "triggered"
+
     def _compute_m2_from_records(self, measurements, title: str):
         if not measurements:
             raise RuntimeError("No measurement points collected.")
@@ -257,7 +412,7 @@ class CameraWorker:
 
         return compute_m2_hyperbola(
             z_mm, dx_mm, dy_mm, lam_mm,
-            metric="1e2_diameter",
+            metric=M2_FIT_METRIC,
             z_window=(70.0, 135.0),
             min_points=8,
             return_fig=True,
@@ -292,10 +447,11 @@ class CameraWorker:
                 traceback.print_exc()
 
             try:
-                for _ in range(10):
-                    _ = SimpleCameraCapture.capture_image_at_position(
-                        self, self.cam, position=None, previous_sat=self.previous_saturation_level
-                    )
+                with acquisition_session(self, self.cam):
+                    for _ in range(10):
+                        _ = SimpleCameraCapture.capture_image_at_position(
+                            self, self.cam, position=None, previous_sat=self.previous_saturation_level
+                        )
             except Exception:
                 pass
 
@@ -307,6 +463,9 @@ class CameraWorker:
             return False
 
     def disconnect_camera(self):
+        if self.acquisition_session is not None:
+            self.acquisition_session.close()
+            self.acquisition_session = None
         try:
             if self.camera_conn is not None:
                 self.camera_conn.disconnect()
@@ -511,35 +670,59 @@ class CameraWorker:
 
         self.wavelength = lam
 
-        data_dic = read_data_folder(folder)
-        if not data_dic:
+        if not list_frames(folder):
             messagebox.showerror("Klaida", "Folderyje nerasta tinkamų failų (su skaičiumi pavadinime).")
             return
 
-        measurements = []
-        for z_val, arr in data_dic.items():
-            res = beam_size_k4_fixed_axes(arr, pixel_size_um=3.75, k=4.0)
+        if self.handmode_button:
+            self.handmode_button.config(state=tk.DISABLED)
+        self._ui_status("Reanalysing folder...")
+
+        def on_done(results):
+            measurements = []
+            for z_val, _path, res in results:
+                if res is None:
+                    continue
+                try:
+                    idx = int(float(z_val))  # your folder keys are typically numbers
+                except Exception:
+                    # fallback: try normalize string
+                    idx = int(float(_norm_name(z_val)))
+                self._add_measurement_record(measurements, idx, res)
+
             try:
-                idx = int(float(z_val))  # your folder keys are typically numbers
-            except Exception:
-                # fallback: try normalize string
-                idx = int(float(_norm_name(z_val)))
-            self._add_measurement_record(measurements, idx, res)
+                (_results, fig) = self._compute_m2_from_records(
+                    measurements,
+                    title=f"Manual ({self.wavelength} nm)"
+                )
+            except Exception as e:
+                traceback.print_exc()
+                err = str(e)
+                ui_call(self.camera_label, lambda: self._hand_mode_finished(None, err))
+                return
 
-        try:
-            (results, fig) = self._compute_m2_from_records(
-                measurements,
-                title=f"Manual ({self.wavelength} nm)"
-            )
-        except Exception as e:
-            traceback.print_exc()
-            messagebox.showerror("Error", f"M² computation failed: {e}")
+            ui_call(self.camera_label, lambda: self._hand_mode_finished(fig, None))
+
+        def on_error(e):
+            err = str(e)
+            ui_call(self.camera_label, lambda: self._hand_mode_finished(None, err))
+
+        reanalyse_folder_async(folder, on_done=on_done, on_error=on_error)
+
+    def _hand_mode_finished(self, fig, err):
+        if self.handmode_button:
+            self.handmode_button.config(state=tk.NORMAL)
+
+        if err is not None:
+            self._ui_status("Hand mode failed")
+            messagebox.showerror("Error", f"M² computation failed: {err}")
             return
 
         if fig is None:
             messagebox.showwarning("Įspėjimas", "Nepavyko sugeneruoti M² grafiko.")
             return
 
+        self._ui_status("Hand mode complete")
         self.measurement_figure = fig
         try:
             from utils.storage_utils import StorageUtilities
@@ -576,17 +759,12 @@ class CameraWorker:
                 step_size = 1587  # steps per mm
 
 
-                # Kad nuotraukos būtų daromos greičiau, per fokusavimo paiešką acquisition paleidžiam vieną kartą.
-                _acq_started = False
-                try:
-                    if self.cam is not None and hasattr(self.cam, "IsStreaming") and not self.cam.IsStreaming():
-                        self.cam.BeginAcquisition()
-                        _acq_started = True
-                except Exception:
-                    _acq_started = False
+                # Kad nuotraukos būtų daromos greičiau, per fokusavimo paiešką srautas nestabdomas.
+                session = acquisition_session(self, self.cam)
+                session.start()
 
                 try:
-                    focus_steps = find_focus(
+                    focus_steps = find_focus_adaptive(
                         axis_service=self.axis_service,
                         capture_fn=lambda pos: self.measure.capture_image(pos),
                         beam_fn=lambda img: beam_size_k4_fixed_axes(img, pixel_size_um=3.75, k=4.0),
@@ -596,11 +774,7 @@ class CameraWorker:
                         stop_event=self.stop_event
                     )
                 finally:
-                    try:
-                        if _acq_started and self.cam is not None and hasattr(self.cam, "IsStreaming") and self.cam.IsStreaming():
-                            self.cam.EndAcquisition()
-                    except Exception:
-                        pass
+                    session.stop()
 
                 if self.stop_event.is_set():
                     self._ui_status("Proceedings suspended")
@@ -632,7 +806,7 @@ class CameraWorker:
             self.showing_gif = True
 
             gif = Image.open(self.gif_path)
-            from gif.gif import animate_gif
+            from storage.gif import animate_gif
             animate_gif(self.camera_label, gif, lambda: self.showing_gif)
 
             if self.figure_button:
@@ -714,13 +888,15 @@ class CameraWorker:
         if img is None:
             return None, None
 
-        filename = str(int(idx))
-        self.images_dict[filename] = img.copy()
+        return img, self.save_measure(img, position_steps, idx, raw_dir, pgm_dir)
 
-        _save_data(self, raw_dir, pgm_dir, img, filename, position_steps, position_steps)
+    def save_measure(self, img, position_steps: int, idx: int, raw_dir: str, pgm_dir: str, writer=None):
+        filename = str(int(idx))
+        frame = shared_frame(img)
+        raw_path, _pgm_path = persist_frame(writer, self, raw_dir, pgm_dir, frame, filename, position_steps)
+        self.images_dict.put(filename, frame, backing_path=raw_path)
 
-        res = beam_size_k4_fixed_axes(img, pixel_size_um=3.75, k=4.0)
-        return img, res
+        return beam_size_k4_fixed_axes(img, pixel_size_um=3.75, k=4.0)
 
     # --------------------- Main process ---------------------
     def start_process(self):
@@ -747,9 +923,15 @@ class CameraWorker:
     def _start_process_worker(self):
         folder_name = None
         time1 = None
+        writer = None
+        session = None
+        triggered = None
         try:
             measurment_t1 = time.time()
             self.toggle_laser()
+            # Srautas visam matavimui: tarp pozicijų laukiama tik judesio, ne Begin/EndAcquisition
+            session = acquisition_session(self, self.cam)
+            session.start()
             _ = self._lam_mm()  # validates wavelength; value is used later
 
             folder_name = f"M2_Data_{self.serial}_{self.model}_{time.strftime('%Y-%m-%d_%H-%M-%S')}"
@@ -759,88 +941,147 @@ class CameraWorker:
             os.makedirs(raw_dir, exist_ok=True)
             os.makedirs(pgm_dir, exist_ok=True)
             os.makedirs(analysis_dir, exist_ok=True)
+            self.run_folder = os.path.abspath(folder_name)
+            self.gif_path = None
+            writer = FrameWriter(raw_dir, pgm_dir)
 
             max_length = self.get_from_settings_json("length_of_runners")  # steps
             step_size = 1587  # steps per mm (as in your original code)
 
             measurements = []  # authoritative list (prevents broadcast mismatch)
-            current = 0
-            prev_area = None
-            inc_count = 0
+            online_m2 = OnlineM2Fitter(self._lam_mm(), metric=M2_FIT_METRIC)
+            early_stop = self._m2_early_stop_enabled()
             track_positions = None
+            time1 = time.time()
+
+            exposures = {}
+            cooler_rows = {}  # z_steps -> kolerio rodmenys (TCr r) judesio metu
+            prior = self._exposure_prior()
+            capture_attempts = []
+
+            def on_focus_sample(pos, img, res):
+                # Fokuso paieškos kadrai išsaugomi ir naudojami M² kaip ir tiesiniame ėjime.
+                idx = self._idx_from_steps(pos, step_size)
+                filename = str(int(idx))
+                frame = shared_frame(img)
+                raw_path, _pgm_path = persist_frame(writer, self, raw_dir, pgm_dir, frame, filename, pos)
+                self.images_dict.put(filename, frame, backing_path=raw_path)
+                self._add_measurement_record(measurements, idx, res, z_steps=pos, exposure_us=exposures.get(int(pos)))
+                self._update_online_m2(online_m2, idx, res)
+
+            if self._triggered_capture_enabled():
+                triggered = TriggeredCapture(session, self.axis_service, axis_no=0).start()
+
+            def capture_focus(pos):
+                fn = lambda p: self._capture_for_scan(p, exposures, prior, preset=True, attempts=capture_attempts)
+                return triggered.capture(pos, fn) if triggered is not None else fn(pos)
+
+            focus_steps = find_focus_adaptive(
+                axis_service=triggered if triggered is not None else self.axis_service,
+                capture_fn=capture_focus,
+                beam_fn=lambda img: beam_size_k4_fixed_axes(img, pixel_size_um=3.75, k=4.0),
+                axis_no=0,
+                max_position=max_length,
+                step_size=step_size,
+                stop_event=self.stop_event,
+                on_sample=on_focus_sample,
+                home=False,
+            )
 
-            while current <= max_length and not self.stop_event.is_set():
-                if time1 is None:
-                    time1 = time.time()
-
-                self._axis_go_to(axis_no=0, pos_steps=current)
-                idx = self._idx_from_steps(current, step_size)
-
-                img, res = self.capture_save_measure(current, idx, raw_dir, pgm_dir)
-                if res is None:
-                    current += step_size
-                    continue
-
-                self._add_measurement_record(measurements, idx, res)
-
-                area = float(res.Dx_mm) * float(res.Dy_mm)
-                if prev_area is not None and area > prev_area:
-                    inc_count += 1
-                else:
-                    inc_count = 0
-                prev_area = area
-
-                if inc_count >= 5:
-                    focus_mm = float(current) / float(step_size)
-                    max_mm = float(max_length) / float(step_size)
-
-                    raw_track = generate_track_by_focus(focus_mm, max_mm, 1.0)
-                    track_positions = track_to_step_positions(
-                        track=raw_track,
-                        steps_per_mm=step_size,
-                        max_steps=max_length
-                    )
-
-                    if DEBUG_TRACK:
-                        print("=== TRACK DEBUG ===")
-                        print("focus_mm:", focus_mm, "max_mm:", max_mm)
-                        print("raw_track sample:", raw_track[:10] if raw_track else raw_track)
-                        print("track_positions sample:", track_positions[:10] if track_positions else track_positions)
-                        print("===================")
-
-                    prune_everything(
-                        track_positions=track_positions,
-                        step_size=step_size,
-                        raw_dir=raw_dir,
-                        pgm_dir=pgm_dir,
-                        images_dict=self.images_dict,
-                        measurements=measurements
-                    )
-
-                    start_i = bisect.bisect_right(track_positions, current)
-                    measured_idx = {m["idx"] for m in measurements}
-
-                    for x in track_positions[start_i:]:
-                        if self.stop_event.is_set():
-                            break
-
-                        idx2 = self._idx_from_steps(x, step_size)
-                        if idx2 in measured_idx:
-                            continue
-
-                        self._axis_go_to(axis_no=0, pos_steps=x)
-                        _img2, res2 = self.capture_save_measure(x, idx2, raw_dir, pgm_dir)
-                        if res2 is None:
-                            continue
+            if focus_steps is not None and not self.stop_event.is_set():
+                focus_mm = float(focus_steps) / float(step_size)
+                max_mm = float(max_length) / float(step_size)
 
-                        self._add_measurement_record(measurements, idx2, res2)
-                        measured_idx.add(idx2)
+                raw_track = generate_track_by_focus(focus_mm, max_mm, 1.0)
+                track_positions = track_to_step_positions(
+                    track=raw_track,
+                    steps_per_mm=step_size,
+                    max_steps=max_length
+                )
 
-                    self.stop_event.set()
-                    break
+                if DEBUG_TRACK:
+                    print("=== TRACK DEBUG ===")
+                    print("focus_mm:", focus_mm, "max_mm:", max_mm)
+                    print("raw_track sample:", raw_track[:10] if raw_track else raw_track)
+                    print("track_positions sample:", track_positions[:10] if track_positions else track_positions)
+                    print("===================")
+
+                # prune trina failus iš disko -> pirma turi būti įrašyti visi eilėje esantys kadrai
+                writer.flush()
+                prune_everything(
+                    track_positions=track_positions,
+                    step_size=step_size,
+                    raw_dir=raw_dir,
+                    pgm_dir=pgm_dir,
+                    images_dict=self.images_dict,
+                    measurements=measurements
+                )
+                # Fokuso taškai, kurių nebeliko, neturi lemti early stop ir preliminaraus M².
+                online_m2.rebuild(
+                    [m["z_mm"] for m in measurements],
+                    [m["dx_mm"] for m in measurements],
+                    [m["dy_mm"] for m in measurements],
+                )
 
-                current += step_size
+                measured_idx = {m["idx"] for m in measurements}
+                todo = [x for x in track_positions if self._idx_from_steps(x, step_size) not in measured_idx]
+
+                def on_track_result(_i, x, res2):
+                    idx2 = self._idx_from_steps(x, step_size)
+                    self._add_measurement_record(measurements, idx2, res2, z_steps=x, exposure_us=exposures.get(int(x)))
+                    if self._update_online_m2(online_m2, idx2, res2) and early_stop:
+                        print(f"M² converged after {len(online_m2)} points, stopping scan early")
+                        return True
+                    return False
+
+                # Kolerio rodmenys (TCr r) išsiunčiami tame pačiame pakete kaip judesys.
+                cooler = CoolerData(self.axis_service.controller)
+                cooler_query = [AxisControllerCommands.get_cooler_data()]
+
+                # Kitas judesys iškart po kadro; išsaugojimas ir analizė worker thread'uose.
+                def move_track(x):
+                    self._preset_exposure(prior, x)
+                    if triggered is not None:
+                        replies = triggered.move(x, queries=cooler_query)
+                    else:
+                        replies = self.axis_service.go_to(0, int(x), queries=cooler_query)
+                    try:
+                        df = cooler.dataframe_from_response(replies[0] if replies else None)
+                        if len(df):
+                            cooler_rows[int(x)] = dict(df.to_dict(orient="records")[0], z_steps=int(x))
+                    except Exception:
+                        pass
 
+                def capture_track(x):
+                    fn = lambda p: self._capture_for_scan(p, exposures, prior, attempts=capture_attempts)
+                    return triggered.capture(x, fn) if triggered is not None else fn(x)
+
+                PipelinedScanExecutor(
+                    move_fn=move_track,
+                    capture_fn=capture_track,
+                    process_fn=lambda _i, x, img: self.save_measure(
+                        img, x, self._idx_from_steps(x, step_size), raw_dir, pgm_dir, writer
+                    ),
+                    stop_flag=self.stop_event.is_set,
+                ).run(todo, on_result=on_track_result)
+
+            if triggered is not None:
+                triggered.stop()
+                triggered = None
+
+            # Fokuso paieška eina ne iš eilės -> įrašai pagal z.
+            measurements.sort(key=lambda m: m["idx"])
+
+            stats = writer.close()
+            print(f"Frame writer: {int(stats['frames'])} frames, {int(stats['batches'])} batches, "
+                  f"blocked {stats['blocked_s']:.2f} s, write {stats['write_s']:.2f} s")
+            self._write_run_container(
+                folder_name, measurements,
+                [cooler_rows[int(m["z_steps"])] for m in measurements
+                 if m.get("z_steps") is not None and int(m["z_steps"]) in cooler_rows],
+            )
+            self._save_exposure_prior(prior, folder_name, capture_attempts)
+            self._create_gif_background(folder_name, measurements)
 
             if len(measurements) < 8:
                 ui_call(self.camera_label, lambda: self._ui_status("Stopped / not enough points for M²"))
@@ -890,6 +1131,12 @@ class CameraWorker:
             ui_call(self.camera_label, lambda: messagebox.showerror("Error", f"The process has failed: {err}"))
 
         finally:
+            if triggered is not None:
+                triggered.stop()
+            if writer is not None:
+                writer.close()
+            if session is not None:
+                session.stop()
             self.process_running = False
             ui_call(self.camera_label, lambda: self._ui_buttons_running(False))
 
@@ -990,8 +1237,9 @@ class CameraWorker:
                 base_name = f"{filename}_{i}"
                 i += 1
 
-            self.images_dict[base_name] = img.copy()
-            _save_data(self, self.manual_raw_dir, self.manual_pgm_dir, img, base_name, 0, 0)
+            frame = shared_frame(img)
+            raw_path, _pgm_path = _save_data(self, self.manual_raw_dir, self.manual_pgm_dir, frame, base_name, 0, 0)
+            self.images_dict.put(base_name, frame, backing_path=raw_path)
 
             messagebox.showinfo("Photo saved", f"Nuotrauka išsaugota:\nManual_Photos/{base_name}")
 
@@ -1001,6 +1249,7 @@ class CameraWorker:
 
     def save_data(self):
         try:
+            self.wait_for_gif()
             has_gif = self.gif_path is not None
             has_fig = self.measurement_figure is not None
 